@@ -6,6 +6,7 @@ import time
 import os
 
 from Peach.agent import Monitor
+from Peach.Utilities.crashfolder import CrashFolder
 
 
 class LinuxApport(Monitor):
@@ -27,36 +28,100 @@ class LinuxApport(Monitor):
         else:
             self.Apport = "/usr/share/apport/apport"
 
+        if 'WaitTime' in args:
+            self.waitTime = float(str(args['WaitTime']).replace("'''", ""))
+        else:
+            self.waitTime = 0.0
+
+        if 'ApportTimeout' in args:
+            self.apportTimeout = float(str(args['ApportTimeout']).replace("'''", ""))
+        else:
+            self.apportTimeout = 5.0
+
         self._name = "LinuxApport"
 
         self.data = None
-        self.startingFiles = None
+        #: True if the report in data was written before this test case started
+        self.late = False
+        self._testStarted = None
+        #: Reports crash files as soon as apport wrote them
+        self._crashFolder = CrashFolder(self.logFolder)
 
     def OnTestStarting(self):
-        self.startingFiles = os.listdir(self.logFolder)
+        self._testStarted = time.time()
 
     def GetMonitorData(self):
         if not self.data:
             return None
-        return {"LinuxApport.txt": self.data}
+        data = {"LinuxApport.txt": self.data}
+        if self.late:
+            data["LinuxApport_Late.txt"] = "This crash report was written before the test case started, " \
+                                           "it most likely belongs to an earlier test case."
+        return data
+
+    def _apportRunning(self):
+        """
+        Is apport busy writing a report?  The kernel starts it when a
+        process dumps core, so this tells us a report is on its way.
+        """
+
+        name = os.path.basename(self.Apport).encode()
+        try:
+            pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+        except OSError:
+            return False
+
+        for pid in pids:
+            try:
+                with open("/proc/%s/cmdline" % pid, "rb") as fd:
+                    argv = fd.read().split(b"\0")
+            except (IOError, OSError):
+                continue
+            # apport is a script, so look at the interpreter's arguments too
+            if name in [os.path.basename(arg) for arg in argv[:2]]:
+                return True
+
+        return False
+
+    def _newReport(self, timeout):
+        for f in self._crashFolder.newFiles(timeout):
+            if f.endswith(".crash") and (self.processName is None or f.find(self.processName) > -1):
+                return f
+        return None
 
     def DetectedFault(self):
         try:
-            time.sleep(0.25)
-            time.sleep(0.25)
             self.data = None
-            for f in os.listdir(self.logFolder):
-                if f not in self.startingFiles and f.endswith(".crash") and \
-                   (self.processName is None or f.find(self.processName) > -1):
-                    fd = open(os.path.join(self.logFolder, f), "rb")
-                    self.data = fd.read()
-                    fd.close()
-                    os.unlink(os.path.join(self.logFolder, f))
-                    return True
-            return False
+            self.late = False
+            # Clean iterations do not wait, unless WaitTime asks for it.  Reports
+            # being written are waited for by the crash folder, and while apport
+            # runs we give it up to ApportTimeout to create the report.
+            deadline = time.time() + self.waitTime
+            waitedForApport = False
+            while True:
+                f = self._newReport(max(deadline - time.time(), 0))
+                if f is not None:
+                    break
+                if time.time() < deadline:
+                    continue
+                if waitedForApport or not self._apportRunning():
+                    return False
+                waitedForApport = True
+                deadline = time.time() + self.apportTimeout
+
+            path = os.path.join(self.logFolder, f)
+            self.late = self._testStarted is not None and os.path.getmtime(path) < self._testStarted
+            fd = open(path, "rb")
+            self.data = fd.read()
+            fd.close()
+            os.unlink(path)
+            return True
         except:
             print(sys.exc_info())
         return False
 
+    def OnShutdown(self):
+        self._crashFolder.close()
+
     def StopRun(self):
         return False
@@ -5,9 +5,16 @@ import sys
 import threading
 import os
 import re
+import time
+import struct
 import socket
+import logging
+import collections
 
 from Peach.agent import Monitor
+from Peach.publisher import waitForData
+from Peach.Engine.common import PeachException
+from Peach.Utilities.common import getStringAttribute, getFloatAttribute
 
 
 try:
@@ -27,9 +34,155 @@ except:
     pass
 
 
+def _icmpChecksum(data):
+    if len(data) % 2:
+        data += "\0"
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class LivenessProbe(object):
+    """
+    Checks from within Peach whether a host is alive, waiting at most
+    timeout seconds for an answer.
+
+    icmp sends an echo request from an unprivileged ICMP datagram socket
+    where the system allows it (net.ipv4.ping_group_range on Linux), or
+    else from a raw socket.  tcp connects to port.  udp sends a datagram
+    to an echo service at port and waits for any answer.
+    """
+
+    METHODS = ("icmp", "tcp", "udp")
+
+    ICMP_ECHO_REPLY = 0
+    ICMP_ECHO_REQUEST = 8
+
+    def __init__(self, host, method="icmp", port=None, timeout=0.5):
+        """
+        @type	host: str
+        @param	host: Hostname or address to probe
+        @type	method: str
+        @param	method: One of L{METHODS}
+        @type	port: int
+        @param	port: Port for tcp and udp
+        @type	timeout: float
+        @param	timeout: Seconds to wait for an answer
+        """
+        if method not in self.METHODS:
+            raise PeachException("Unknown probe method '%s', use one of: %s" % (method, ", ".join(self.METHODS)))
+        if method != "icmp" and port is None:
+            raise PeachException("Probe method '%s' needs a port." % method)
+
+        self.host = host
+        self.method = method
+        self.port = port
+        self.timeout = timeout
+        self._ident = os.getpid() & 0xffff
+        self._sequence = 0
+
+    def available(self):
+        """
+        @rtype: bool
+        @return: False if we may not open the socket this method needs
+        """
+
+        if self.method != "icmp":
+            return True
+        try:
+            self._icmpSocket()[0].close()
+            return True
+        except socket.error:
+            return False
+
+    def probe(self):
+        """
+        @rtype: bool
+        @return: True if the host answered in time
+        """
+
+        try:
+            return getattr(self, "_" + self.method)()
+        except socket.error:
+            return False
+
+    @staticmethod
+    def _icmpSocket():
+        error = None
+        for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                return socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP), kind == socket.SOCK_RAW
+            except socket.error as e:
+                error = e
+        raise error
+
+    def _icmp(self):
+        address = socket.gethostbyname(self.host)
+        sock, raw = self._icmpSocket()
+        try:
+            self._sequence = (self._sequence + 1) & 0xffff
+            payload = "Peach liveness probe"
+            header = struct.pack("!BBHHH", self.ICMP_ECHO_REQUEST, 0, 0, self._ident, self._sequence)
+            checksum = _icmpChecksum(header + payload)
+            sock.sendto(header[:2] + struct.pack("!H", checksum) + header[4:] + payload, (address, 0))
+
+            deadline = time.time() + self.timeout
+            while waitForData(sock, max(deadline - time.time(), 0)):
+                data, peer = sock.recvfrom(1024)
+                if raw:
+                    # Raw sockets get the IP header too, and every ICMP packet
+                    data = data[(ord(data[0]) & 0x0f) * 4:]
+                if len(data) < 8 or peer[0] != address:
+                    continue
+                kind, _, _, ident, sequence = struct.unpack("!BBHHH", data[:8])
+                # Datagram sockets get their own identifier from the kernel
+                if kind == self.ICMP_ECHO_REPLY and sequence == self._sequence and (not raw or ident == self._ident):
+                    return True
+            return False
+        finally:
+            sock.close()
+
+    def _tcp(self):
+        family, kind, proto, _, address = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            return True
+        finally:
+            sock.close()
+
+    def _udp(self):
+        family, kind, proto, _, address = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, kind, proto)
+        try:
+            # Connected, so an ICMP port unreachable fails recv()
+            sock.connect(address)
+            sock.send("Peach liveness probe")
+            if not waitForData(sock, self.timeout):
+                return False
+            sock.recv(65535)
+            return True
+        finally:
+            sock.close()
+
+
 class PingMonitor(Monitor):
     """
     This monitor will report a fault if it cannot ping the specified hostname.
+
+    Probes are sent from within Peach, see L{LivenessProbe}.  Parameters:
+
+      - hostname: Host to probe
+      - Method: icmp (default), tcp or udp
+      - Port: Port for tcp and udp
+      - Timeout: Seconds to wait for each answer (default 0.5)
+      - Retries: Probes to send after a failed one before reporting a fault (default 2)
+      - Interval: If set, probe every so many seconds from a thread and
+        have DetectedFault only report what the thread found
+
+    If no ICMP socket can be opened the ping command is run instead.
     """
 
     def __init__(self, args):
@@ -42,10 +195,38 @@ class PingMonitor(Monitor):
         self.hostname = str(args['hostname']).replace("'''", "")
         self._name = "PingMonitor"
 
-    def DetectedFault(self):
-        """
-        Check if a fault was detected.
-        """
+        port = getStringAttribute(args, "Port")
+        self._probe = LivenessProbe(self.hostname, getStringAttribute(args, "Method", "icmp").lower(),
+                                    int(port) if port else None, getFloatAttribute(args, "Timeout", "0.5"))
+        if not self._probe.available():
+            logging.warning("PingMonitor: Can not open an ICMP socket, running the ping command instead.")
+            self._probe = None
+        self.retries = int(getStringAttribute(args, "Retries", "2"))
+        self.interval = getFloatAttribute(args, "Interval", "0")
+
+        self._thread = None
+        if self.interval > 0:
+            self._failed = threading.Event()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._probeLoop)
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def _probeLoop(self):
+        while not self._stop.isSet():
+            if not self._isAlive():
+                self._failed.set()
+            self._stop.wait(self.interval)
+
+    def _isAlive(self):
+        if self._probe is None:
+            return self._pingCommand()
+        for _ in range(self.retries + 1):
+            if self._probe.probe():
+                return True
+        return False
+
+    def _pingCommand(self):
         if sys.platform == "win32":
             ping_send_command = "ping -n 2 "
             ping_send_command3 = "ping -n 3 "
@@ -61,15 +242,33 @@ class PingMonitor(Monitor):
         buff = pipe.read()
         pipe.close()
         if re.compile(ping_reply_regex, re.M).search(buff) is not None:
-            return False
+            return True
         # If we didn't see a ping, let's try again with 3 pings just to make
         # sure.
         pipe = os.popen(ping_send_command3 + self.hostname)
         buff = pipe.read()
         pipe.close()
         if re.compile(ping_reply_regex, re.M).search(buff) is not None:
-            return False
-        return True
+            return True
+        return False
+
+    def OnTestStarting(self):
+        if self._thread is not None:
+            self._failed.clear()
+
+    def DetectedFault(self):
+        """
+        Check if a fault was detected.
+        """
+        if self._thread is not None:
+            return self._failed.isSet()
+        return not self._isAlive()
+
+    def OnShutdown(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
 
 
 class UdpThread(threading.Thread):
@@ -141,38 +340,100 @@ class UdpMonitor(Monitor):
 
 
 class PcapThread(threading.Thread):
-    def __init__(self, parent, device, filter, pcapFile):
+    """
+    Captures packets for the whole run into a ring buffer of at most
+    ringSize bytes.  Every packet is tagged with the iteration it was
+    captured in, see L{PcapMonitor.OnTestStarting}.
+    """
+
+    def __init__(self, parent, device, filter, ringSize):
         threading.Thread.__init__(self)
         threading.Thread.setDaemon(self, True)
+        self._parent = parent
         self._device = device
         self._filter = filter
-        self._pcapFile = pcapFile
+        self._ringSize = ringSize
         self.stopEvent = threading.Event()
         self.stopEvent.clear()
-        self.dumpClosed = threading.Event()
-        self.dumpClosed.clear()
-        self._packets = []
+        #: Set after every pass of the capture loop
+        self.passed = threading.Event()
+        #: (iteration, timestamp, packet) oldest first
+        self._packets = collections.deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.linkType = 1  # DLT_EN10MB
+        self.snapLen = 65535
 
     def run(self):
         print("PcapThread(): Starting up pcap")
         pc = pcap.pcap(self._device)
-        pc.dumpopen(self._pcapFile)
-        if self._filter is not None:
+        if self._filter:
             pc.setfilter(self._filter)
         pc.setnonblock()
+        try:
+            self.linkType = pc.datalink()
+            self.snapLen = pc.snaplen
+        except AttributeError:
+            pass
+        try:
+            fd = pc.fileno()
+        except AttributeError:
+            fd = None
         print("PcapThread(): Packet capture loop")
         while not self.stopEvent.isSet():
-            # Do not remove print. For some reason packets are only captures
-            # when it's there!!!
-            print(".")
-            pc.readpkts()
-        pc.dumpclose()
-        self.dumpClosed.set()
+            if fd is None:
+                time.sleep(0.01)
+            else:
+                waitForData(fd, 0.1)
+            packets = pc.readpkts()
+            if packets:
+                self._store(packets)
+            self.passed.set()
+
+    def _store(self, packets):
+        iteration = self._parent.iteration
+        with self._lock:
+            for timestamp, packet in packets:
+                self._packets.append((iteration, timestamp, packet))
+                self._size += len(packet)
+            while self._size > self._ringSize and len(self._packets) > 1:
+                self._size -= len(self._packets.popleft()[2])
+
+    def extract(self, firstIteration):
+        """
+        Get the packets captured since firstIteration started as the
+        contents of a pcap file.
+
+        @type	firstIteration: int
+        @param	firstIteration: First iteration to include
+        @rtype: str
+        @return: pcap file
+        """
+
+        # Let the capture loop pick up packets still in the kernel
+        self.passed.clear()
+        self.passed.wait(0.5)
+
+        with self._lock:
+            packets = [(timestamp, packet) for iteration, timestamp, packet in self._packets
+                       if iteration >= firstIteration]
+
+        out = [struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, self.snapLen, self.linkType)]
+        for timestamp, packet in packets:
+            seconds = int(timestamp)
+            out.append(struct.pack("<IIII", seconds, int((timestamp - seconds) * 1000000), len(packet), len(packet)))
+            out.append(packet)
+        return "".join(out)
 
 
 class PcapMonitor(Monitor):
     """
     Monitor network using pcap library.
+
+    One capture runs for the whole run and keeps the last RingSize
+    megabytes (default 16) of packets in memory.  On a fault the
+    packets of the last Iterations test cases (default 2) are returned
+    as Capture.pcap, otherwise nothing is written anywhere.
     """
 
     def __init__(self, args):
@@ -183,34 +444,26 @@ class PcapMonitor(Monitor):
         except:
             self.device = pcap.getDefaultName()
         self.filter = str(args['filter']).replace("'''", "")
-        self.data = None
-        self.tempFile = os.tmpnam()
+        self.ringSize = int(getFloatAttribute(args, "RingSize", "16") * 1024 * 1024)
+        self.window = int(getStringAttribute(args, "Iterations", "2"))
+        #: Number of the current test case, packets are tagged with it
+        self.iteration = 0
         self.thread = None
 
     def OnTestStarting(self):
-        self.thread = PcapThread(self, self.device, self.filter, self.tempFile)
-        self.thread.start()
-        self.data = None
-        print("PcapMonitor: OnTestStarting done")
-
-    def OnTestFinished(self):
-        # Stop thread
-        self.data = None
-        if self.thread is not None and self.thread.isAlive():
-            self.thread.stopEvent.set()
-            self.thread.join()
-            self.thread.dumpClosed.wait()
-            # Read dump
-            f = open(self.tempFile, "rb")
-            self.data = f.read()
-            f.close()
-            print("PcapMonitor: Thread joined, dump saved")
-        self.thread = None
+        self.iteration += 1
+        if self.thread is None:
+            self.thread = PcapThread(self, self.device, self.filter, self.ringSize)
+            self.thread.start()
+            print("PcapMonitor: Capture started")
 
     def GetMonitorData(self):
-        return {'Capture.pcap': self.data}
+        if self.thread is None:
+            return {'Capture.pcap': None}
+        return {'Capture.pcap': self.thread.extract(self.iteration - self.window + 1)}
 
     def OnShutdown(self):
         if self.thread is not None and self.thread.isAlive():
             self.thread.stopEvent.set()
             self.thread.join()
+        self.thread = None
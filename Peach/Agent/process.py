@@ -6,14 +6,19 @@ import re
 import sys
 import time
 import json
+import errno
 import shlex
+import fcntl
+import struct
 import signal
+import hashlib
+import tempfile
 import threading
 try:
     import Queue
 except ImportError:
     import queue
-from subprocess import Popen, STDOUT, PIPE, check_output
+from subprocess import Popen, STDOUT, PIPE, CalledProcessError, check_output
 
 try:
     # Todo: Test monitors on Windows and check Python 3 compatibility with PyWin32
@@ -27,8 +32,11 @@ except:
         print("Warning: PyWin32 extensions not found, disabling various process monitors.")
 
 from Peach.agent import Monitor, MonitorDebug
+from Peach.publisher import waitForData
 from Peach.Engine.common import PeachException
 from Peach.Utilities.common import *
+from Peach.Utilities.crashfolder import CrashFolder
+from Peach.Utilities.stackhash import stackBucket
 
 
 class PageHeap(Monitor):
@@ -462,6 +470,7 @@ class ProcessID(Monitor):
         self.gdb_cmd_batch = getStringAttribute(args, "GDBCommands")
         self.print_subprocess_output = getBooleanAttribute(args, "PrintSubprocessOutput")
         self.lookout_time = getFloatAttribute(args, "LookoutTime", "5.0")
+        self.stack_frames = int(getStringAttribute(args, "StackFrames", "5"))
 
         self.system_report_path = getStringAttribute(args, 'LogFolder')
         if self.system_report_path and not os.path.isdir(self.system_report_path):
@@ -475,6 +484,11 @@ class ProcessID(Monitor):
                     if e.errno != 17:
                         raise
 
+        #: Reports crash reports and core dumps as soon as they are written
+        self._crash_folder = None
+        if self.system_report_path and os.path.isdir(self.system_report_path):
+            self._crash_folder = CrashFolder(self.system_report_path)
+
         self.pid = self.process = None
         self.console_log = self.crash_trace = []
         self.failure = False
@@ -546,17 +560,17 @@ class ProcessID(Monitor):
             self.failure = True
         time.sleep(self.heartbeat)
 
-    def _from_core_dump(self, log_folder):
-        core_filename = os.path.join(log_folder, 'core.%s' % str(self.pid))
-        if os.path.exists(core_filename):
+    def _from_core_dump(self, log_folder, fnames):
+        if 'core.%s' % str(self.pid) in fnames:
+            core_filename = os.path.join(log_folder, 'core.%s' % str(self.pid))
             gdb_args = ["gdb", "-n", "-batch", "-x", self.gdb_cmd_batch, self.command, core_filename]
             gdb_output = check_output(gdb_args, stdin=None, stderr=STDOUT, close_fds=isPosix())
             os.remove(core_filename)
             return gdb_output
 
-    def _from_crash_reporter(self, log_folder):
+    def _from_crash_reporter(self, log_folder, fnames):
         report = ""
-        for fname in os.listdir(log_folder):
+        for fname in fnames:
             if not fname.endswith(".crash"):
                 continue
             with open(os.path.join(log_folder, fname)) as fd:
@@ -572,18 +586,25 @@ class ProcessID(Monitor):
         return report
 
     def get_crash_report(self, log_folder):
-        if not os.path.isdir(log_folder):
+        """Wait up to LookoutTime for the crash report of our process to be written."""
+        if self._crash_folder is None:
+            time.sleep(self.lookout_time)
             return ""
-        if isMacOS():
-            return self._from_crash_reporter(log_folder)
-        if isLinux():
-            return self._from_core_dump(log_folder)
+        deadline = time.time() + self.lookout_time
+        while True:
+            fnames = self._crash_folder.newFiles(max(deadline - time.time(), 0))
+            report = ""
+            if isMacOS():
+                report = self._from_crash_reporter(log_folder, fnames)
+            if isLinux():
+                report = self._from_core_dump(log_folder, fnames)
+            if report or time.time() >= deadline:
+                return report
 
     def DetectedFault(self):
         return self.failure
 
     def GetMonitorData(self):
-        time.sleep(self.lookout_time)
         sytem_crash_report = self.get_crash_report(self.system_report_path)
         bucket = {}
 
@@ -619,6 +640,9 @@ class ProcessID(Monitor):
             }
             bucket["meta.txt"] = json.dumps(dict(meta))
             bucket["Bucket"] = os.path.basename(self.command)
+            stack = stackBucket("".join(self.crash_trace) or sytem_crash_report or "", self.stack_frames)
+            if stack:
+                bucket["Bucket"] = os.path.join(bucket["Bucket"], stack)
             return bucket
 
     def OnFault(self):
@@ -626,6 +650,8 @@ class ProcessID(Monitor):
 
     def OnShutdown(self):
         self._StopProcess()
+        if self._crash_folder is not None:
+            self._crash_folder.close()
 
     def _StopProcess(self):
         self.failure = False
@@ -641,6 +667,265 @@ class ProcessID(Monitor):
         self.process = None
 
 
+class _ForkServerExited(Exception):
+    pass
+
+
+class ForkServer(Monitor):
+    """
+    Runs a dynamically linked Linux target once per test case by forking
+    it from a fork server instead of starting it anew.
+
+    A shim loaded with LD_PRELOAD (Peach/Utilities/ForkServer) stops the
+    target right before main(), after exec, dynamic linking and all
+    constructors, and forks a child running main() for each test case.
+    The wait status of the child comes back over a pipe the moment it
+    exits, so a test case costs a fork() instead of a process start and
+    nothing waits for a fixed time.
+
+    The test case runs on the StartOnCall publisher call, or else once the
+    test case finished.  %d in Arguments is replaced by the number of the
+    test case counting from 0, the same as in FilePerIteration file names.
+    The shim is built with cc unless Shim points to a built one.
+    """
+
+    SHIM_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utilities", "ForkServer",
+                               "forkserver.c")
+    CONTROL_FD = 198
+    STATUS_FD = 199
+    HELLO = 0x50454143
+
+    crashSignals = [
+        # POSIX.1-1990 signals
+        signal.SIGILL,
+        signal.SIGABRT,
+        signal.SIGFPE,
+        signal.SIGSEGV,
+        # SUSv2 / POSIX.1-2001 signals
+        signal.SIGBUS,
+        signal.SIGSYS,
+        signal.SIGTRAP,
+    ]
+
+    def __init__(self, args):
+        Monitor.__init__(self, args)
+        self._name = "ForkServer"
+
+        self.command = getStringAttribute(args, "Command")
+        if not self.command:
+            raise ValueError("Command not provided or empty in %s" % __file__)
+        self.arguments = shlex.split(getStringAttribute(args, "Arguments"))
+
+        self.process_environment = getStringAttribute(args, "Environment")
+        if self.process_environment:
+            os.environ.update(dict([p.split("=") for p in self.process_environment.split("|")]))
+
+        self.start_on_call = getStringAttribute(args, "StartOnCall") or None
+        self.timeout = getFloatAttribute(args, "Timeout", "5.0")
+        self.fault_on_timeout = getBooleanAttribute(args, "FaultOnTimeout")
+        self.stack_frames = int(getStringAttribute(args, "StackFrames", "5"))
+        self.shim = getStringAttribute(args, "Shim") or self._BuildShim()
+
+        self.server = None
+        self._control = self._status = None
+        # Output of the target, O_APPEND so children never overwrite each other
+        fd, path = tempfile.mkstemp(prefix="peach-forkserver-")
+        os.unlink(path)
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_APPEND)
+        self._log = fd
+
+        self.iteration = -1
+        self.status = None
+        self.output = ""
+        self.timed_out = False
+        self.server_exited = False
+        self.failure = False
+
+    @classmethod
+    def _BuildShim(cls):
+        with open(cls.SHIM_SOURCE, "rb") as fd:
+            source = fd.read()
+
+        directory = os.path.join(os.path.expanduser("~"), ".peach", "forkserver")
+        path = os.path.join(directory, "forkserver-%s.so" % hashlib.sha1(source).hexdigest()[:12])
+        if os.path.exists(path):
+            return path
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        temp = "%s.%d" % (path, os.getpid())
+        try:
+            check_output([os.environ.get("CC", "cc"), "-shared", "-fPIC", "-O2", "-o", temp, cls.SHIM_SOURCE,
+                          "-ldl"], stderr=STDOUT)
+        except (OSError, CalledProcessError) as e:
+            raise PeachException("Building the fork server shim failed: %s" % getattr(e, "output", e))
+        os.rename(temp, path)
+        return path
+
+    def _IsRunning(self):
+        return self.server is not None and self.server.poll() is None
+
+    def _StartServer(self):
+        MonitorDebug(self._name, "_StartServer")
+        control_r, self._control = os.pipe()
+        self._status, status_w = os.pipe()
+
+        env = dict(os.environ)
+        env["LD_PRELOAD"] = " ".join(filter(None, [self.shim, env.get("LD_PRELOAD")]))
+        env["PEACH_FORKSERVER"] = "1"
+        # ASan wants to be first in the library list, but so does the shim
+        env["ASAN_OPTIONS"] = ":".join(filter(None, [env.get("ASAN_OPTIONS"), "verify_asan_link_order=0"]))
+
+        def setup():
+            os.dup2(control_r, self.CONTROL_FD)
+            os.dup2(status_w, self.STATUS_FD)
+            for fd in (control_r, status_w, self._control, self._status):
+                os.close(fd)
+
+        print("Command: {}".format([self.command] + self.arguments))
+        with open(os.devnull, "rb") as devnull:
+            self.server = Popen([self.command] + self.arguments, env=env, stdin=devnull, stdout=self._log,
+                                stderr=STDOUT, close_fds=False, preexec_fn=setup)
+        os.close(control_r)
+        os.close(status_w)
+
+        try:
+            hello = self._ReadWord(10.0)
+        except _ForkServerExited:
+            hello = None
+        if hello != self.HELLO:
+            self._StopServer()
+            raise PeachException("Fork server did not start, is %s a dynamically linked program?" % self.command)
+
+    def _StopServer(self):
+        if self._control is not None:
+            # The server exits once it reads EOF
+            os.close(self._control)
+            self._control = None
+        if self._status is not None:
+            os.close(self._status)
+            self._status = None
+        if self._IsRunning():
+            try:
+                self.server.kill()
+            except OSError:
+                pass
+        if self.server is not None:
+            self.server.wait()
+            self.server = None
+
+    def _ReadWord(self, timeout):
+        """
+        Read one status word, None if none arrived within timeout.
+        """
+        data = ""
+        deadline = None if timeout is None else time.time() + timeout
+        while len(data) < 4:
+            if deadline is not None and not waitForData(self._status, max(deadline - time.time(), 0)):
+                return None
+            chunk = os.read(self._status, 4 - len(data))
+            if not chunk:
+                raise _ForkServerExited()
+            data += chunk
+        return struct.unpack("=I", data)[0]
+
+    def _RunTestCase(self):
+        MonitorDebug(self._name, "_RunTestCase")
+        self.status = None
+        self.timed_out = False
+        self.server_exited = False
+        if not self._IsRunning():
+            self._StartServer()
+        os.ftruncate(self._log, 0)
+
+        payload = "\0".join(argument.replace("%d", str(self.iteration)) for argument in self.arguments)
+        try:
+            os.write(self._control, struct.pack("=I", len(payload)) + payload)
+            pid = self._ReadWord(self.timeout)
+            if pid is None:
+                raise _ForkServerExited()
+            self.status = self._ReadWord(self.timeout)
+            if self.status is None:
+                self.timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                self.status = self._ReadWord(None)
+        except (OSError, _ForkServerExited):
+            MonitorDebug(self._name, "Fork server exited")
+            self.server_exited = True
+            self._StopServer()
+
+        os.lseek(self._log, 0, os.SEEK_SET)
+        output = []
+        while True:
+            chunk = os.read(self._log, 65536)
+            if not chunk:
+                break
+            output.append(chunk)
+        self.output = "".join(output)
+
+        if self.server_exited:
+            self.failure = True
+        elif self.timed_out:
+            self.failure = self.fault_on_timeout
+        elif os.WIFSIGNALED(self.status) and os.WTERMSIG(self.status) in self.crashSignals:
+            self.failure = True
+        elif self.output.find("ERROR: AddressSanitizer") != -1 and \
+                self.output.find("AddressSanitizer failed to allocate") == -1:
+            self.failure = True
+
+    def OnTestStarting(self):
+        self.iteration += 1
+        self.failure = False
+        self.status = None
+        self.output = ""
+        if not self._IsRunning():
+            self._StartServer()
+
+    def PublisherCall(self, method):
+        if self.start_on_call is not None and self.start_on_call == method:
+            self._RunTestCase()
+
+    def OnTestFinished(self):
+        if self.start_on_call is None:
+            self._RunTestCase()
+
+    def DetectedFault(self):
+        return self.failure
+
+    def GetMonitorData(self):
+        if not self.failure:
+            return None
+        bucket = {}
+        if self.server_exited:
+            bucket["auxdat.txt"] = "Fork server exited"
+        elif self.output.find("ERROR: AddressSanitizer") != -1:
+            bucket["auxdat.txt"] = self.output[self.output.find("ERROR: AddressSanitizer"):]
+        elif self.timed_out:
+            bucket["auxdat.txt"] = "Process timed out after %s seconds" % self.timeout
+        elif os.WIFSIGNALED(self.status):
+            bucket["auxdat.txt"] = "Process exited with signal: %d" % os.WTERMSIG(self.status)
+        if self.output:
+            bucket["stdout.txt"] = self.output
+        meta = {
+            "environ": os.environ.data,
+            "command": [self.command] + self.arguments,
+            "status": self.status
+        }
+        bucket["meta.txt"] = json.dumps(dict(meta))
+        bucket["Bucket"] = os.path.basename(self.command)
+        stack = stackBucket(self.output, self.stack_frames)
+        if stack:
+            bucket["Bucket"] = os.path.join(bucket["Bucket"], stack)
+        return bucket
+
+    def OnShutdown(self):
+        self._StopServer()
+
+
 class ASanConsoleMonitor(Monitor):
 
     def __init__(self, args):
@@ -674,6 +959,7 @@ class ASanConsoleMonitor(Monitor):
         else:
             self.start_on_call = False
 
+        self.stack_frames = int(getStringAttribute(args, "StackFrames", "5"))
         self.asan_regex = "(ERROR: AddressSanitizer:.*[Stats:|ABORTING|ERROR: Failed])"
         self.stderr = []
         self.stdout = []
@@ -771,6 +1057,9 @@ class ASanConsoleMonitor(Monitor):
         }
         bucket["meta.txt"] = json.dumps(dict(meta))
         bucket["Bucket"] = os.path.basename(self.command)
+        stack = stackBucket("".join(self.sanlog), self.stack_frames)
+        if stack:
+            bucket["Bucket"] = os.path.join(bucket["Bucket"], stack)
         return bucket
 
     def OnFault(self):
@@ -3,6 +3,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import os
 import sys
+import time
 import types
 import traceback
 
@@ -135,12 +136,78 @@ def changeDefaultEndian(endian):
     return True
 
 
-def evalEvent(code, environment, node=None):
+class EvalStatistics(object):
     """
-    Eval python code returning result.
-    code - String
-    environment - Dictionary, keys are variables to place in local scope
+    Counters for L{evalEvent}.
+    """
+
+    #: Number of expressions evaluated
+    count = 0
+    #: Total seconds spent evaluating (including compiling)
+    seconds = 0.0
+    #: Number of expressions compiled
+    compiled = 0
+
+    @staticmethod
+    def reset():
+        EvalStatistics.count = 0
+        EvalStatistics.seconds = 0.0
+        EvalStatistics.compiled = 0
+
+
+#: Compiled code and a has-nested-scopes flag by source string
+_evalCodeCache = {}
+#: Base scopes for evalEvent by id of the DOM root
+_evalScopeCache = {}
+
+
+def _evalCompile(code):
+    """
+    Compile code once, returns (code object, nested).  Nested tells if
+    the code defines functions/lambdas/generators, those look up free
+    names in the globals.
     """
+    try:
+        return _evalCodeCache[code]
+    except KeyError:
+        pass
+
+    compiled = compile(code, "<string>", "eval")
+    nested = False
+    for const in compiled.co_consts:
+        if isinstance(const, types.CodeType):
+            nested = True
+            break
+
+    # Codes come from the pit so this should not grow much, but be safe.
+    if len(_evalCodeCache) > 10000:
+        _evalCodeCache.clear()
+
+    _evalCodeCache[code] = (compiled, nested)
+    EvalStatistics.compiled += 1
+    return compiled, nested
+
+
+def _evalScope(node):
+    """
+    Base global and local scopes for evalEvent.  Imports are only looked
+    up once per DOM root and rebuilt when the root or the Holder scopes
+    change size.
+    """
+    root = None
+    if node is not None:
+        root = node.getRoot()
+
+    version = (
+        len(root) if root is not None else 0,
+        id(Holder.globals), len(Holder.globals) if Holder.globals is not None else 0,
+        id(Holder.locals), len(Holder.locals) if Holder.locals is not None else 0,
+    )
+
+    scope = _evalScopeCache.get(id(root))
+    if scope is not None and scope[0] is root and scope[1] == version:
+        return scope[2], scope[3]
+
     globalScope = {
         'Print': peachPrint,
         'peachPrint': peachPrint,
@@ -153,7 +220,7 @@ def evalEvent(code, environment, node=None):
         'ChangeDefaultEndian': changeDefaultEndian,
         'DomPrint': domPrint,
     }
-    if node is not None:
+    if root is not None:
         buildImports(node, globalScope, localScope)
     if Holder.globals is not None:
         for k in Holder.globals:
@@ -161,11 +228,36 @@ def evalEvent(code, environment, node=None):
     if Holder.locals is not None:
         for k in Holder.locals:
             localScope[k] = Holder.locals[k]
-    for k in environment.keys():
-        globalScope[k] = environment[k]
-        localScope[k] = environment[k]
+
+    # Keep root alive with the entry so its id stays ours
+    _evalScopeCache[id(root)] = (root, version, globalScope, localScope)
+    return globalScope, localScope
+
+
+def evalEvent(code, environment, node=None):
+    """
+    Eval python code returning result.
+    code - String
+    environment - Dictionary, keys are variables to place in local scope
+
+    Compiled code and the import scope of node's root are cached, see
+    L{EvalStatistics} for counters.
+    """
+    start = time.time()
     try:
-        ret = eval(code, globalScope, localScope)
+        compiled, nested = _evalCompile(code)
+        globalScope, localScope = _evalScope(node)
+
+        # Locals are ours to change (list comprehensions assign into
+        # them), globals only need a copy if nested scopes read the
+        # environment from there.
+        localScope = localScope.copy()
+        localScope.update(environment)
+        if nested and environment:
+            globalScope = globalScope.copy()
+            globalScope.update(environment)
+
+        ret = eval(compiled, globalScope, localScope)
     except:
         print("Code: [%s]" % code)
         print("Exception: %s" % sys.exc_info()[1])
@@ -173,6 +265,9 @@ def evalEvent(code, environment, node=None):
         for k in environment.keys():
             print("  [%s] = [%s]" % (k, repr(environment[k])))
         raise
+    finally:
+        EvalStatistics.count += 1
+        EvalStatistics.seconds += time.time() - start
     return ret
 
 
@@ -214,44 +309,63 @@ getch = _Getch()
 class StreamBuffer(object):
     """
     A Peach data stream.  Used when generating or cracking data.
+
+    The data is kept in a bytearray so writes, either appending or
+    overwriting, happen in place instead of rebuilding the whole
+    string each time.
     """
 
     def __init__(self, data=None):
         #: Current position
         self.pos = 0
         #: Data buffer
-        self.data = ""
+        self._data = bytearray()
         #: History of data locations
         self.positions = {}
         #: History of data length
         self.lengths = {}
 
         if data is not None:
-            self.data = data
+            self.setValue(data)
+
+    @property
+    def data(self):
+        return str(self._data)
+
+    @data.setter
+    def data(self, value):
+        self.setValue(value)
 
     def getValue(self):
         """
         Return the value created by this stream.
         """
-        return self.data
+        return str(self._data)
 
     def setValue(self, data):
         """
         Set the internal buffer.
         """
-        self.data = data
+        self._data = bytearray(self._toBytes(data))
+
+    @staticmethod
+    def _toBytes(data):
+        if isinstance(data, unicode):
+            return str(data)
+
+        return data
 
     def peek(self, size=None):
         """
         Read data with out changing position.
         """
         if size is None:
-            return self.data[self.pos:]
+            return str(self._data[self.pos:])
 
-        if self.pos + size > len(self.data):
+        if self.pos + size > len(self._data):
             raise Exception("StreamBuffer.peek(%d): Peeking passed end of buffer." % size)
 
-        return self.data[self.pos:self.pos + size]
+        return str(self._data[self.pos:self.pos + size])
 
     def read(self, size=None):
         """
@@ -262,14 +376,14 @@ class StreamBuffer(object):
         """
 
         if size is None:
-            ret = self.data[self.pos:]
-            self.pos = len(self.data)
+            ret = str(self._data[self.pos:])
+            self.pos = len(self._data)
             return ret
 
-        if self.pos + size > len(self.data):
+        if self.pos + size > len(self._data):
             raise Exception("StreamBuffer.read(%d): Reading passed end of buffer." % size)
 
-        ret = self.data[self.pos:self.pos + size]
+        ret = str(self._data[self.pos:self.pos + size])
         self.pos += size
         return ret
 
@@ -308,23 +422,16 @@ class StreamBuffer(object):
             self.storePosition(name)
             self.lengths[name] = len(data)
 
+        data = self._toBytes(data)
         dataLen = len(data)
-        ourDataLen = len(self.data)
-
-        # Replace existing data
-        if ourDataLen - self.pos > dataLen:
-            ret = self.data[:self.pos]
-            ret += data
-            ret += self.data[self.pos + dataLen:]
-            self.data = ret
 
         # Append new data
-        elif self.pos == ourDataLen:
-            self.data += data
+        if self.pos == len(self._data):
+            self._data.extend(data)
 
-        # Do both
+        # Replace existing data, expanding past the end if needed
         else:
-            self.data = self.data[:self.pos] + data
+            self._data[self.pos:self.pos + dataLen] = data
 
         # Move position
         self.pos += dataLen
@@ -333,7 +440,7 @@ class StreamBuffer(object):
         """
         Get the current size in bytes of the data stream.
         """
-        return len(self.data)
+        return len(self._data)
 
     def tell(self):
         """
@@ -366,8 +473,8 @@ class StreamBuffer(object):
             raise Exception("StreamBuffer.seekFromStart(%d) results in negative position" % pos)
 
         # Should we expand buffer?
-        if pos > len(self.data):
-            self.data += '\0' * (pos - len(self.data))
+        if pos > len(self._data):
+            self._data.extend('\0' * (pos - len(self._data)))
 
         self.pos = pos
 
@@ -380,7 +487,7 @@ class StreamBuffer(object):
               such that the position exists padded with '\0'
         """
 
-        newpos = len(self.data) + pos
+        newpos = len(self._data) + pos
         self.seekFromStart(newpos)
 
 
@@ -474,6 +581,16 @@ class ArraySetParent(object):
         self._parent = parent
         self._array = []
 
+    def _recordWrite(self):
+        """
+        Our parent's state includes this array, let it know
+        before we change.
+        """
+
+        recordWrite = getattr(self._parent, '_recordWrite', None)
+        if recordWrite is not None:
+            recordWrite()
+
     def append(self, obj):
         #if hasattr(obj, "of"):
         #	if obj.of == "Tables":
@@ -481,6 +598,7 @@ class ArraySetParent(object):
         #		print obj
         #		traceback.print_stack();
 
+        self._recordWrite()
         obj.parent = self._parent
         return self._array.append(obj)
 
@@ -488,10 +606,12 @@ class ArraySetParent(object):
         return self._array.index(obj)
 
     def insert(self, index, obj):
+        self._recordWrite()
         obj.parent = self._parent
         return self._array.insert(index, obj)
 
     def remove(self, obj):
+        self._recordWrite()
         return self._array.remove(obj)
 
     def __len__(self):
@@ -501,10 +621,12 @@ class ArraySetParent(object):
         return self._array.__getitem__(key)
 
     def __setitem__(self, key, value):
+        self._recordWrite()
         value.parent = self._parent
         return self._array.__setitem__(key, value)
 
     def __delitem__(self, key):
+        self._recordWrite()
         return self._array.__delitem__(key)
 
     def __iter__(self):
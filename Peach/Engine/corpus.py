@@ -0,0 +1,240 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import glob
+import stat
+import bisect
+import random
+import logging
+
+from Peach.Engine.common import PeachException
+
+
+class SeedCorpus(object):
+    """
+    Index of the seed files a multi-file <Data> element points to.
+
+    The folder or glob is scanned once.  After that L{refresh} only
+    looks at the directories again when their mtime changed and only
+    stats names it has not seen before, so switching seeds does not
+    cost a stat call per file.  Seeds which failed to crack are
+    remembered until the file changes, their mtimes are checked on
+    every refresh.
+
+    One index is shared by all copies of a <Data> element, see
+    L{forData}.
+    """
+
+    #: K is (folderName, fileGlob, maxFileSize), V is SeedCorpus
+    _corpora = {}
+
+    def __init__(self, folderName=None, fileGlob=None, maxFileSize=-1):
+        #: Folder of files to use
+        self.folderName = folderName
+        #: A unix style glob path
+        self.fileGlob = fileGlob
+        #: Maximum allowed size of file
+        self.maxFileSize = maxFileSize
+        #: Usable files in the order we found them
+        self.files = []
+        #: K is path, V is size in bytes
+        self.sizes = {}
+        #: K is path of a seed which failed to crack, V is its mtime then
+        self.failures = {}
+        #: K is path, V is index into files
+        self._positions = {}
+        #: K is directory, V is mtime at the last scan
+        self._mtimes = {}
+        #: Cumulative sizes of files, None if out of date
+        self._weights = None
+
+        self.refresh()
+
+    @classmethod
+    def forData(cls, data):
+        """
+        Get the index shared by all <Data> elements using the same files.
+
+        @type	data: Data
+        @param	data: Multi-file data element
+        @rtype: SeedCorpus
+        @return: index of the seed files
+        """
+
+        key = (data.folderName, data.fileGlob, data.maxFileSize)
+        corpus = cls._corpora.get(key)
+        if corpus is None:
+            corpus = cls(data.folderName, data.fileGlob, data.maxFileSize)
+            cls._corpora[key] = corpus
+        else:
+            corpus.refresh()
+
+        return corpus
+
+    def __len__(self):
+        return len(self.files)
+
+    def _directories(self):
+        if self.folderName is not None:
+            return [self.folderName]
+
+        directory = os.path.dirname(self.fileGlob) or os.curdir
+        if glob.has_magic(directory):
+            # New directories may match at any time
+            return None
+
+        return [directory]
+
+    def _listing(self):
+        if self.folderName is not None:
+            return [os.path.join(self.folderName, fname) for fname in os.listdir(self.folderName)]
+
+        return glob.glob(self.fileGlob)
+
+    def refresh(self):
+        """
+        Pick up files added to or removed from the corpus since the
+        last scan.
+
+        @rtype: bool
+        @return: True if we had to scan
+        """
+
+        directories = self._directories()
+        if directories is not None:
+            mtimes = {}
+            for directory in directories:
+                try:
+                    mtimes[directory] = os.stat(directory).st_mtime
+                except OSError:
+                    mtimes[directory] = None
+
+            if mtimes == self._mtimes:
+                # Seeds rewritten in place do not change the directory mtime
+                return self._retryFailures()
+
+            self._mtimes = mtimes
+
+        listing = self._listing()
+        present = set(listing)
+
+        for fpath in [fpath for fpath in self.files if fpath not in present]:
+            self._remove(fpath)
+
+        for fpath in [fpath for fpath in self.failures if fpath not in present]:
+            del self.failures[fpath]
+
+        for fpath in listing:
+            if fpath in self._positions:
+                continue
+
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+
+            if fpath in self.failures:
+                if self.failures[fpath] == st.st_mtime:
+                    continue
+                del self.failures[fpath]
+
+            if self._isValid(fpath, st):
+                self._add(fpath, st.st_size)
+
+        logging.debug("Seed corpus has %d files, %d failed to crack" % (len(self.files), len(self.failures)))
+        return True
+
+    def _retryFailures(self):
+        """
+        Give seeds which failed to crack another chance once they changed.
+
+        @rtype: bool
+        @return: True if any seed changed
+        """
+
+        changed = False
+        for fpath, mtime in list(self.failures.items()):
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+
+            if st.st_mtime == mtime:
+                continue
+
+            changed = True
+            del self.failures[fpath]
+            if self._isValid(fpath, st):
+                self._add(fpath, st.st_size)
+
+        return changed
+
+    def _isValid(self, fpath, st):
+        """
+        Same as L{Data.is_valid} but with the stat already done.
+        """
+
+        if not stat.S_ISREG(st.st_mode) or os.path.basename(fpath).startswith("."):
+            return False
+
+        return self.maxFileSize == -1 or st.st_size < self.maxFileSize
+
+    def _add(self, fpath, size):
+        self._positions[fpath] = len(self.files)
+        self.files.append(fpath)
+        self.sizes[fpath] = size
+        self._weights = None
+
+    def _remove(self, fpath):
+        # Move the last file into the hole so removing is O(1)
+        index = self._positions.pop(fpath)
+        last = self.files.pop()
+        if last != fpath:
+            self.files[index] = last
+            self._positions[last] = index
+
+        del self.sizes[fpath]
+        self._weights = None
+
+    def reject(self, fpath):
+        """
+        Remember fpath failed to crack.  It will not be picked again
+        unless the file changes.
+        """
+
+        if fpath not in self._positions:
+            return
+
+        self._remove(fpath)
+        try:
+            self.failures[fpath] = os.stat(fpath).st_mtime
+        except OSError:
+            self.failures[fpath] = None
+
+    def choice(self, weighted=False):
+        """
+        Pick a random file.
+
+        @type	weighted: bool
+        @param	weighted: Pick larger files more often
+        @rtype: str
+        @return: path of the file
+        """
+
+        if not self.files:
+            raise PeachException("No sample data found matching requirements of <Data> element.")
+
+        if not weighted:
+            return random.choice(self.files)
+
+        if self._weights is None:
+            self._weights = []
+            total = 0
+            for fpath in self.files:
+                # Empty files still get a chance
+                total += max(self.sizes[fpath], 1)
+                self._weights.append(total)
+
+        index = bisect.bisect_right(self._weights, random.random() * self._weights[-1])
+        return self.files[min(index, len(self.files) - 1)]
@@ -5,17 +5,17 @@ import os
 import re
 import sys
 import time
-import glob
 import base64
 import ctypes
 import struct
-import random
 import logging
 import traceback
+import types
 
 from Peach import Transformers
 from Peach.Engine.common import *
 from Peach.Engine.engine import Engine
+from Peach.Engine.corpus import SeedCorpus
 from Peach.publisher import PublisherBuffer
 
 import Peach
@@ -46,6 +46,21 @@ class Element(object):
     #: For generating unknown element names
     __CurNameNum = 0
 
+    #: TemplateOverlay this element belongs to, set on overlay instances only
+    _overlay = None
+
+    #: Active Snapshot, records changes to every element
+    _snapshot = None
+
+    #: Value from the last DataElement.getValue, None when out of date
+    _valueCache = None
+
+    #: Attributes that do not change the value of an element.  Setting
+    #: any other attribute throws away _valueCache up to the root.
+    _valueCacheAttributes = frozenset(['_valueCache', 'parent', 'fullName',
+                                       'fullNameDataModel', '_inInternalValue',
+                                       'relationStringBuffer'])
+
     def __init__(self, name = None, parent = None):
         #: Name of Element, cannot include "."s
         self._name = name
@@ -73,6 +88,7 @@ class Element(object):
     @name.setter
     def name(self, value):
         if self.parent is not None and self.parent.get(self._name) == self:
+            self.parent._recordWrite()
             del self.parent._childrenHash[self._name]
             delattr(self.parent.children, self._name)
 
@@ -84,10 +100,84 @@ class Element(object):
     def toXml(self, parent):
         pass
 
+    def __setattr__(self, name, value):
+        overlay = self._overlay
+        if overlay is not None and id(self) not in overlay.journal \
+                and self.__dict__.get(name, overlay) is not value:
+            overlay.record(self)
+
+        snapshot = Element._snapshot
+        if snapshot is not None and id(self) not in snapshot.journal:
+            snapshot.record(self)
+
+        object.__setattr__(self, name, value)
+
+        if name not in self._valueCacheAttributes:
+            parent = self.__dict__.get('parent')
+            if self._valueCache is not None or \
+                    (parent is not None and parent._valueCache is not None):
+                self._invalidateValue()
+
+    def __delattr__(self, name):
+        self._recordWrite()
+        object.__delattr__(self, name)
+
+    def _recordWrite(self):
+        """
+        Called before changing this element in place (e.g. its
+        children).  Lets a L{TemplateOverlay} or L{Snapshot} save our
+        state first and throws away cached values.
+        """
+
+        overlay = self._overlay
+        if overlay is not None and id(self) not in overlay.journal:
+            overlay.record(self)
+
+        snapshot = Element._snapshot
+        if snapshot is not None and id(self) not in snapshot.journal:
+            snapshot.record(self)
+
+        self._invalidateValue()
+
+    def _invalidateValue(self):
+        """
+        Throw away the cached value of this element and of every
+        parent.  A parent is never cached unless its children are, so
+        we can stop at the first parent without a cached value.
+        """
+
+        if self._valueCache is not None:
+            self._valueCache = None
+
+        # No parent yet while in __init__
+        node = self.__dict__.get('parent')
+        while node is not None and node._valueCache is not None:
+            node._valueCache = None
+            node = node.parent
+
+    def __getstate__(self):
+        state = self.__dict__
+        if '_overlay' in state:
+            state = state.copy()
+            del state['_overlay']
+
+        return state
+
     def __deepcopy__(self, memo):
+        """
+        Copy this element and everything below it.  The copy is
+        produced by a one-shot L{ClonePlan}, the result has no parent.
+        """
+
+        return ClonePlan(self).clone(None, memo)
+
+    def _pickleDeepCopy(self):
         """
         Copying objects in our DOM is a crazy business.  Here we
         try and help out as much as we can.
+
+        Note: This is the old pickle based copy.  It is only kept around
+          as a reference for L{pickleCopy}.
         """
 
         # Copy procedures
@@ -373,6 +463,40 @@ class Element(object):
         return True
 
     def copy(self, parent):
+        """
+        Make a copy of this element and everything below it.  The copy
+        will have parent as its parent.
+
+        If the same element is copied over and over (e.g. a template
+        for each test case) build a L{ClonePlan} once and call
+        L{ClonePlan.clone} instead.
+        """
+
+        plan = ClonePlan(self)
+        memo = {}
+        newSelf = plan.clone(parent, memo)
+
+        # Children the data cracker removed from their parent get
+        # their real parent back.  In the copy the real parent is
+        # simply the new parent.
+        for node in plan.realParentNodes:
+            node.parent = node.realParent
+            nodeCopy = memo[id(node)]
+            nodeCopy.realParent = nodeCopy.parent
+
+        if hasattr(self, 'realParent'):
+            if self.parent is None and parent is None:
+                newSelf.realParent = self.realParent
+            else:
+                newSelf.realParent = None
+
+        return newSelf
+
+    def pickleCopy(self, parent):
+        """
+        Old pickle based version of L{copy}.  Much slower, kept around
+        so L{ClonePlan} can be checked and benchmarked against it.
+        """
 
         # We need to remove realParents before we can perform
         # the copy and then replace then.
@@ -390,7 +514,7 @@ class Element(object):
 
         # Perform actual copy
 
-        newSelf = deepcopy(self)
+        newSelf = self._pickleDeepCopy()
         newSelf.parent = parent
         self._FixParents(newSelf, parent)
 
@@ -631,6 +755,8 @@ class ElementWithChildren(Element):
                 dict[child].updateFromXmlDom(child, dict)
 
     def append(self, obj):
+        self._recordWrite()
+
         # If we have the key we need to replace it
         if self._childrenHash.has_key(obj.name):
             self[obj.name] = obj
@@ -649,6 +775,8 @@ class ElementWithChildren(Element):
         return self._children.index(obj)
 
     def insert(self, index, obj):
+        self._recordWrite()
+
         if obj in self._children:
             raise Exception("object already child of element")
 
@@ -700,6 +828,8 @@ class ElementWithChildren(Element):
         return self._childrenHash.__getitem__(key)
 
     def __setitem__(self, key, value):
+        self._recordWrite()
+
         if type(key) == int:
             oldObj = self._children[key]
             if oldObj.name is not None:
@@ -726,6 +856,8 @@ class ElementWithChildren(Element):
                 setattr(self.children, value.name, value)
 
     def __delitem__(self, key):
+        self._recordWrite()
+
         if type(key) == int:
             obj = self._children[key]
             if obj.name is not None:
@@ -805,6 +937,9 @@ class DataElement(Mutatable):
         #: Does data model have an offset relation?
         self.modelHasOffsetRelation = None
 
+        #: Does data model need element positions in the StreamBuffer (offset relations)?  None if not known yet.
+        self.modelNeedsPositions = None
+
         #: Cache of relation, list of full data names (String) of each relation from here down.  cache is build post incoming.
         self.relationCache = None
 
@@ -874,31 +1009,38 @@ class DataElement(Mutatable):
         #: Fullname in data model
         self.fullNameDataModel = None
 
+    # Note: The setters below are only reached through Element.__setattr__,
+    #   which already took care of overlays and cached values, so they
+    #   write straight to __dict__.
+
     def get_DefaultValue(self):
         return self._defaultValue
     def set_DefaultValue(self, value):
-        self._defaultValue = value
-        #self._currentValue = None
-        self._value = None
-        self._finalValue = None
+        state = self.__dict__
+        state['_defaultValue'] = value
+        #state['_currentValue'] = None
+        state['_value'] = None
+        state['_finalValue'] = None
     defaultValue = property(get_DefaultValue, set_DefaultValue, None)
     def get_CurrentValue(self):
         return self._currentValue
     def set_CurrentValue(self, value):
-        self._currentValue = value
-        self._value = None
-        self._finalValue = None
+        state = self.__dict__
+        state['_currentValue'] = value
+        state['_value'] = None
+        state['_finalValue'] = None
     currentValue = property(get_CurrentValue, set_CurrentValue, None)
     def get_Value(self):
         return self._value
     def set_Value(self, value):
-        self._value = value
-        self._finalValue = None
+        state = self.__dict__
+        state['_value'] = value
+        state['_finalValue'] = None
     value = property(get_Value, set_Value, None)
     def get_FinalValue(self):
         return self._finalValue
     def set_FinalValue(self, value):
-        self._finalValue = value
+        self.__dict__['_finalValue'] = value
     finalValue = property(get_FinalValue, set_FinalValue, None)
 
     @property
@@ -1000,6 +1142,7 @@ class DataElement(Mutatable):
         obj.constraint = self.constraint
         obj.isMutable = self.isMutable
         obj.modelHasOffsetRelation = self.modelHasOffsetRelation
+        obj.modelNeedsPositions = self.modelNeedsPositions
 
         if self.relationCache is not None:
             obj.relationCache = self.relationCache[:]
@@ -1111,6 +1254,39 @@ class DataElement(Mutatable):
                 if isinstance(c, Element):
                     self._pickleRemoveInstanceMethods(c)
 
+    def _setDefaultsFromFile(self, data, buff):
+        cache = Engine.modelCache
+        pitHash = getattr(self.getRoot(), 'pitHash', None)
+        cacheKey = None
+
+        if cache is not None and pitHash is not None:
+            cacheKey = cache.key(pitHash, "%s:%s" % (self.ref, self.getFullname()), buff.view)
+            hit, crackPassed = cache.load(cacheKey, self)
+            if hit:
+                logging.info("Loaded data from '%s' into DataModel '%s' from cache" % (data.fileName, self.name))
+                return crackPassed
+
+        logging.info("Cracking data from '%s' into DataModel '%s'" % (data.fileName, self.name))
+
+        parent = self.parent
+        while parent.parent is not None:
+            parent = parent.parent
+
+        cracker = PeachModule.Engine.incoming.DataCracker(parent)
+        #cracker.haveAllData = True
+        startTime = time.time()
+        cracker.crackData(self, buff, "setDefaultValue")
+        #if mustPass and not cracker.crackPassed:
+        #	raise PeachException("Error, file did not properly parse.")
+        logging.info("Total time to crack data: %.2f" % (time.time() - startTime))
+        logging.info("Building relation cache.")
+        self.BuildRelationCache()
+
+        if cacheKey is not None:
+            cache.store(cacheKey, self, cracker.crackPassed)
+
+        return cracker.crackPassed
+
     def setDefaults(self, data, dontCrack = False, mustPass = False):
         """
         Set data elements defaultValue based on a Data object.
@@ -1121,61 +1297,11 @@ class DataElement(Mutatable):
             if dontCrack:
                 return
 
-            ## Node: We are not ready to use the .peach files yet
-            ## still problems to work out!
-
-            statPeach = None
-
-            if statPeach is not None and statPeach.st_mtime > statFile.st_mtime and statPeach.st_mtime > statPit.st_mtime:
-                # Load pre-parsed peach file
-                print("[*] Loading model for: %s" % data.fileName)
-
-                fd = open(data.fileName+".peach", "rb+")
-                data = fd.read()
-                fd.close()
-
-                model = self.unpickleModel(data)
-                model.parent = self.parent
-
-                # Remove self and insert model
-                index = self.parent.index(self)
-                del self.parent[self.name]
-                self.parent.insert(index, model)
-
-            else:
-                logging.info("Cracking data from '%s' into DataModel '%s'" % (data.fileName, self.name))
-
-                with open(data.fileName, "rb") as fp:
-                    stuff = fp.read()
-
-                buff = PublisherBuffer(None, stuff)
-
-                parent = self.parent
-                while parent.parent is not None:
-                    parent = parent.parent
-
-                cracker = PeachModule.Engine.incoming.DataCracker(parent)
-                #cracker.haveAllData = True
-                startTime = time.time()
-                cracker.crackData(self, buff, "setDefaultValue")
-                #if mustPass and not cracker.crackPassed:
-                #	raise PeachException("Error, file did not properly parse.")
-                logging.info("Total time to crack data: %.2f" % (time.time() - startTime))
-                logging.info("Building relation cache.")
-                self.BuildRelationCache()
-
-                ## Pickle model
-                ##try:
-                ##	fd = open(data.fileName + ".peach", "wb+")
-                ##	fd.write(self.pickleModel(self))
-                ##	fd.close()
-                ##except:
-                ##	try:
-                ##		os.unlink(data.fileName+".peach")
-                ##	except:
-                ##		pass
-
-            return cracker.crackPassed
+            buff = PublisherBuffer.fromFile(data.fileName)
+            try:
+                return self._setDefaultsFromFile(data, buff)
+            finally:
+                buff.close()
 
         if data.expression is not None:
 
@@ -1359,6 +1485,12 @@ class DataElement(Mutatable):
         # 1. Build list of all relations from here down
         relations = self._getAllRelationsInDataModel(self, False)
 
+        self.modelNeedsPositions = False
+        for r in relations:
+            if r.type == 'offset':
+                self.modelNeedsPositions = True
+                break
+
         # 2. Fill in both cache lists
         self.relationCache = []
         self.relationOfCache = {}
@@ -2235,6 +2367,17 @@ class DataElement(Mutatable):
         if sout is not None:
             sout.storePosition(self.getFullnameInDataModel())
 
+        ## Nothing below us changed since our last value, use it!
+        ## Positions of our children are not stored, so skip this
+        ## when offset relations need them.
+        if self._valueCache is not None and \
+                (sout is None or self.getRootOfDataMap().modelNeedsPositions is False):
+
+            if sout is not None:
+                sout.write(self._valueCache)
+
+            return self._valueCache
+
         ## If we have a cached value for ourselves, use it!
         if self.elementType not in ['template', 'block', 'choice', 'flags',
                                     'xmlelement', 'xmlattribute', 'asn1type', 'custom']:
@@ -2247,6 +2390,9 @@ class DataElement(Mutatable):
 
                 #print "getValue(%s): Using self.value" % self.name
 
+                if self._canCacheValue():
+                    self._valueCache = self.value
+
                 return self.value
 
         if self.transformer is not None:
@@ -2294,8 +2440,29 @@ class DataElement(Mutatable):
             raise Exception("WHOA, Returning integer!!")
 
         self.value = value
+
+        if self._canCacheValue():
+            self._valueCache = value
+
         return self.value
 
+    def _canCacheValue(self):
+        """
+        Can the value we just produced be reused by getValue?  Only if
+        it can not change without us or one of our children changing.
+        So no relations or fixups, which read other parts of the
+        model, and every child has to be cached too.
+        """
+
+        if self.fixup is not None or len(self.relations) > 0:
+            return False
+
+        for child in self._children:
+            if isinstance(child, DataElement) and child._valueCache is None:
+                return False
+
+        return True
+
     def setDefaultValue(self, value):
         """
         Set the default value for this data element.
@@ -2403,6 +2570,465 @@ class DataElement(Mutatable):
         finally:
             self._unFixRealParent(self)
 
+class ClonePlan(object):
+    """
+    Precomputed plan for copying an element tree.
+
+    Building the plan walks the tree once and sorts every attribute of
+    every node into one of a few kinds (shared, element reference,
+    children, relation/hint list, bound method or deep copy).  L{clone}
+    then replays the plan in a single pass without going through pickle.
+
+    Attribute values are read from the source tree on every L{clone}, so
+    values may change between clones.  The structure (children,
+    relations, fixups, etc.) must not, build a new plan if it does.
+    """
+
+    #: Attribute values of these types are shared between copies
+    _atomicTypes = (str, unicode, int, long, float, bool, complex, type(None))
+
+    #: Journals an element reports its changes to, never copied
+    _journalAttributes = ('_overlay', '_snapshot')
+
+    # Attribute kinds
+    _REFERENCE = 0
+    _LIST = 1
+    _METHOD = 2
+    _DEEPCOPY = 3
+
+    def __init__(self, root):
+        #: Element this plan copies
+        self.root = root
+        #: Source nodes in copy order, root is first
+        self.nodes = []
+        #: Data elements (other than root) that have a realParent
+        self.realParentNodes = []
+
+        self._index = {}
+        self._steps = []
+
+        self._add(root)
+
+        # Compiling a node can find more nodes to copy
+        while len(self._steps) < len(self.nodes):
+            self._steps.append(self._compile(self.nodes[len(self._steps)]))
+
+    def _add(self, node):
+        """
+        Add node to the plan if needed, returns its position.
+        """
+
+        try:
+            return self._index[id(node)]
+
+        except KeyError:
+            self._index[id(node)] = len(self.nodes)
+            self.nodes.append(node)
+            return len(self.nodes) - 1
+
+    def _isAtomic(self, value):
+        if type(value) in self._atomicTypes:
+            return True
+
+        if type(value) in (tuple, frozenset):
+            for item in value:
+                if not self._isAtomic(item):
+                    return False
+
+            return True
+
+        return False
+
+    def _scan(self, value, seen, add = None):
+        """
+        Look for elements inside of a value we will deep copy.  They
+        become part of the plan so the copy references our copies,
+        or are passed to add if given.
+        """
+
+        if id(value) in seen or self._isAtomic(value):
+            return
+
+        seen.add(id(value))
+
+        if isinstance(value, Element):
+            (add or self._add)(value)
+
+        elif isinstance(value, (list, tuple, set, frozenset, ArraySetParent)):
+            for item in value:
+                self._scan(item, seen, add)
+
+        elif isinstance(value, dict):
+            for key, item in value.iteritems():
+                self._scan(key, seen, add)
+                self._scan(item, seen, add)
+
+        elif hasattr(value, '__dict__') and not isinstance(value, (type, types.ClassType, types.ModuleType,
+                                                                   types.FunctionType, types.MethodType)):
+            self._scan(value.__dict__, seen, add)
+
+    def deepCopiedAttributes(self):
+        """
+        Get the attributes copied with deepcopy, values which can change
+        in place without their element seeing it.
+
+        @rtype: list
+        @return: (node position, attribute name, elements inside the value)
+        """
+
+        ret = []
+        for index, (children, attributes) in enumerate(self._steps):
+            for kind, key, value in attributes:
+                if kind == self._DEEPCOPY:
+                    elements = []
+                    self._scan(self.nodes[index].__dict__[key], set(), elements.append)
+                    ret.append((index, key, elements))
+
+        return ret
+
+    def _compile(self, node):
+        """
+        Figure out how to copy each attribute of node.
+        """
+
+        children = None
+        if isinstance(node, ElementWithChildren):
+            # Same result as append()'ing each child
+            children = []
+            positions = {}
+            for child in node._children:
+                index = self._add(child)
+                if child._name in positions:
+                    children[positions[child._name]] = index
+
+                else:
+                    positions[child._name] = len(children)
+                    children.append(index)
+
+        attributes = []
+        for key, value in node.__dict__.iteritems():
+            if key == 'parent' or key in self._journalAttributes or self._isAtomic(value):
+                continue
+
+            if children is not None and key in ('_children', '_childrenHash', 'children'):
+                continue
+
+            if isinstance(value, Element):
+                attributes.append((self._REFERENCE, key, self._add(value)))
+
+            elif isinstance(value, ArraySetParent):
+                attributes.append((self._LIST, key, [self._add(item) for item in value]))
+
+            elif isinstance(value, types.MethodType) and isinstance(value.im_self, Element):
+                attributes.append((self._METHOD, key, None))
+
+            else:
+                self._scan(value, set())
+                attributes.append((self._DEEPCOPY, key, None))
+
+        if node is not self.root and isinstance(node, DataElement) \
+                and getattr(node, 'realParent', None) is not None:
+            self.realParentNodes.append(node)
+
+        return children, attributes
+
+    def clone(self, parent = None, memo = None):
+        """
+        Copy the tree.  The new root is returned with parent as its
+        parent.
+
+        @type	memo: dict
+        @param	memo: Optional deepcopy memo, filled with source id to copy
+        """
+
+        return self.cloneNodes(parent, memo)[0]
+
+    def cloneNodes(self, parent = None, memo = None):
+        """
+        Same as L{clone} but returns every copied node, in the same
+        order as L{nodes}.
+        """
+
+        if memo is None:
+            memo = {}
+
+        newObject = object.__new__
+        copies = []
+        append = copies.append
+
+        # 1. Create every node with all shared attributes
+
+        journalAttributes = self._journalAttributes
+        for node in self.nodes:
+            obj = newObject(node.__class__)
+            obj.__dict__ = objDict = node.__dict__.copy()
+            for key in journalAttributes:
+                if key in objDict:
+                    # A copy of an overlay instance is no part of the overlay
+                    del objDict[key]
+
+            memo[id(node)] = obj
+            append(obj)
+
+        # 2. Link everything up
+
+        for obj, (children, attributes) in zip(copies, self._steps):
+            objDict = obj.__dict__
+
+            nodeParent = objDict.get('parent')
+            if id(nodeParent) in memo:
+                objDict['parent'] = memo[id(nodeParent)]
+
+            if children is not None:
+                childList = [copies[i] for i in children]
+                childHash = {}
+                for child in childList:
+                    child.parent = obj
+                    childHash[child._name] = child
+
+                childAttributes = newObject(Empty)
+                childAttributes.__dict__ = childHash.copy()
+
+                objDict['_children'] = childList
+                objDict['_childrenHash'] = childHash
+                objDict['children'] = childAttributes
+
+            for kind, key, value in attributes:
+                if kind == self._REFERENCE:
+                    objDict[key] = copies[value]
+
+                elif kind == self._LIST:
+                    array = newObject(ArraySetParent)
+                    array._parent = obj
+                    array._array = [copies[i] for i in value]
+                    for item in array._array:
+                        item.parent = obj
+
+                    objDict[key] = array
+
+                elif kind == self._METHOD:
+                    method = objDict[key]
+                    if id(method.im_self) in memo:
+                        objDict[key] = new_instancemethod(method.im_func, memo[id(method.im_self)])
+
+                else:
+                    objDict[key] = self._deepCopyValue(objDict[key], memo)
+
+        copies[0].parent = parent
+        return copies
+
+    @staticmethod
+    def _deepCopyValue(value, memo):
+        try:
+            return deepcopy(value, memo)
+
+        except TypeError:
+            # Some things only know how to pickle
+            return pickle.loads(pickle.dumps(value, -1))
+
+
+class ElementJournal(object):
+    """
+    Saved state of changed elements.  The state of an element is saved
+    just before its first change, L{rollback} puts it back.
+
+    Note: Changes made in place to attribute values which are neither
+      elements nor lists of them (e.g. a dict or a transformer instance)
+      are not tracked.  L{TemplateOverlay} copies those values again on
+      every checkout instead.
+    """
+
+    def __init__(self):
+        #: Saved state of changed elements by id
+        self.journal = {}
+
+    def record(self, node):
+        """
+        Save the state of node before it is changed.
+        """
+
+        state = node.__dict__.copy()
+
+        # Elements still in __init__ have no children yet
+        children = None
+        if '_children' in state:
+            children = (node._children[:], node._childrenHash.copy(),
+                        node.children.__dict__.copy())
+
+        arrays = [(value, value._array[:]) for value in state.itervalues()
+                  if isinstance(value, ArraySetParent)]
+
+        self.journal[id(node)] = (node, state, children, arrays)
+
+    def rollback(self):
+        """
+        Put back every element changed since the last rollback.
+        """
+
+        for node, state, children, arrays in self.journal.itervalues():
+            nodeDict = node.__dict__
+            nodeDict.clear()
+            nodeDict.update(state)
+
+            if children is not None:
+                childList, childHash, childAttributes = children
+                node._children[:] = childList
+                node._childrenHash.clear()
+                node._childrenHash.update(childHash)
+                node.children.__dict__.clear()
+                node.children.__dict__.update(childAttributes)
+
+            for array, items in arrays:
+                array._array[:] = items
+
+        self.journal = {}
+
+
+class TemplateOverlay(object):
+    """
+    Copy-on-write instances of a template.
+
+    Instead of copying the whole template for each use, instances are
+    copied up front and reused.  Elements of an instance save their
+    state the first time they are changed (see L{Element.__setattr__}),
+    L{checkout} puts back only those elements plus the attribute values
+    elements can not see changing (see L{ElementJournal}).  The cost of
+    a checkout follows the number of elements changed since the last one
+    (mutated fields, their ancestors and relations), not the size of the
+    model.
+    """
+
+    def __init__(self, template):
+        #: Source template, never changed by us
+        self.template = template
+        #: Plan used to create instances
+        self.plan = ClonePlan(template)
+        #: (node position, attribute name, elements inside the value)
+        self.deepCopied = self.plan.deepCopiedAttributes()
+        #: Every instance made so far
+        self.instances = []
+        self._generation = None
+        self._used = 0
+
+    def checkout(self, parent, generation = None):
+        """
+        Get an instance as a fresh copy of template.
+
+        Instances handed out for the same generation are all different,
+        so a template used twice in a test case gets two of them.  A new
+        generation hands out the same instances again.
+
+        @type	parent: Element
+        @param	parent: Parent for the instance
+        @type	generation: object
+        @param	generation: Test case the instance is for, None for a new one
+        @rtype: DataElement
+        @return: the instance
+        """
+
+        if generation is None or generation != self._generation:
+            self._generation = generation
+            self._used = 0
+
+        if self._used == len(self.instances):
+            self.instances.append(OverlayInstance(self))
+
+        instance = self.instances[self._used]
+        self._used += 1
+        return instance.checkout(parent)
+
+
+class OverlayInstance(ElementJournal):
+    """
+    One instance of a L{TemplateOverlay}, the journal its elements
+    report their changes to.
+    """
+
+    def __init__(self, overlay):
+        ElementJournal.__init__(self)
+        self.overlay = overlay
+        #: Root of the instance, None until first checkout
+        self.root = None
+        #: (element, attribute name, source element, memo of elements inside)
+        self._deepCopied = []
+
+    def checkout(self, parent):
+        """
+        Put the instance back to the state of the template.
+
+        @rtype: DataElement
+        @return: root of the instance
+        """
+
+        if self.root is None:
+            memo = {}
+            copies = self.overlay.plan.cloneNodes(parent, memo)
+            for node in copies:
+                node.__dict__['_overlay'] = self
+
+            nodes = self.overlay.plan.nodes
+            for index, key, elements in self.overlay.deepCopied:
+                self._deepCopied.append((copies[index], key, nodes[index],
+                                         dict((id(element), memo[id(element)]) for element in elements)))
+
+            self.root = copies[0]
+            return self.root
+
+        self.rollback()
+        for node, key, source, memo in self._deepCopied:
+            node.__dict__[key] = ClonePlan._deepCopyValue(source.__dict__[key], memo.copy())
+
+        self.root.parent = parent
+        return self.root
+
+
+class Snapshot(ElementJournal):
+    """
+    Undo log for every element changed while the snapshot is active.
+
+    Lets us try something on a live data model and throw the result
+    away, at the cost of the elements changed instead of a copy of the
+    whole model.  Snapshots nest, only the innermost active one records
+    which is enough as long as it is rolled back before the outer one
+    carries on.
+
+    Usage::
+
+      snapshot = Snapshot().start()
+      try:
+        ...
+      finally:
+        snapshot.stop()
+    """
+
+    def __init__(self):
+        ElementJournal.__init__(self)
+        #: Snapshot active before us
+        self.previous = None
+
+    def start(self):
+        """
+        Start recording changes.
+
+        @rtype: Snapshot
+        @return: self
+        """
+
+        self.previous = Element._snapshot
+        Element._snapshot = self
+        return self
+
+    def stop(self):
+        """
+        Stop recording and put back every element changed since
+        L{start}.
+        """
+
+        Element._snapshot = self.previous
+        self.previous = None
+        self.rollback()
+
+
 class Transformer(ElementWithChildren):
     """
     The Trasnfomer DOM object.  Should only be a child of
@@ -2820,22 +3446,21 @@ class Template(DataElement):
 
         # 2. Get value from children
 
+        values = []
         for c in self:
             if isinstance(c, DataElement):
                 try:
                     if self.fixup is not None or self.transformer is not None:
-                        cv = c.getValue()
-
-                        value += cv
+                        values.append(c.getValue())
                     else:
-                        cv = c.getValue(sout)
-
-                        value += cv
+                        values.append(c.getValue(sout))
 
                 except:
                     print(sys.exc_info())
                     raise
 
+        value = "".join(values)
+
         # 3. Fixup
 
         if self.fixup is not None:
@@ -2959,6 +3584,17 @@ class Choice(DataElement):
 
         return self.currentElement
 
+    def _canCacheValue(self):
+        """
+        Only the selected element makes up our value.
+        """
+
+        if self.fixup is not None or len(self.relations) > 0:
+            return False
+
+        return self.currentElement is not None and \
+               self.currentElement._valueCache is not None
+
     def isInvalidated(self):
         """
         Check if we need to reproduce this value.
@@ -3199,15 +3835,19 @@ class Block(DataElement):
 
         # 2. Get value from children
 
+        # Collect pieces and join once, adding to a string as we go
+        # copies everything collected so far on each child.
+        values = []
+
         if self.transformer is None and self.fixup is None:
             for c in self:
                 if isinstance(c, DataElement):
                     try:
-                        value += c.getValue(sout)
+                        values.append(c.getValue(sout))
 
                     except:
                         print(c)
-                        print(repr(value))
+                        print(repr("".join(values)))
                         print(repr(c.getValue(sout)))
                         print("c.getValue(sout) failed." + repr(sys.exc_info()))
                         print("c.name: %s" % c.name)
@@ -3229,7 +3869,7 @@ class Block(DataElement):
                 if isinstance(c, DataElement):
                     try:
                         #print "Block.getInternalValue(%s): Getting child value" % self.name
-                        value += c.getValue(stringBuffer)
+                        values.append(c.getValue(stringBuffer))
 
                     except:
                         #print "value: [%s]" % repr(value)
@@ -3237,20 +3877,25 @@ class Block(DataElement):
                         print("---------------")
                         raise
 
-            stringBuffer.setValue("")
-            stringBuffer.seekFromStart(0)
-            value = ""
+            # The second pass only differs when offset relations
+            # picked up positions from the first one.
+            if self.getRootOfDataMap().modelNeedsPositions is not False:
+                stringBuffer.setValue("")
+                stringBuffer.seekFromStart(0)
+                values = []
 
-            for c in self:
-                if isinstance(c, DataElement):
-                    try:
-                        value += c.getValue(stringBuffer)
+                for c in self:
+                    if isinstance(c, DataElement):
+                        try:
+                            values.append(c.getValue(stringBuffer))
 
-                    except:
-                        #print "value: [%s]" % repr(value)
-                        print("c.name: %s" % c.name)
-                        print("---------------")
-                        raise
+                        except:
+                            #print "value: [%s]" % repr(value)
+                            print("c.name: %s" % c.name)
+                            print("---------------")
+                            raise
+
+        value = "".join(values)
 
         # 3. Fixup
 
@@ -4896,6 +5541,8 @@ class Data(ElementWithChildren):
         self.maxFileSize = -1
         #: Allow recursion to find files in sub-folders
         self.recurse = False
+        #: Pick larger files more often in multi-file mode
+        self.weighted = False
 
     def is_valid(self, fpath):
         fname = os.path.basename(fpath)
@@ -4909,18 +5556,7 @@ class Data(ElementWithChildren):
     def gotoFirstFile(self):
         if not self.multipleFiles:
             raise PeachException("Data.gotoFirstFile called with self.multipleFiles == False!")
-        if self.folderName is not None:
-            self.fileName = self.folderName
-            self.files = []
-            for fname in os.listdir(self.folderName):
-                fpath = os.path.join(self.folderName, fname)
-                if self.is_valid(fpath):
-                    self.files.append(fpath)
-        elif self.fileGlob is not None:
-            self.files = []
-            for fpath in glob.glob(self.fileGlob):
-                if self.is_valid(fpath):
-                    self.files.append(fpath)
+        self.files = list(SeedCorpus.forData(self).files)
         self.fileName = self.files[0]
         self.files = self.files[1:]
 
@@ -4931,18 +5567,15 @@ class Data(ElementWithChildren):
     def gotoRandomFile(self):
         if not self.multipleFiles:
             raise PeachException("Data.gotoRandomFile called with self.multipleFiles == False!")
-        files = []
-        if self.folderName is not None:
-            self.fileName = self.folderName
-            for fname in os.listdir(self.folderName):
-                fpath = os.path.join(self.folderName, fname)
-                if self.is_valid(fpath):
-                    files.append(fpath)
-        elif self.fileGlob is not None:
-            for fpath in glob.glob(self.fileGlob):
-                if self.is_valid(fpath):
-                    files.append(fpath)
-        self.fileName = random.choice(files)
+        self.fileName = SeedCorpus.forData(self).choice(self.weighted)
+
+    def rejectFile(self):
+        """
+        Do not pick the current file again, e.g. because it failed to
+        crack.
+        """
+        if self.multipleFiles:
+            SeedCorpus.forData(self).reject(self.fileName)
 
 
 class Field(ElementWithChildren):
@@ -226,6 +226,10 @@ class StdoutWatcher(EngineWatcher):
                     self.startVariationCount = variationCount
         except:
             pass
+        if variationCount % 20 == 0:
+            for pub in test.publishers:
+                if getattr(pub, "adaptiveTimeout", None) is not None:
+                    logging.info(prefix + "Timeouts: %s" % pub.adaptiveTimeout)
 
     def OnTestCaseReceived(self, run, test, variationCount, value):
         if Engine.verbose:
@@ -256,6 +260,7 @@ class Engine(object):
     nativeDeepCopy = True
     testRange = None
     context = None
+    modelCache = None
 
     def __init__(self):
         self.restartFile = None
@@ -392,6 +397,27 @@ class Engine(object):
     def _stopAgents(self, run, test):
         self.agent.OnShutdown()
 
+    def _faultTestCase(self, test, testCount, actionValues, monitorData):
+        """
+        Find the test case a fault belongs to.  Publishers which run test
+        cases later than the iteration that made them name the one the
+        target failed on in faultTestCase.
+
+        @rtype: tuple
+        @return: (iteration, actionValues) to file the fault under
+        """
+        for pub in test.publishers:
+            faultTestCase = getattr(pub, "faultTestCase", None)
+            if faultTestCase is None:
+                continue
+            pub.faultTestCase = None
+            iteration, data = faultTestCase
+            name = pub.domPublisher.name
+            monitorData["%s_faultTestCase.txt" % name] = \
+                "Fault on the test case of iteration %d, detected after iteration %d.\n" % (iteration, testCount)
+            return iteration, [[name, 'output', data]]
+        return testCount, actionValues
+
     def _countTest(self, run, test, verbose=False):
         """
         Get the total test count of this test
@@ -427,6 +453,7 @@ class Engine(object):
         self._startAgents(run, test)
         if not countOnly:
             self.watcher.OnTestStarting(run, test, totalTests)
+            EvalStatistics.reset()
         for p in test.publishers:
             p.initialize()
         errorCount = 0
@@ -477,9 +504,8 @@ class Engine(object):
                         # Skip ahead to start range, but not if we are restoring saved state.
                         logging.info("Skipping ahead to iteration %d." % startCount)
                         #testCount -= 1
-                        for _ in range(testCount, startCount):
-                            mutator.next()
-                            testCount += 1
+                        mutator.skip(startCount - testCount)
+                        testCount = startCount
                     # Update total test count
                     if testRange is None:
                         totalTests = mutator.getCount()
@@ -522,7 +548,8 @@ class Engine(object):
                     # Notify
                     if not countOnly:
                         self.watcher.OnTestCaseFinished(run, test, testCount, actionValues)
-                    self.agent.OnTestFinished()
+                    # Also fetches the redo, fault and stop run answers below
+                    self.agent.IterationEnd()
                     # Should we repeat this test?
                     if self.agent.RedoTest():
                         logging.warning(highlight.warning("Repeating test"))
@@ -531,7 +558,8 @@ class Engine(object):
                         logging.warning(highlight.warning("Detected fault! Processing data..."))
                         results = self.agent.GetMonitorData()
                         mutator.onFaultDetected(test, testCount, stateEngine, results, actionValues)
-                        self.watcher.OnFault(run, test, testCount, results, actionValues)
+                        faultCount, faultValues = self._faultTestCase(test, testCount, actionValues, results)
+                        self.watcher.OnFault(run, test, faultCount, results, faultValues)
                         self.agent.OnFault()
                     # Check for stop event
                     if self.agent.StopRun():
@@ -590,6 +618,9 @@ class Engine(object):
                 pass
             self._stopAgents(run, test)
         if not countOnly:
+            if EvalStatistics.count:
+                logging.info("Evaluated %d expressions (%d compiled) in %.3f seconds." %
+                             (EvalStatistics.count, EvalStatistics.compiled, EvalStatistics.seconds))
             self.watcher.OnTestFinished(run, test)
 
     def _runPathTest(self, run, test):
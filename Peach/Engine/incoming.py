@@ -58,6 +58,26 @@ class DataCracker(object):
         #: Parent position (if any)
         self.parentPos = 0
 
+        #: Results of _handleNode while looking ahead, see _getHandleMemo
+        self.handleMemo = {}
+
+        #: Buffer and length of data handleMemo is good for
+        self.handleMemoState = None
+
+        #: Nodes by id, with True if handleMemo can be used for them
+        self.handleMemoNodes = {}
+
+        #: Data models by id, with True if when relations keep us from
+        #: using handleMemo
+        self.handleMemoModels = {}
+
+        #: Nodes being handled right now, by id and doingMinMax
+        self.handling = {}
+
+        #: Relation values read by each node being handled while
+        #: looking ahead, innermost last.  Shared with inner crackers.
+        self.relationReads = []
+
         if not inner:
             DataCracker._tabLevel = 0
 
@@ -73,8 +93,8 @@ class DataCracker(object):
 
         self.method = method
         (rating, pos) = self._handleNode(template, buff, 0, None) #, self.dom)
-        Debug(1, "RATING: %d - POS: %d - LEN(DATA): %d" % (rating, self.parentPos + pos, len(buff.data)))
-        if pos < len(buff.data) - 1:
+        Debug(1, "RATING: %d - POS: %d - LEN(DATA): %d" % (rating, self.parentPos + pos, len(buff)))
+        if pos < len(buff) - 1:
             Debug(1, highlight.warning("WARNING: Did not consume all data!!!"))
 
         Debug(1, "Done cracking stuff")
@@ -152,8 +172,8 @@ class DataCracker(object):
         self.crackPassed = True
         self.method = method
         (rating, pos) = self._handleNode(template, buff, 0, None) #, self.dom)
-        Debug(1, "RATING: %d - POS: %d - LEN(DATA): %d" % (rating, self.parentPos + pos, len(buff.data)))
-        if pos < len(buff.data) - 1:
+        Debug(1, "RATING: %d - POS: %d - LEN(DATA): %d" % (rating, self.parentPos + pos, len(buff)))
+        if pos < len(buff) - 1:
             self.crackPassed = False
             Debug(1, "WARNING: Did not consume all data!!!")
         if rating > 2:
@@ -436,7 +456,7 @@ class DataCracker(object):
         Debug(1, "-- Looking for Count relation...")
         relation = node.getRelationOfThisElement('count')
         if relation is not None and relation.type == 'count' and node.parent is not None:
-            maxOccurs = int(relation.getValue(True))
+            maxOccurs = int(self._relationValue(relation))
             Debug(1, "@@@ Found count relation [%d]" % maxOccurs)
             hasCountRelation = True
 
@@ -513,7 +533,7 @@ class DataCracker(object):
                 Debug(1, "@@@ In While, newCurPos=%d" % (self.parentPos + newCurPos))
 
                 ## Are we out at end of stream?
-                if buff.haveAllData and newCurPos >= len(buff.data):
+                if buff.haveAllData and newCurPos >= len(buff):
                     Debug(1, "@ Exiting while loop, end of data! YAY!")
                     if occurs == 0:
                         Debug(1, "@ Exiting while on first loop")
@@ -542,7 +562,7 @@ class DataCracker(object):
                     break
 
                 else:
-                    Debug(1, "@ Have enough data to try again: %d < %d" % (newCurPos, len(buff.data)))
+                    Debug(1, "@ Have enough data to try again: %d < %d" % (newCurPos, len(buff)))
 
                 ## Make a copy so we don't overwrite existing node
                 if occurs > 0:
@@ -756,12 +776,200 @@ class DataCracker(object):
         return rating, pos
 
     def _handleNode(self, node, buff, pos, parent=None, doingMinMax=False):
+        """
+        Crack node at pos, see L{_crackNode}.
+
+        Everything a look ahead changes is put back once it is done, so
+        while looking ahead all that handling a node leaves behind is
+        its rating and new position.  These are kept by node and
+        position, along with the relation values the node read from
+        outside of itself, so the next look ahead that gets to the same
+        node at the same position does not crack it again.  Arrays and
+        choices are handled through here as well.
+
+        @rtype: tuple
+        @return: (rating, pos)
+        """
+
+        memo = None
+        lookAhead = self.lookAhead
+        if self.lookAheadDepth > 0:
+            memo = self._getHandleMemo(node, buff, doingMinMax)
+            if memo is not None:
+                found = self._findHandled(memo, node, pos, parent, doingMinMax, lookAhead)
+                if found is not None:
+                    Debug(1, "_handleNode(%s): rated %d at %d before" % (node.name, found[0], pos))
+                    self.lookAhead = found[2]
+                    return found[:2]
+
+        recording = self.lookAheadDepth > 0 or len(self.relationReads) > 0
+        if recording:
+            self.relationReads.append([])
+
+        memoState = self.handleMemoState
+        handling = (id(node), doingMinMax)
+        nested = handling in self.handling
+        self.handling[handling] = node
+        try:
+            (rating, newpos) = self._crackNode(node, buff, pos, parent, doingMinMax)
+
+        finally:
+            if not nested:
+                del self.handling[handling]
+
+            if recording:
+                # Values of relations inside of node come from cracking it
+                reads = [(r, v) for (r, v) in self.relationReads.pop() if not self._isInside(r.parent, node)]
+                if len(self.relationReads) > 0:
+                    self.relationReads[-1].extend(reads)
+
+        # Data read while handling makes the result useless
+        if memo is not None and memoState == (buff, len(buff), buff.haveAllData):
+            memo[(id(node), pos, id(parent), doingMinMax, lookAhead)] = (
+                node, parent, reads, rating, newpos, self.lookAhead)
+
+        return rating, newpos
+
+    def _getHandleMemo(self, node, buff, doingMinMax):
+        """
+        Get the results of L{_handleNode} while looking ahead, thrown
+        away when the buffer grows.
+
+        @rtype: dict
+        @return: (node, parent, reads, rating, pos, lookAhead) by (node,
+          pos, parent, doingMinMax, lookAhead) or None if results can
+          not be kept for node
+        """
+
+        # Half cracked, e.g. the choice array we escaped to.  Arrays
+        # handle their first element as themselves, that is fine.
+        if (id(node), True) in self.handling or (id(node), doingMinMax) in self.handling:
+            return None
+
+        state = (buff, len(buff), buff.haveAllData)
+        if state != self.handleMemoState:
+            self.handleMemo = {}
+            self.handleMemoNodes = {}
+            self.handleMemoState = state
+
+        if id(node) not in self.handleMemoNodes:
+            self.handleMemoNodes[id(node)] = (node, self._isSelfContained(node))
+
+        if not self.handleMemoNodes[id(node)][1]:
+            return None
+
+        return self.handleMemo
+
+    def _findHandled(self, memo, node, pos, parent, doingMinMax, lookAhead):
+        """
+        Look up the result of handling node at pos in memo, as long as
+        the relations it read still have the same values.
+
+        @rtype: tuple
+        @return: (rating, pos, lookAhead) or None
+        """
+
+        found = memo.get((id(node), pos, id(parent), doingMinMax, lookAhead))
+        if found is None:
+            return None
+
+        reads = found[2]
+        for (relation, value) in reads:
+            if self._readRelation(relation) != value:
+                return None
+
+        if len(self.relationReads) > 0:
+            self.relationReads[-1].extend(reads)
+
+        return found[3:]
+
+    def _isSelfContained(self, node):
+        """
+        Check that nothing outside of node depends on what cracking it
+        leaves behind.  That is node has no size, count or offset
+        relation of an element outside of it, and the data model has no
+        when relations, which can look at anything.
+        """
+
+        root = node.getRootOfDataMap()
+        if id(root) not in self.handleMemoModels:
+            when = False
+            for element in [root] + root.getAllChildDataElements():
+                for relation in element.relations:
+                    if relation.type == 'when':
+                        when = True
+
+            self.handleMemoModels[id(root)] = (root, when)
+
+        if self.handleMemoModels[id(root)][1]:
+            return False
+
+        for element in [node] + node.getAllChildDataElements():
+            for relation in element.relations:
+                if relation.From is not None:
+                    continue
+
+                try:
+                    of = element.findDataElementByName(relation.of)
+                    if of is None:
+                        of = element.findArrayByName(relation.of)
+
+                except:
+                    of = None
+
+                if of is None or not self._isInside(of, node):
+                    return False
+
+        return True
+
+    def _isInside(self, element, node):
+        """
+        Is element node or one of its children?
+        """
+
+        while element is not None:
+            if element is node:
+                return True
+
+            element = element.parent
+
+        return False
+
+    def _readRelation(self, relation):
+        """
+        Get relation.getValue(True).
+
+        @return: value of relation or the exception getting it raised
+        """
+
+        try:
+            return relation.getValue(True)
+
+        except Exception as e:
+            return e
+
+    def _relationValue(self, relation):
+        """
+        Get relation.getValue(True) and note it down for the nodes being
+        handled, see L{_handleNode}.
+        """
+
+        value = self._readRelation(relation)
+        if len(self.relationReads) > 0:
+            self.relationReads[-1].append((relation, value))
+
+        if isinstance(value, Exception):
+            raise value
+
+        return value
+
+    def _crackNode(self, node, buff, pos, parent=None, doingMinMax=False):
         Debug(1, "_handleNode(%s): %s pos(%d) >>Enter" % (highlight.info(node.name), node.elementType, pos))
 
         ## Sanity checking
 
-        if pos > len(buff.data):
-            Debug(1, "_handleNode: Running past data!, pos: %d, len.data: %d" % (pos, len(buff.data)))
+        if pos > len(buff):
+            Debug(1, "_handleNode: Running past data!, pos: %d, len.data: %d" % (pos, len(buff)))
             return 4, pos
 
         if node is None:
@@ -832,7 +1040,7 @@ class DataCracker(object):
                     Debug(1, "_handleNode: Found offset relation")
                     Debug(1, "_handleNode: Origional position saved as %d" % (self.parentPos + pos))
                     popPosition = pos
-                    pos = int(relation.getValue(True))
+                    pos = int(self._relationValue(relation))
                     Debug(1, "_handleNode: Changed position to %d" % (self.parentPos + pos))
 
                 except:
@@ -879,7 +1087,7 @@ class DataCracker(object):
 
             if relation is not None and node.parent is not None:
                 try:
-                    length = relation.getValue(True)
+                    length = self._relationValue(relation)
                     Debug(1, "-----> FOUND BLOCK OF RELATION [%s] <-----" % repr(length))
                     fullName = relation.parent.getFullname()
                     Debug(1, "Size-of Fullname: " + fullName)
@@ -906,11 +1114,11 @@ class DataCracker(object):
             # situation.
             if length is not None and node.parent is not None:
                 # Make sure we have the data
-                if len(buff.data) < (pos + length):
+                if len(buff) < (pos + length):
                     if not buff.haveAllData:
                         node.relationOf = None
                         try:
-                            buff.read((pos + length) - len(buff.data))
+                            buff.read((pos + length) - len(buff))
                         #raise NeedMoreData(length, "")
                         except:
                             rating = 4
@@ -920,14 +1128,15 @@ class DataCracker(object):
                         rating = 4
                         pos = pos + length
 
-                if len(buff.data) >= (pos + length):
+                if len(buff) >= (pos + length):
                     Debug(1, "---- About to Crack internal Block ----")
 
                     # Parse this node on it's own
                     cracker = DataCracker(self.peach, True)
                     cracker.haveAllData = True
                     cracker.parentPos = pos + self.parentPos
-                    data = buff.data[pos:pos + length]
+                    cracker.relationReads = self.relationReads
+                    data = buff[pos:pos + length]
 
                     # Do we have a transformer, if so decode the data
                     if node.transformer is not None:
@@ -1082,10 +1291,36 @@ class DataCracker(object):
         if node is None:
             return 1
 
-        if pos > len(buff.data):
+        if pos > len(buff):
             Debug(1, "_lookAhead(): pos > len(data), no lookahead")
             return 4
 
+        ## If we could have more than one of the curret node
+        ## we will try that node again UNLESS we minMax == False
+
+        # Why are we doing this?  For String Arrays?
+
+        tryNode = node.maxOccurs > 1 and minMax
+        sibling = self._nextNode(node)
+
+        ## Without tryNode looking ahead is handling sibling at pos,
+        ## maybe we did that before (see _handleNode).
+
+        if not tryNode and sibling is not None:
+            memo = self._getHandleMemo(sibling, buff, False)
+            if memo is not None:
+                found = self._findHandled(memo, sibling, pos, parent, False, True)
+                if found is not None:
+                    (rating, pos, lookAhead) = found
+                    Debug(1, "_lookAhead(): %s at %d rated %d before" % (sibling.name, pos, rating))
+
+                    # Leave the same state behind as looking again would
+                    self.lookAhead = lookAhead and self.lookAheadDepth > 0
+                    if pos < len(buff):
+                        return rating + 1
+
+                    return rating
+
         #print "_lookAhead"
         #traceback.print_stack()
 
@@ -1096,59 +1331,52 @@ class DataCracker(object):
         self.lookAhead = True
         self.lookAheadDepth += 1
 
-        origNode = node
-        origParent = parent
-
-        ## First lets copy the data model
-        root = origNode.getRootOfDataMap().copy(None)
-        node = root.findDataElementByName(origNode.getFullnameInDataModel())
-        sibling = self._nextNode(node)
-
-        if node is None:
-            raise Exception("Node should not be null here! [%s]" % origNode.getFullnameInDataModel())
-
-        if origParent is not None:
-            parent = root.findDataElementByName(origParent.getFullnameInDataModel())
+        ## Work on the live data model, everything we change is put
+        ## back by the snapshot.  The data model is detached from its
+        ## parent while we look, same as a copy would be.
+        root = node.getRootOfDataMap()
 
-        ## If we could have more than one of the curret node
-        ## we will try that node again UNLESS we minMax == False
+        snapshot = Snapshot().start()
+        try:
+            root.parent = None
 
-        # Why are we doing this?  For String Arrays?
+            if tryNode:
+                Debug(1, "_lookAhead(): look ahead for node")
 
-        if node.maxOccurs > 1 and minMax:
-            Debug(1, "_lookAhead(): look ahead for node")
+                #try:
+                (rating, pos) = self._handleNode(node, buff, pos, parent)
 
-            #try:
-            (rating, pos) = self._handleNode(node, buff, pos, parent)
+                # If we have a good rating return it
+                if rating < 3:
+                    self.lookAheadDepth -= 1
+                    if self.lookAheadDepth == 0:
+                        self.lookAhead = False
 
-            # If we have a good rating return it
-            if rating < 3:
-                self.lookAheadDepth -= 1
-                if self.lookAheadDepth == 0:
                     self.lookAhead = False
+                    DataCracker._tabLevel -= 1
+                    return rating
 
-                self.lookAhead = False
-                DataCracker._tabLevel -= 1
-                return rating
+            ## Now lets try that sibling if we can
 
-        ## Now lets try that sibling if we can
+            if sibling is None:
+                # if no sibling than everything is okay
 
-        if sibling is None:
-            # if no sibling than everything is okay
+                Debug(1, "_lookAhead(): node.nextSibling() ==  None, returning 1")
+                rating = 1
 
-            Debug(1, "_lookAhead(): node.nextSibling() ==  None, returning 1")
-            rating = 1
+            else:
+                Debug(1, "_lookAhead(): look ahead for node.Sibling(): %s->%s" % (node.name, sibling.name))
+                (rating, pos) = self._handleNode(sibling, buff, pos, parent)
 
-        else:
-            Debug(1, "_lookAhead(): look ahead for node.Sibling(): %s->%s" % (node.name, sibling.name))
-            (rating, pos) = self._handleNode(sibling, buff, pos, parent)
+        finally:
+            snapshot.stop()
 
         self.lookAheadDepth -= 1
         if self.lookAheadDepth == 0:
             self.lookAhead = False
 
         DataCracker._tabLevel -= 1
-        if pos < len(buff.data):
+        if pos < len(buff):
             return rating + 1
 
         else:
@@ -1408,7 +1636,7 @@ class DataCracker(object):
             relation = node.getRelationOfThisElement('size')
             if relation is not None:
                 #Debug(1, "_hasSize(%s): Found relation" % node.name)
-                return int(relation.getValue(True))
+                return int(self._relationValue(relation))
 
             # Check each child
             size = 0
@@ -1429,7 +1657,7 @@ class DataCracker(object):
             relation = node.getRelationOfThisElement('size')
             if relation is not None:
                 #Debug(1, "_hasSize(%s): Found relation" % node.name)
-                return int(relation.getValue(True))
+                return int(self._relationValue(relation))
 
             # Until choice is run we
             # will not know which element
@@ -1440,7 +1668,7 @@ class DataCracker(object):
         relation = node.getRelationOfThisElement('size')
         if relation is not None:
             #Debug(1, "_hasSize(%s): Found relation" % node.name)
-            return int(relation.getValue(True))
+            return int(self._relationValue(relation))
 
         return None
 
@@ -1621,23 +1849,23 @@ class DataCracker(object):
             fastCheck, fastCheckOffset, fastCheckValue = child.choiceCache
 
             # Check and see if we need to read more data for check
-            if fastCheck and len(fastCheckValue) > (len(buff.data) - (pos + fastCheckOffset)):
+            if fastCheck and len(fastCheckValue) > (len(buff) - (pos + fastCheckOffset)):
                 # Need to read some data in if posssible
                 if buff.haveAllData:
                     Debug(1, "_handleChoice(): FastCheck: Not enough data to match, NEXT!")
                     continue
 
                 else:
-                    size = len(fastCheckValue) - (len(buff.data) - (pos + fastCheckOffset))
+                    size = len(fastCheckValue) - (len(buff) - (pos + fastCheckOffset))
                     buff.read(size)
-                    if len(fastCheckValue) > (len(buff.data) - (pos + fastCheckOffset)):
+                    if len(fastCheckValue) > (len(buff) - (pos + fastCheckOffset)):
                         Debug(1, "_handleChoice(): FastCheck: Not enough data to match, NEXT!")
                         continue
 
-            if fastCheck and buff.data[
+            if fastCheck and buff[
                              pos + fastCheckOffset:pos + fastCheckOffset + len(fastCheckValue)] != fastCheckValue:
                 Debug(1, "_handleChoice(): FastCheck: [%s] != [%s] NEXT!" % (
-                    buff.data[pos + fastCheckOffset:pos + len(fastCheckValue)], fastCheckValue))
+                    buff[pos + fastCheckOffset:pos + len(fastCheckValue)], fastCheckValue))
                 continue
 
             # Before we actually do this we need to emulate this as the only child.
@@ -1650,7 +1878,10 @@ class DataCracker(object):
             node.append(child)
 
             (childRating, newpos) = self._handleNode(child, buff, curpos)
-            if child.currentValue is not None and len(child.currentValue) > 30:
+            # Formatting large values is expensive, only do it for output
+            if not Peach.Engine.engine.Engine.debug:
+                pass
+            elif child.currentValue is not None and len(child.currentValue) > 30:
                 Debug(1, "_handleChoice(): Rating: (%d) [%s]: %s = [%s]" % (
                     childRating, highlight.repr(repr(child.defaultValue)), child.name, child.currentValue[:30]))
             else:
@@ -1730,7 +1961,10 @@ class DataCracker(object):
             ratingCnt += 1
 
             (childRating, newpos) = self._handleNode(child, buff, curpos)
-            if child is not None and child.currentValue is not None and len(child.currentValue) > 30:
+            # Formatting large values is expensive, only do it for output
+            if not Peach.Engine.engine.Engine.debug:
+                pass
+            elif child is not None and child.currentValue is not None and len(child.currentValue) > 30:
                 if child.defaultValue is not None and len(repr(child.defaultValue)) > 30:
                     Debug(1, "_handleBlock(%s): Rating: (%d) [%s]: %s = [%s]" % (
                         node.name, childRating, highlight.repr(repr(child.defaultValue)[:30]), child.name,
@@ -1834,7 +2068,7 @@ class DataCracker(object):
                 fullName = relation.parent.getFullname()
                 Debug(1, "Size-of Fullname: " + fullName)
 
-                length = relation.getValue(True)
+                length = self._relationValue(relation)
                 Debug(1, "Size-of Length: %s" % length)
 
                 # Value may not be available yet
@@ -1858,31 +2092,31 @@ class DataCracker(object):
                 if node.type == 'wchar':
                     length *= 2
 
-                if len(buff.data) < (pos + length):
+                if len(buff) < (pos + length):
                     if not buff.haveAllData:
                         try:
-                            buff.read((pos + length) - len(buff.data))
+                            buff.read((pos + length) - len(buff))
 
                             # Just make sure that buff.read actually worked.
-                            if len(buff.data) < (pos + length):
+                            if len(buff) < (pos + length):
                                 raise Exception("Why didn't that throw???")
 
                         except:
                             rating = 4
                             value = ""
                             newpos = pos + length
-                            Debug(1, "_handleString: Want %d, have %d" % ((pos + length), len(buff.data)))
+                            Debug(1, "_handleString: Want %d, have %d" % ((pos + length), len(buff)))
                             break
 
                     else:
                         rating = 4
                         value = ""
                         newpos = pos + length
-                        Debug(1, "_handleString: Want %d, have %d" % ((pos + length), len(buff.data)))
+                        Debug(1, "_handleString: Want %d, have %d" % ((pos + length), len(buff)))
                         break
 
-                if len(buff.data) >= (pos + length):
-                    value = buff.data[pos:pos + length]
+                if len(buff) >= (pos + length):
+                    value = buff[pos:pos + length]
                     newpos = pos + length
                     defaultValue = node.defaultValue
                     rating = 2
@@ -1936,7 +2170,7 @@ class DataCracker(object):
                 if node.type != 'wchar':
                     newpos = -1
                     while True:
-                        newpos = buff.data.find('\0', pos)
+                        newpos = buff.find('\0', pos)
 
                         if newpos == -1:
                             if buff.haveAllData:
@@ -1959,13 +2193,13 @@ class DataCracker(object):
 
                     if rating == 666:
                         newpos += 1    # find leaves us a position down, need to add one to get the null
-                        value = buff.data[pos:newpos]
+                        value = buff[pos:newpos]
                         rating = 2
 
                     break
 
                 elif node.type == 'wchar':
-                    newpos = buff.data.find("\0\0", pos)
+                    newpos = buff.find("\0\0", pos)
                     while newpos == -1:
                         if not buff.haveAllData:
                             try:
@@ -1980,7 +2214,7 @@ class DataCracker(object):
                             Debug(1, "data.find(00) returned -1, pos: %d" % pos)
                             break
 
-                        newpos = buff.data.find("\0\0", pos)
+                        newpos = buff.find("\0\0", pos)
 
                     if rating != 666:
                         break
@@ -1993,7 +2227,7 @@ class DataCracker(object):
                         break
 
                     newpos += 3 # find leaves us a position down, need to add one to get the null
-                    value = buff.data[pos:newpos - 2]
+                    value = buff[pos:newpos - 2]
                     rating = 2
 
                     if len(value) % 2 != 0:
@@ -2030,7 +2264,7 @@ class DataCracker(object):
                     defaultValue = node.defaultValue
 
                 newpos = pos + len(defaultValue)
-                value = buff.data[pos:newpos]
+                value = buff[pos:newpos]
                 if value == defaultValue:
                     rating = 2
                     break
@@ -2038,7 +2272,7 @@ class DataCracker(object):
                 else:
                     rating = 4
                     Debug(1, "%s_handleString: %s: No match [%s == %s] @ %d" % (
-                        '\t' * self.deepString, node.name, repr(buff.data[newpos:newpos + len(defaultValue)]),
+                        '\t' * self.deepString, node.name, repr(buff[newpos:newpos + len(defaultValue)]),
                         repr(defaultValue), pos))
                     break
 
@@ -2054,8 +2288,8 @@ class DataCracker(object):
 
                     # Keep all the data :)
                     Debug(1, "_handleString: Have all data, keeping it for me :)")
-                    value = buff.data[pos:]
-                    newpos = len(buff.data)
+                    value = buff[pos:]
+                    newpos = len(buff)
                     rating = 1
 
                 elif self._isTokenNext(node) is not None:
@@ -2067,8 +2301,8 @@ class DataCracker(object):
 
                     # 1. Locate staticNode position
                     val = staticNode.getValue()
-                    Debug(1, "Looking for [%s][%s]" % (repr(val), repr(buff.data[pos:])[:50]))
-                    valPos = buff.data[pos:].find(val)
+                    Debug(1, "Looking for [%s][%s]" % (repr(val), repr(buff[pos:pos + 50])))
+                    valPos = buff.find(val, pos)
                     while valPos == -1:
                         if buff.haveAllData:
                             newpos = pos
@@ -2086,19 +2320,19 @@ class DataCracker(object):
                             Debug(1, " :( Have all data")
                             break
 
-                        valPos = buff.data[pos:].find(val)
+                        valPos = buff.find(val, pos)
 
                     if rating == 4:
                         break
 
                     # 2. Subtract length
-                    newpos = (pos + valPos) - length
+                    newpos = valPos - length
 
                     # 3. Yuppie!
-                    value = buff.data[pos:newpos]
+                    value = buff[pos:newpos]
                     rating = 1
 
-                    Debug(1, "Found: [%d][%d:%d][%s]" % (length, self.parentPos + pos, self.parentPos + newpos, value))
+                    Debug(1, "Found: [%d][%d:%d][%s]" % (length, self.parentPos + pos, self.parentPos + newpos, value[:150]))
 
                 elif self._isLastUnsizedNode(node) is not None:
                     # Are all other nodes of deterministic size?
@@ -2109,8 +2343,8 @@ class DataCracker(object):
                         buff.readAll()
 
                     length = self._isLastUnsizedNode(node)
-                    newpos = len(buff.data) - length
-                    value = buff.data[pos:newpos]
+                    newpos = len(buff) - length
+                    value = buff[pos:newpos]
                     rating = 1
 
                 #elif self._isConstraintNext(node) != None:
@@ -2167,7 +2401,7 @@ class DataCracker(object):
 
                     lookRating = 666
                     newpos = pos
-                    dataLen = len(buff.data)
+                    dataLen = len(buff)
 
                     # If we have a following static just scan
                     # for it instead of calling lookAhead.
@@ -2176,7 +2410,7 @@ class DataCracker(object):
                         nextValue = nextNode.getValue()
                         nextValueLen = len(nextValue)
 
-                        newpos = buff.data.find(nextValue, pos)
+                        newpos = buff.find(nextValue, pos)
                         while newpos == -1:
                             if buff.haveAllData:
                                 value = ""
@@ -2190,12 +2424,12 @@ class DataCracker(object):
                                 rating = 4
                                 break
 
-                            newpos = buff.data.find(nextValue, pos)
+                            newpos = buff.find(nextValue, pos)
 
                         if rating == 4:
                             break
 
-                        value = buff.data[pos:newpos]
+                        value = buff[pos:newpos]
                         rating = 2
                         break
 
@@ -2205,7 +2439,7 @@ class DataCracker(object):
                         newpos += 1
                         lookRating = self._lookAhead(node, buff, newpos, parent)
 
-                    value = buff.data[pos:newpos]
+                    value = buff[pos:newpos]
 
                     if lookRating > 2:
                         rating = 3
@@ -2263,7 +2497,7 @@ class DataCracker(object):
             #
             # Note2: maxOccurs can lie if we are doingMinMax!
             #
-            if newpos < len(buff.data) and not inArray and not doingMinMax:
+            if newpos < len(buff) and not inArray and not doingMinMax:
                 # We didn't use it all up, sad for us!
                 Debug(1, "--- Didn't use all data, rating == 4")
                 rating = 4
@@ -2299,21 +2533,21 @@ class DataCracker(object):
 
         # See if we have enough data
 
-        if (pos + length) > len(buff.data):
+        if (pos + length) > len(buff):
             # need more
             try:
-                buff.read((pos + length) - len(buff.data))
+                buff.read((pos + length) - len(buff))
             except:
                 Debug(1, "_handleNumber(): Read failed: %s" % repr(sys.exc_info()))
                 pass
 
-            if (pos + length) > len(buff.data):
+            if (pos + length) > len(buff):
                 node.rating = None
                 return 4, pos
 
         # Get value based on element length
 
-        value = buff.data[pos:pos + length]
+        value = buff[pos:pos + length]
         newpos = pos + length
 
         # Build format string
@@ -2423,18 +2657,18 @@ class DataCracker(object):
         rating = 0
         length = node.length / 8
 
-        if (pos + length) > len(buff.data):
+        if (pos + length) > len(buff):
             # need more
             try:
-                buff.read((pos + length) - len(buff.data))
+                buff.read((pos + length) - len(buff))
             except:
                 pass
 
-            if (pos + length) > len(buff.data):
+            if (pos + length) > len(buff):
                 node.rating = None
                 return 4, pos
 
-        value = buff.data[pos:pos + length]
+        value = buff[pos:pos + length]
         newpos = pos + length
 
         if node.padding:
@@ -2549,7 +2783,7 @@ class DataCracker(object):
 
         # 1. Get the position to jump to
 
-        newpos = node.getPosition(pos, len(buff.data), buff.data)
+        newpos = node.getPosition(pos, len(buff), buff.data)
 
         # 2. Can we jump there?
 
@@ -2558,13 +2792,13 @@ class DataCracker(object):
             if not buff.haveAllData:
                 # Request more
                 try:
-                    buff.read((pos + newpos) - len(buff.data))
+                    buff.read((pos + newpos) - len(buff))
                 except:
                     pass
 
             if newpos > buff.data:
                 # Bad rating
-                Debug(1, "<--- SEEK TO %d FAILED, ONLY HAVE %d" % (newpos, len(buff.data)))
+                Debug(1, "<--- SEEK TO %d FAILED, ONLY HAVE %d" % (newpos, len(buff)))
                 return 4, pos
 
         elif newpos < 0:
@@ -2647,7 +2881,7 @@ class DataCracker(object):
             fullName = relation.parent.getFullname()
             Debug(1, "Size-of Fullname: " + fullName)
 
-            length = relation.getValue(True)
+            length = self._relationValue(relation)
             Debug(1, "Size-of Length: %s" % length)
 
             # We might not be ready to get this
@@ -2666,19 +2900,19 @@ class DataCracker(object):
             if length is None:
                 length = node.getLength()
 
-            if (pos + length) > len(buff.data):
+            if (pos + length) > len(buff):
                 if not buff.haveAllData:
                     try:
-                        buff.read((pos + length) - len(buff.data))
+                        buff.read((pos + length) - len(buff))
                     except:
                         pass
 
-            if (pos + length) > len(buff.data):
-                Debug(1, "_handleBlob: Not enough data, rating = 4: %d left" % (len(buff.data) - pos))
+            if (pos + length) > len(buff):
+                Debug(1, "_handleBlob: Not enough data, rating = 4: %d left" % (len(buff) - pos))
                 rating = 4
 
             else:
-                value = buff.data[pos:pos + length]
+                value = buff[pos:pos + length]
                 newpos = pos + length
                 rating = 2
 
@@ -2698,16 +2932,16 @@ class DataCracker(object):
             if self._nextNode(node) is None:
                 #print "--- Last element, snafing it all :)"
                 buff.readAll()
-                value = buff.data[pos:]
-                newpos = len(buff.data)
+                value = buff[pos:]
+                newpos = len(buff)
                 rating = 1
             elif self._isLastUnsizedNode(node) is not None:
                 # Are all other nodes of deterministic size?
                 Debug(1, "_handleBlob: self._isLastUnsizedNode(node)")
                 buff.readAll()
                 length = self._isLastUnsizedNode(node)
-                newpos = len(buff.data) - length
-                value = buff.data[pos:newpos]
+                newpos = len(buff) - length
+                value = buff[pos:newpos]
                 rating = 1
 
             elif self._isTokenNext(node) is not None:
@@ -2717,8 +2951,8 @@ class DataCracker(object):
                 valPos = -1
                 if isinstance(staticNode, Choice):
                     for n in staticNode:
-                        Debug(1, "Looking from choice for [%s][%s]" % (repr(n.choiceCache[2]), repr(buff.data[pos:])))
-                        valPos = buff.data[pos:].find(n.choiceCache[2])
+                        Debug(1, "Looking from choice for [%s][%s]" % (repr(n.choiceCache[2]), repr(buff[pos:pos + 150])))
+                        valPos = buff.find(n.choiceCache[2], pos)
                         if valPos != -1:
                             break
                     if valPos == -1:
@@ -2729,8 +2963,8 @@ class DataCracker(object):
                 else:
                     # 1. Locate staticNode position
                     val = staticNode.getValue()
-                    Debug(1, "Looking for [%s][%s]" % (repr(val), repr(buff.data[pos:])[:150]))
-                    valPos = buff.data[pos:].find(val)
+                    Debug(1, "Looking for [%s][%s]" % (repr(val), repr(buff[pos:pos + 150])))
+                    valPos = buff.find(val, pos)
                     while valPos == -1:
                         if buff.haveAllData:
                             newpos = pos
@@ -2742,14 +2976,14 @@ class DataCracker(object):
                             buff.read(1)
                         except:
                             pass
-                        valPos = buff.data[pos:].find(val)
+                        valPos = buff.find(val, pos)
                 if valPos != -1:
                     # 2. Subtract length
-                    newpos = (pos + valPos) - length
+                    newpos = valPos - length
                     # 3. Yuppie!
-                    value = buff.data[pos:newpos]
+                    value = buff[pos:newpos]
                     rating = 1
-                    Debug(1, "Found: [%d][%d:%d][%s]" % (length, self.parentPos + pos, self.parentPos + newpos, value))
+                    Debug(1, "Found: [%d][%d:%d][%s]" % (length, self.parentPos + pos, self.parentPos + newpos, value[:150]))
             else:
                 #if buff.haveAllData:
                 #	print "--- Was not last node"
@@ -2763,7 +2997,7 @@ class DataCracker(object):
                 if nextNode.isStatic:
                     nextValue = nextNode.getValue()
                     nextValueLen = len(nextValue)
-                    newpos = buff.data.find(nextValue, pos)
+                    newpos = buff.find(nextValue, pos)
                     while newpos != -1:
                         if buff.haveAllData:
                             rating = 4
@@ -2774,20 +3008,20 @@ class DataCracker(object):
                             buff.read(1)
                         except:
                             pass
-                        newpos = buff.data.find(nextValue, pos)
+                        newpos = buff.find(nextValue, pos)
                     if newpos != -1:
-                        value = buff.data[pos:newpos]
+                        value = buff[pos:newpos]
                         rating = 2
                 else:
                     # Lets try and remove all _lookAhead calls.
                     raise PeachException("Error, unable to determine size of blob [%s] while cracking." %
                                          node.getFullname())
-                    while lookRating > 2 and newpos < len(buff.data):
+                    while lookRating > 2 and newpos < len(buff):
                         #Debug(1, ".")
                         newpos += 1
                         lookRating = self._lookAhead(node, buff, newpos, parent)
                         #Debug(1, "newpos: %d lookRating: %d data: %d" % (newpos, lookRating, len(data)))
-                    while lookRating <= 2 and newpos < len(buff.data):
+                    while lookRating <= 2 and newpos < len(buff):
                         #Debug(1, ",")
                         newpos += 1
                         lookRating = self._lookAhead(node, buff, newpos, parent)
@@ -2797,7 +3031,7 @@ class DataCracker(object):
                     #if newpos >= len(data):
                     #	newpos -= 1
                     #	#raise str("Unable to parse out blob %s" % node.name)
-                    value = buff.data[pos:newpos]
+                    value = buff[pos:newpos]
                     rating = 2
                     #print "Found blob: [%s]" % value
 
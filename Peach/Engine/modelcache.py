@@ -0,0 +1,199 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import types
+import errno
+import hashlib
+import logging
+import tempfile
+import cPickle as pickle
+
+from Peach.Engine.dom import Element
+
+
+class _Uncacheable(Exception):
+    """
+    Data model refers to something we can not write to disk.
+    """
+
+
+class ModelCache(object):
+    """
+    On-disk cache of data models with seed data cracked into them.
+
+    Cracking a large seed can take minutes, loading the cracked model
+    takes milliseconds.  Entries are keyed by the pit, the data model
+    and the seed data, see L{key}.  Each entry is one file in
+    directory, once they add up to more than maxSize bytes the least
+    recently used ones are removed.
+
+    Note: Changes to Peach itself (e.g. the DataCracker) are not part
+      of the key, bump L{VERSION} or clear the directory.
+    """
+
+    #: Bump when cached entries can no longer be used
+    VERSION = 1
+
+    #: File extension of entries
+    EXTENSION = ".model"
+
+    def __init__(self, directory, maxSize=512 * 1024 * 1024):
+        #: Directory holding the entries
+        self.directory = directory
+        #: Size in bytes we keep the directory under
+        self.maxSize = maxSize
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @staticmethod
+    def defaultDirectory():
+        return os.path.join(os.path.expanduser("~"), ".peach", "models")
+
+    def key(self, pitHash, modelName, data):
+        """
+        Get the key of a cracked data model.
+
+        @type	pitHash: str
+        @param	pitHash: Hash of the pit, see L{ParseTemplate.HandleDocument}
+        @type	modelName: str
+        @param	modelName: Name of the data model
+        @type	data: str or mmap
+        @param	data: Seed data cracked into the data model, see L{PublisherBuffer.view}
+        @rtype: str
+        @return: key
+        """
+
+        digest = hashlib.sha1("%d\0%s\0%s\0" % (self.VERSION, pitHash, modelName))
+        digest.update(hashlib.sha1(data).digest())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.EXTENSION)
+
+    def load(self, key, model):
+        """
+        Turn model into the cracked data model stored under key.
+
+        @type	model: DataElement
+        @param	model: Data model the entry was made from
+        @rtype: tuple
+        @return: (True, crackPassed) on a hit, (False, None) otherwise
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fd:
+                unpickler = pickle.Unpickler(fd)
+                unpickler.persistent_load = {"model": model, "parent": model.parent}.__getitem__
+                crackPassed, state = unpickler.load()
+
+        except IOError:
+            return False, None
+
+        except Exception as e:
+            logging.warning("Removing unreadable model cache entry '%s': %s" % (path, e))
+            self._remove(path)
+            return False, None
+
+        state["parent"] = model.parent
+        model.__dict__.clear()
+        model.__dict__.update(state)
+
+        # Keep it from being the next one to go
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return True, crackPassed
+
+    def store(self, key, model, crackPassed):
+        """
+        Store cracked data model under key.  Models referring to other
+        elements outside of them or to bound methods are skipped.
+
+        @rtype: bool
+        @return: True if model was stored
+        """
+
+        state = model.__dict__.copy()
+        state.pop("_overlay", None)
+        parent = state.pop("parent", None)
+
+        def persistentId(obj):
+            if obj is model:
+                return "model"
+
+            if obj is parent and parent is not None:
+                return "parent"
+
+            if isinstance(obj, types.MethodType):
+                raise _Uncacheable("bound method %r" % obj)
+
+            if isinstance(obj, Element):
+                node = obj
+                while node is not None and node is not model:
+                    node = node.parent
+
+                if node is None:
+                    raise _Uncacheable("element '%s' outside of data model" % obj.getFullname())
+
+            return None
+
+        fd, tempPath = tempfile.mkstemp(self.EXTENSION, ".", self.directory)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickler = pickle.Pickler(fp, pickle.HIGHEST_PROTOCOL)
+                pickler.persistent_id = persistentId
+                pickler.dump((crackPassed, state))
+
+            os.rename(tempPath, self._path(key))
+
+        except Exception as e:
+            logging.debug("Not caching data model '%s': %s" % (model.name, e))
+            self._remove(tempPath)
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Remove least recently used entries until we are at or under
+        maxSize bytes.
+        """
+
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.EXTENSION) or name.startswith("."):
+                continue
+
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.maxSize:
+                break
+
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -1,7 +1,8 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-import sys, re, types, os, glob, logging
+import sys, re, types, os, logging
+import hashlib
 import traceback
 import logging
 from uuid import uuid1
@@ -300,6 +301,18 @@ class ParseTemplate(object):
             for k,v in list(child.items()):
                 child.set(k, self.substituteConfigVariables(v, final=True))
 
+        # Identifies the pit for ModelCache, Data elements are cracked
+        # further down so we need it now.  Agents, tests and runs are left
+        # out, macros for output paths, targets and the like are usually
+        # set there and they do not change how data is cracked.
+        digest = hashlib.sha1()
+        for child in ePeach.iterchildren():
+            if split_ns(child.tag)[1] not in ('Configuration', 'Agent', 'Test', 'Run'):
+                digest.update(etree.tostring(child))
+        for ns in peach.namespaces:
+            digest.update(getattr(ns, 'pitHash', ''))
+        peach.pitHash = digest.hexdigest()
+
         # Pass 2 -- Import
         for child in ePeach.iterchildren():
             child_tag = split_ns(child.tag)[1]
@@ -2163,17 +2176,14 @@ class ParseTemplate(object):
             data.fileName = self._getAttribute(node, 'fileName')
             if data.fileName.find('*') != -1:
                 data.fileGlob = data.fileName
-                for fpath in glob.glob(data.fileGlob):
-                    if data.is_valid(fpath):
-                        data.fileName = fpath
                 data.multipleFiles = True
             elif os.path.isdir(data.fileName):
                 data.folderName = data.fileName
-                for fname in os.listdir(data.folderName):
-                    fpath = os.path.join(data.folderName, fname)
-                    if data.is_valid(fpath):
-                        data.fileName = fpath
                 data.multipleFiles = True
+            if data.multipleFiles:
+                files = SeedCorpus.forData(data).files
+                if files:
+                    data.fileName = files[-1]
         if not os.path.isfile(data.fileName):
             raise PeachException("No sample data found matching requirements of <Data> element.")
 
@@ -2181,6 +2191,10 @@ class ParseTemplate(object):
         if node.get('recurse') is not None:
             data.recurse = bool(self._getAttribute(node, 'recurse'))
 
+        # attribute: weighted
+        if node.get('weighted') is not None:
+            data.weighted = self._getBooleanAttribute(node, 'weighted')
+
         # attribute: switchCount
         if node.get('switchCount') is not None:
             data.switchCount = int(self._getAttribute(node, 'switchCount'))
@@ -60,6 +60,9 @@ class StateEngine(object):
         #: Cache of generated XML
         self.cachedXml = None
 
+        #: Identifies the current run for TemplateOverlay.checkout
+        self.generation = None
+
     #: Background dom copier
     #self.domCopier = DomBackgroundCopier()
 
@@ -98,6 +101,7 @@ class StateEngine(object):
             pub.hasBeenStarted = False
 
         self.actionValues = []
+        self.generation = object()
 
         mutator.onStateMachineStarting(self)
 
@@ -169,6 +173,39 @@ class StateEngine(object):
 
         return None
 
+    def _copyTemplate(self, obj):
+        """
+        Make a fresh copy of obj.origionalTemplate with obj as parent.
+
+        The clone plan is kept on obj and rebuilt whenever the
+        origionalTemplate is swapped out (e.g. by a mutation strategy
+        switching files).
+        """
+
+        plan = getattr(obj, 'origionalTemplatePlan', None)
+        if plan is None or plan.root is not obj.origionalTemplate:
+            plan = obj.origionalTemplatePlan = ClonePlan(obj.origionalTemplate)
+
+        return plan.clone(obj)
+
+    def _checkoutTemplate(self, obj):
+        """
+        Get a fresh instance of obj.origionalTemplate with obj as parent.
+
+        Unlike L{_copyTemplate} the same instances are handed out in
+        every run, put back to the origionalTemplate state by their
+        TemplateOverlay.  A state running more than once in a run gets
+        another instance each time.  Use this for templates we only
+        mutate and render, data cracked into a template touches every
+        element so those are better off with a copy.
+        """
+
+        overlay = getattr(obj, 'origionalTemplateOverlay', None)
+        if overlay is None or overlay.template is not obj.origionalTemplate:
+            overlay = obj.origionalTemplateOverlay = TemplateOverlay(obj.origionalTemplate)
+
+        return overlay.checkout(obj, self.generation)
+
     def _runState(self, state, mutator):
         """
         Runs a specific State from a StateMachine.
@@ -203,8 +240,10 @@ class StateEngine(object):
                         c.template = None
                         ##while c.template == None:
                         ##	c.template = self.domCopier.getCopy(c.origionalTemplate)
-                        if c.template is None:
-                            c.template = c.origionalTemplate.copy(c)
+                        if c.elementType == 'actionresult':
+                            c.template = self._copyTemplate(c)
+                        else:
+                            c.template = self._checkoutTemplate(c)
                             #c.template = c.origionalTemplate.clone()
                         c.append(c.template)
 
@@ -227,7 +266,10 @@ class StateEngine(object):
             ##while action.template == None:
             ##	print "0"
             ##	action.template = self.domCopier.getCopy(action.origionalTemplate)
-            action.template = action.origionalTemplate.copy(action)
+            if action.type == 'input':
+                action.template = self._copyTemplate(action)
+            else:
+                action.template = self._checkoutTemplate(action)
             action.append(action.template)
 
         # Next setup a few things
@@ -384,11 +426,12 @@ class StateEngine(object):
 
             # Make a fresh copy of the template
             action.__delitem__(action.template.name)
-            action.template = action.origionalTemplate.copy(action)
+            action.template = self._copyTemplate(action)
             action.append(action.template)
 
             # Create buffer
             buff = PublisherBuffer(pub)
+            pub.currentAction = action.name
             self.dirtyXmlCache()
 
             # Crack data
@@ -2,6 +2,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import random
+import bisect
 import hashlib
 import logging
 
@@ -41,7 +42,12 @@ class RandomMutationStrategy(MutationStrategy):
         if node is not None and node.get("maxFieldsToMutate") is not None:
             self._n = int(node.get("maxFieldsToMutate"))
         self._dataModels = {}
+        #: K is field fullname, V is (mutator classes, cumulative weights)
         self._fieldMutators = {}
+        #: Weight tables shared between fields supporting the same mutators
+        self._weightTables = {}
+        #: K is (field fullname, mutator class), V is mutator instance
+        self._mutators = {}
         self._isFirstTestCase = True
         self._dataModelToChange = None
         self._random = random.Random()
@@ -66,6 +72,32 @@ class RandomMutationStrategy(MutationStrategy):
         """
         return len(node.getAllChildDataElements())
 
+    def _weightTable(self, mutators):
+        """
+        Return the (mutators, cumulative weights) table for a tuple of
+        mutator classes. Each mutator counts weight ** 4 times.
+        """
+        table = self._weightTables.get(mutators)
+        if table is None:
+            weights = []
+            total = 0
+            for m in mutators:
+                total += m.weight ** 4
+                weights.append(total)
+            table = self._weightTables[mutators] = (mutators, weights)
+        return table
+
+    def _chooseMutator(self, node):
+        """
+        Randomly pick one of the mutators for node by weight.
+        """
+        fullName = node.getFullname()
+        mutators, weights = self._fieldMutators[fullName]
+        # Same draw as random.choice() over weight ** 4 copies of each mutator
+        index = int(self._random.random() * (weights[-1] if weights else 0))
+        m = mutators[bisect.bisect_right(weights, index)]
+        return self._mutators[(fullName, m)]
+
     def currentMutator(self):
         """
         Return the current Mutator in use.
@@ -220,7 +252,8 @@ class RandomMutationStrategy(MutationStrategy):
                 and self.iterationCount % self.switchCount == 0:
             self.context = action.getRoot()
             # If a file fails to parse, don't exit the run, instead re-crack
-            # until we find a working file.
+            # until we find a working file.  Files which failed are not
+            # picked again.
             while True:
                 action.data.gotoRandomFile()
                 # Locate fresh copy of template with no data
@@ -244,6 +277,7 @@ class RandomMutationStrategy(MutationStrategy):
                     break
                 except Exception as e:
                     logging.warning(e)
+                    action.data.rejectFile()
             # Cache default values
             action.template = template
             template.getValue()
@@ -260,26 +294,25 @@ class RandomMutationStrategy(MutationStrategy):
             self._isFirstTestCase = True
             self._dataModels = {}
             self._fieldMutators = {}
+            self._mutators = {}
         if self._isFirstTestCase:
             fullName = dataModel.getFullname()
             if fullName not in self._dataModels:
                 self._dataModels[fullName] = self._getNodeCount(dataModel)
                 nodes = dataModel.getAllChildDataElements()
                 nodes.append(dataModel)
-                nonMutableNodes = []
                 for node in nodes:
                     if not node.isMutable:
-                        nonMutableNodes.append(node)
+                        continue
+                    fieldName = node.getFullname()
                     mutators = []
-                    self._fieldMutators[node.getFullname()] = mutators
                     for m in Engine.context.mutators:
                         if m.supportedDataElement(node):
                             # Need to create new instance from class
-                            for i in range(m.weight ** 4):
-                                mutators.append(m(Engine.context, node))
-                for node in nonMutableNodes:
-                    nodes.remove(node)
-                nonMutableNodes = None
+                            self._mutators[(fieldName, m)] = m(Engine.context, node)
+                            mutators.append(m)
+                    self._fieldMutators[fieldName] = \
+                        self._weightTable(tuple(mutators))
             return
         else:
             # Is this data model we are changing?
@@ -315,7 +348,7 @@ class RandomMutationStrategy(MutationStrategy):
                             fields, self._random.randint(1, len(fields)))
                     for node in sampleset:
                         try:
-                            mutator = self._random.choice(self._fieldMutators[node.getFullname()])
+                            mutator = self._chooseMutator(node)
                             fullName = node.getFullnameInDataModel()[len(dataModel.name) + 1:]
                             logging.debug("%s => %s" % (mutator.name, fullName or "N/A"))
                             # Since we are applying multiple mutations sometimes a mutation will fail.
@@ -331,7 +364,7 @@ class RandomMutationStrategy(MutationStrategy):
                 # Now perform mutations on fields
                 for node in fields:
                     try:
-                        mutator = self._random.choice(self._fieldMutators[node.getFullname()])
+                        mutator = self._chooseMutator(node)
                         fullName = node.getFullnameInDataModel()[len(dataModel.name) + 1:]
                         logging.debug("%s => %s" % (mutator.name, fullName or "N/A"))
                         # Since we are applying multiple mutations sometimes a
@@ -87,7 +87,35 @@ class SequentialMutationStrategy(MutationStrategy):
             except MutatorCompleted:
                 pass
             self._mutatorIndex += 1
-        # Fall through to here and move to next available field/mutator
+        self._nextAvailableMutator(dataModelName, fieldName)
+
+    def skip(self, count):
+        """
+        Skip ahead count test cases. Each mutator seeks on its own, so this
+        only walks the mutators being skipped over and not every iteration.
+        """
+        while count > 0:
+            if self._isFirstTestCase:
+                self.next()
+                count -= 1
+                continue
+            dataModelName = self._dataModels[self._dataModelIndex]
+            fieldName = self._dataModelFields[dataModelName][self._fieldIndex]
+            mutator = self._fieldMutators[fieldName][self._mutatorIndex]
+            skipped = mutator.skip(count)
+            count -= skipped
+            if count == 0:
+                return
+            # Mutator completed, which uses up a test case just like next()
+            count -= 1
+            self._mutatorIndex += 1
+            self._nextAvailableMutator(dataModelName, fieldName)
+
+    def _nextAvailableMutator(self, dataModelName, fieldName):
+        """
+        Move to the next available field/mutator starting from the current
+        indexes.
+        """
         while fieldName is None or \
                 self._mutatorIndex >= len(self._fieldMutators[fieldName]):
             self._mutatorIndex = 0
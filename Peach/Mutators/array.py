@@ -14,10 +14,11 @@ class ArrayVarianceMutator(Mutator):
     Change the length of arrays to count - N to count + N.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node, name="ArrayVarianceMutator"):
         Mutator.__init__(self)
-        #: Weight to be chosen randomly
-        ArrayVarianceMutator.weight = 2
         if not ArrayVarianceMutator.supportedDataElement(node):
             raise Exception("ArrayVarianceMutator created with bad node.")
         self.isFinite = True
@@ -53,6 +54,9 @@ class ArrayVarianceMutator(Mutator):
         if self._currentCount > self._maxCount:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', self._maxCount)
+
     def getCount(self):
         return self._maxCount - self._minCount
 
@@ -132,13 +136,14 @@ class ArrayVarianceMutator(Mutator):
 
 class ArrayNumericalEdgeCasesMutator(ArrayVarianceMutator):
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     _counts = None
 
     def __init__(self, peach, node):
         ArrayVarianceMutator.__init__(self, peach, node,
                                       "ArrayNumericalEdgeCasesMutator")
-        #: Weight to be chosen randomly
-        ArrayNumericalEdgeCasesMutator.weight = 2
         if self._counts is None:
             ArrayNumericalEdgeCasesMutator._counts = []
             gen = BadPositiveNumbersSmaller()
@@ -163,6 +168,18 @@ class ArrayNumericalEdgeCasesMutator(ArrayVarianceMutator):
             raise MutatorCompleted()
         self._currentCount = self._counts[self._countsIndex]
 
+    def skip(self, count):
+        skipped = max(0, min(count, len(self._counts) - 1 - self._countsIndex))
+        if skipped:
+            self._countsIndex += skipped
+            self._currentCount = self._counts[self._countsIndex]
+        if skipped < count:
+            try:
+                self.next()
+            except MutatorCompleted:
+                pass
+        return skipped
+
     def getCount(self):
         return len(self._counts)
 
@@ -182,6 +199,9 @@ class ArrayReverseOrderMutator(ArrayVarianceMutator):
     def next(self):
         raise MutatorCompleted()
 
+    def skip(self, count):
+        return Mutator.skip(self, count)
+
     def getCount(self):
         return 1
 
@@ -228,6 +248,9 @@ class ArrayRandomizeOrderMutator(ArrayVarianceMutator):
         if self._count > self._n:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._n)
+
     def getCount(self):
         return self._n
 
@@ -18,9 +18,11 @@ class DWORDSliderMutator(Mutator):
     @author Chris Clark
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        DWORDSliderMutator.weight = 2
         self.isFinite = True
         self.name = "DWORDSliderMutator"
         self._peach = peach
@@ -35,6 +37,9 @@ class DWORDSliderMutator(Mutator):
         if self._position >= self._len:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_position', self._len - 1)
+
     def getCount(self):
         return self._len
 
@@ -81,9 +86,11 @@ class BitFlipperMutator(Mutator):
     Flip a % of total bits in blob. Default % is 20.
     """
 
+    #: Weight to be chosen randomly
+    weight = 3
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        BitFlipperMutator.weight = 3
         self.isFinite = True
         self.name = "BitFlipperMutator"
         self._peach = peach
@@ -110,6 +117,9 @@ class BitFlipperMutator(Mutator):
         if self._current > self._count:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_current', self._count)
+
     def getCount(self):
         return self._count
 
@@ -55,6 +55,9 @@ class DataTreeDuplicateMutator(Mutator):
         if self._cnt > self._maxCount:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_cnt', self._maxCount)
+
     def getCount(self):
         return self._maxCount
 
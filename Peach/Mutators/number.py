@@ -13,9 +13,11 @@ class NumericalVarianceMutator(Mutator):
     Produce numbers that are defaultValue - N to defaultValue + N.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        NumericalVarianceMutator.weight = 2
         self.name = "NumericalVarianceMutator"
         self.isFinite = True
         self._count = None
@@ -45,6 +47,9 @@ class NumericalVarianceMutator(Mutator):
         if self._currentCount >= len(self._values):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._values) - 1)
+
     def getCount(self):
         return len(self._values)
 
@@ -102,12 +107,14 @@ class NumericalEdgeCaseMutator(Mutator):
     todo with defaultValue.
     """
 
+    #: Weight to be chosen randomly
+    weight = 3
+
     _values = None
     _allowedSizes = [8, 16, 24, 32, 64]
 
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        NumericalEdgeCaseMutator.weight = 3
         self.isFinite = True
         self.name = "NumericalEdgeCaseMutator"
         self._peach = peach
@@ -187,6 +194,9 @@ class NumericalEdgeCaseMutator(Mutator):
         if self._currentCount >= len(self._values[self._size]):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._values[self._size]) - 1)
+
     def getCount(self):
         if self._count is None:
             cnt = 0
@@ -252,10 +262,11 @@ class FiniteRandomNumbersMutator(Mutator):
     Produce a finite number of random numbers for each <Number> element.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        #: Weight to be chosen randomly
-        FiniteRandomNumbersMutator.weight = 2
         self.name = "FiniteRandomNumbersMutator"
         self._peach = peach
         self._countThread = None
@@ -273,6 +284,9 @@ class FiniteRandomNumbersMutator(Mutator):
         if self._currentCount > self._n:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', self._n)
+
     def getCount(self):
         return self._n
 
@@ -401,6 +415,9 @@ class NumericalEvenDistributionMutator(Mutator):
         if self._currentCount >= len(self._values[self._size]):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._values[self._size]) - 1)
+
     def getCount(self):
         return len(self._values[self._size])
 
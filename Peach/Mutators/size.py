@@ -10,9 +10,11 @@ class SizedVarianceMutator(Mutator):
     Change the length of sizes to count - N to count + N.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        SizedVarianceMutator.weight = 2
         self.isFinite = True
         self.name = "SizedVarianceMutator"
         self._peach = peach
@@ -36,6 +38,9 @@ class SizedVarianceMutator(Mutator):
         if self._currentCount >= len(self._range):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._range) - 1)
+
     def getCount(self):
         return len(self._range)
 
@@ -109,9 +114,11 @@ class SizedNumericalEdgeCasesMutator(Mutator):
     Change the length of sizes to numerical edge cases
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        SizedNumericalEdgeCasesMutator.weight = 2
         self.isFinite = True
         self.name = "SizedNumericalEdgeCasesMutator"
         self._peach = peach
@@ -167,6 +174,9 @@ class SizedNumericalEdgeCasesMutator(Mutator):
         if self._currentCount >= len(self._range):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._range) - 1)
+
     def getCount(self):
         return len(self._range)
 
@@ -243,9 +253,11 @@ class SizedDataVarianceMutator(Mutator):
     Size indicator will stay the same
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        SizedDataVarianceMutator.weight = 2
         self.isFinite = True
         self.name = "SizedDataVarianceMutator"
         self._peach = peach
@@ -269,6 +281,9 @@ class SizedDataVarianceMutator(Mutator):
         if self._currentCount >= len(self._range):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._range) - 1)
+
     def getCount(self):
         return len(self._range)
 
@@ -319,9 +334,11 @@ class SizedDataNumericalEdgeCasesMutator(Mutator):
     Change the length of sizes to numerical edge cases
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        SizedDataNumericalEdgeCasesMutator.weight = 2
         self.isFinite = True
         self.name = "SizedDataNumericalEdgeCasesMutator"
         self._peach = peach
@@ -377,6 +394,9 @@ class SizedDataNumericalEdgeCasesMutator(Mutator):
         if self._currentCount >= len(self._range):
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_currentCount', len(self._range) - 1)
+
     def getCount(self):
         return len(self._range)
 
@@ -36,6 +36,9 @@ class StringCaseMutator(Mutator):
         if self._index >= self._count:
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_index', self._count - 1)
+
     def getCount(self):
         return self._count
 
@@ -80,11 +83,12 @@ class UnicodeStringsMutator(Mutator):
     """
     This mutator generates unicode strings.
     """
+    #: Weight to be chosen randomly
+    weight = 2
     values = constants.UnicodeStringsMutator
 
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        UnicodeStringsMutator.weight = 2
         self.name = "UnicodeStringsMutator"
         if UnicodeStringsMutator.values is None:
             print("Initialize %s" % self.name)
@@ -129,6 +133,9 @@ class UnicodeStringsMutator(Mutator):
             self._count -= 1
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._maxCount - 1)
+
     def getCount(self):
         return self._maxCount
 
@@ -155,9 +162,11 @@ class ValidValuesMutator(Mutator):
     Allows different valid values to be specified.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        ValidValuesMutator.weight = 2
         self.name = "ValidValuesMutator"
         self.values = []
         self._genValues(node)
@@ -182,6 +191,9 @@ class ValidValuesMutator(Mutator):
             self._count -= 1
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._maxCount - 1)
+
     def getCount(self):
         return self._maxCount
 
@@ -208,12 +220,13 @@ class UnicodeBomMutator(Mutator):
     """
     Injects BOM markers into default value and longer strings.
     """
+    #: Weight to be chosen randomly
+    weight = 2
     values = constants.UnicodeBomMutator
     boms = ['\xFE\xFF', '\xFF\xEF', '\xEF\xBB\xBF']
 
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        UnicodeBomMutator.weight = 2
         self.name = "UnicodeBomMutator"
         if UnicodeBomMutator.values is None:
             print("Initialize %s" % self.name)
@@ -270,6 +283,9 @@ class UnicodeBomMutator(Mutator):
             self._count -= 1
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._maxCount - 1)
+
     def getCount(self):
         return self._maxCount
 
@@ -293,11 +309,13 @@ class UnicodeBadUtf8Mutator(Mutator):
     Generate bad UTF-8 strings.
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     values = constants.UnicodeBadUtf8Mutator
 
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        UnicodeBadUtf8Mutator.weight = 2
         self.name = "UnicodeBadUtf8Mutator"
         if UnicodeBadUtf8Mutator.values is None:
             print("Initialize %s" % self.name)
@@ -466,6 +484,9 @@ class UnicodeBadUtf8Mutator(Mutator):
             self._count -= 1
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._maxCount - 1)
+
     def getCount(self):
         return self._maxCount + 1
 
@@ -490,11 +511,13 @@ class UnicodeUtf8ThreeCharMutator(UnicodeBadUtf8Mutator):
     Generate long UTF-8 three byte strings
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     values = constants.UnicodeUtf8ThreeCharMutator
 
     def __init__(self, peach, node):
         UnicodeBadUtf8Mutator.__init__(self, peach, node)
-        UnicodeUtf8ThreeCharMutator.weight = 2
         self.name = "UnicodeUtf8ThreeCharMutator"
 
         if UnicodeUtf8ThreeCharMutator.values is None:
@@ -574,11 +597,13 @@ class StringMutator(Mutator):
     Apply StringFuzzer to each string node in DDT one Node at a time.
     """
 
+    #: Weight to be chosen randomly
+    weight = 3
+
     values = constants.StringMutator
 
     def __init__(self, peach, node):
         Mutator.__init__(self)
-        StringMutator.weight = 3
         self.name = "StringMutator"
         if StringMutator.values is None:
             print("Initialize {}".format(self.name))
@@ -610,6 +635,9 @@ class StringMutator(Mutator):
             self._count -= 1
             raise MutatorCompleted()
 
+    def skip(self, count):
+        return self._skipIndex(count, '_count', self._maxCount - 1)
+
     def getCount(self):
         return self._maxCount
 
@@ -633,9 +661,11 @@ class XmlW3CMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="xml"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        XmlW3CMutator.weight = 2
         self.name = "XmlW3CMutator"
         self._generator = XmlParserTests(None)
         gen = XmlParserTests(None)
@@ -661,9 +691,11 @@ class PathMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="path"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        PathMutator.weight = 2
         self.name = "PathMutator"
         self._generator = BadPath(None)
         gen = BadPath(None)
@@ -689,9 +721,11 @@ class HostnameMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="hostname"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        HostnameMutator.weight = 2
         self.name = "HostnameMutator"
         self._generator = BadHostname(None)
         gen = BadHostname(None)
@@ -718,9 +752,11 @@ class IpAddressMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="ipaddress"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        IpAddressMutator.weight = 2
         self.name = "IpAddressMutator"
         self._generator = BadIpAddress(None)
         gen = BadIpAddress(None)
@@ -746,9 +782,11 @@ class TimeMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="time"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        TimeMutator.weight = 2
         self.name = "TimeMutator"
         self._generator = BadTime(None)
         gen = BadTime(None)
@@ -802,9 +840,11 @@ class FilenameMutator(_SimpleGeneratorMutator):
     Example: <String><Hint name="type" value="filename"></String>
     """
 
+    #: Weight to be chosen randomly
+    weight = 2
+
     def __init__(self, peach, node):
         _SimpleGeneratorMutator.__init__(self, peach, node)
-        FilenameMutator.weight = 2
         self.name = "FilenameMutator"
         self._generator = BadFilename(None)
         gen = BadFilename(None)
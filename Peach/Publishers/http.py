@@ -1,6 +1,7 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import socket
 import urllib2
 import httplib
 
@@ -15,13 +16,28 @@ class HttpPost(Publisher):
     If called as a stream the data will be posted in the body.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, keepAlive="false"):
+        """
+        @type	url: string
+        @param	url: URL to post to
+        @type	keepAlive: string
+        @param	keepAlive: "true" to post over one HTTP/1.1 keep-alive
+                           connection across iterations
+        """
         Publisher.__init__(self)
         #: Indicates which method should be called.
         self.withNode = False
         self.url = url
         (self.scheme, self.netloc, self.path, self.query, self.frag) = httplib.urlsplit(url)
         self.headers = {'User-Agent': 'Mozilla/4.0 (compatible; MSIE 5.5; Windows NT)'}
+        self._keepAlive = str(keepAlive).lower() == "true"
+        #: Kept alive connection, None until the first send
+        self._conn = None
+
+    def finalize(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
     def connect(self):
         pass
@@ -45,12 +61,50 @@ class HttpPost(Publisher):
         """
         Publish some data
 
+        Responses other than 2xx raise urllib2.HTTPError.  With keepAlive
+        redirects are not followed, they raise as well.
+
         @type	data: string
         @param	data: Data to publish
         """
 
-        req = urllib2.Request(self.url, data, self.headers)
-        urllib2.urlopen(req)
+        if not self._keepAlive:
+            req = urllib2.Request(self.url, data, self.headers)
+            urllib2.urlopen(req)
+            return
+
+        selector = self.path or "/"
+        if self.query:
+            selector += "?" + self.query
+
+        # Post the same request urllib2 would
+        headers = dict(self.headers)
+        if "content-type" not in [name.lower() for name in headers]:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        # The server may have dropped the idle connection, so when the
+        # kept alive connection fails we reconnect and post once more.
+        for retry in (False, True):
+            if self._conn is None:
+                if self.scheme == "https":
+                    self._conn = httplib.HTTPSConnection(self.netloc)
+                else:
+                    self._conn = httplib.HTTPConnection(self.netloc)
+            try:
+                self._conn.request("POST", selector, data, headers)
+                response = self._conn.getresponse()
+                # Read all of the response so the connection can be reused
+                response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                self._conn.close()
+                self._conn = None
+                if retry:
+                    raise
+
+        # Error responses raise like they do from urllib2.urlopen
+        if not 200 <= response.status < 300:
+            raise urllib2.HTTPError(self.url, response.status, response.reason, response.msg, None)
 
     def receive(self, size=None):
         """
@@ -4,9 +4,12 @@
 import os
 import sys
 import time
+import errno
+import signal
+import threading
 
 from Peach.Engine.engine import Engine
-from Peach.publisher import Publisher
+from Peach.publisher import Publisher, waitForData
 
 
 class Command(Publisher):
@@ -32,6 +35,51 @@ class Command(Publisher):
         return os.spawnv(os.P_WAIT, method, realArgs)
 
 
+class _Reaper(object):
+    """
+    Reaps a child process from a thread blocked in waitpid() and
+    signals a pipe the moment it exits, so waiting for it neither
+    polls nor sleeps longer than needed.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        #: Exit status, None while running
+        self.status = None
+        self._read, self._write = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                _, self.status = os.waitpid(self.pid, 0)
+                break
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    break
+
+        # The write end is ours, the read end may be closed already
+        try:
+            os.write(self._write, "x")
+        except OSError:
+            pass
+        os.close(self._write)
+
+    def wait(self, timeout):
+        """
+        @type	timeout: float
+        @param	timeout: Seconds to wait, None waits forever
+        @rtype: bool
+        @return: True if the process exited
+        """
+        return waitForData(self._read, timeout)
+
+    def close(self):
+        os.close(self._read)
+
+
 class Launcher(Publisher):
     """
     Launch a program.
@@ -70,26 +118,22 @@ class Launcher(Publisher):
             realArgs.append(a)
 
         pid = os.spawnv(os.P_NOWAIT, self.command, realArgs)
-
-        for i in range(0, int(self.waitTime / 0.15)):
-            (pid1, ret) = os.waitpid(pid, os.WNOHANG)
-            if not (pid1 == 0 and ret == 0):
-                break
-
-            time.sleep(0.15)
+        reaper = _Reaper(pid)
 
         try:
-            import signal
+            if reaper.wait(self.waitTime):
+                return
 
             os.kill(pid, signal.SIGTERM)
-            time.sleep(0.25)
-            (pid1, ret) = os.waitpid(pid, os.WNOHANG)
-            if not (pid1 == 0 and ret == 0):
+            if reaper.wait(0.25):
                 return
 
             os.kill(pid, signal.SIGKILL)
+            reaper.wait(None)
         except:
             print(sys.exc_info())
+        finally:
+            reaper.close()
 
     def callWindows(self):
         """
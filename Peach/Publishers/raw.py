@@ -2,10 +2,9 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import socket
-import time
 import sys
 
-from Peach.publisher import Publisher
+from Peach.publisher import Publisher, waitForData
 
 
 class RawEther(Publisher):
@@ -63,23 +62,12 @@ class RawEther(Publisher):
         if size is not None:
             return self._socket.recv(size)
         else:
-            self._socket.setblocking(0)
-            timeout = self._timeout
-            beginTime = time.time()
             ret = ""
             try:
-                while True:
-                    if len(ret) > 0 or time.time() - beginTime > timeout:
-                        break
-                    try:
-                        ret += self._socket.recv(10000)
-                    except socket.error as e:
-                        if str(e).find("The socket operation could not "
-                                       "complete without blocking") == -1:
-                            raise
+                if waitForData(self._socket, self._timeout):
+                    ret = self._socket.recv(10000)
             except socket.error as e:
                 print("Socket:Receive(): Caught socket.error [{}]".format(e))
-            self._socket.setblocking(1)
             return ret
 
 
@@ -138,23 +126,12 @@ class Raw(Publisher):
         if size is not None:
             return self._socket.recv(size)
         else:
-            self._socket.setblocking(0)
-            timeout = self._timeout
-            beginTime = time.time()
             ret = ""
             try:
-                while True:
-                    if len(ret) > 0 or time.time() - beginTime > timeout:
-                        break
-                    try:
-                        ret += self._socket.recv(10000)
-                    except socket.error as e:
-                        if str(e).find("The socket operation could not "
-                                       "complete without blocking") == -1:
-                            raise
+                if waitForData(self._socket, self._timeout):
+                    ret = self._socket.recv(10000)
             except socket.error as e:
                 print("Socket:Receive(): Caught socket.error [{}]".format(e))
-            self._socket.setblocking(1)
             return ret
 
 
@@ -217,23 +194,12 @@ class RawIp(Publisher):
         if size is not None:
             return self._socket.recv(size)
         else:
-            self._socket.setblocking(0)
-            timeout = self._timeout
-            beginTime = time.time()
             ret = ""
             try:
-                while True:
-                    if len(ret) > 0 or time.time() - beginTime > timeout:
-                        break
-                    try:
-                        ret += self._socket.recv(10000)
-                    except socket.error as e:
-                        if str(e).find("The socket operation could not "
-                                       "complete without blocking") == -1:
-                            raise
+                if waitForData(self._socket, self._timeout):
+                    ret = self._socket.recv(10000)
             except socket.error as e:
                 print("Socket:Receive(): Caught socket.error [{}]".format(e))
-            self._socket.setblocking(1)
             return ret
 
 
@@ -301,23 +267,12 @@ class Raw6(Publisher):
         if size is not None:
             return self._socket.recv(size)
         else:
-            self._socket.setblocking(0)
-            timeout = self._timeout
-            beginTime = time.time()
             ret = ""
             try:
-                while True:
-                    if len(ret) > 0 or time.time() - beginTime > timeout:
-                        break
-                    try:
-                        ret += self._socket.recv(10000)
-                    except socket.error as e:
-                        if str(e).find("The socket operation could not "
-                                       "complete without blocking") == -1:
-                            raise
+                if waitForData(self._socket, self._timeout):
+                    ret = self._socket.recv(10000)
             except socket.error as e:
                 print("Socket:Receive(): Caught socket.error [{}]".format(e))
-            self._socket.setblocking(1)
             return ret
 
 
@@ -386,21 +341,10 @@ class RawIp6(Publisher):
         if size is not None:
             return self._socket.recv(size)
         else:
-            self._socket.setblocking(0)
-            timeout = self._timeout
-            beginTime = time.time()
             ret = ""
             try:
-                while True:
-                    if len(ret) > 0 or time.time() - beginTime > timeout:
-                        break
-                    try:
-                        ret += self._socket.recv(10000)
-                    except socket.error as e:
-                        if str(e).find("The socket operation could not "
-                                       "complete without blocking") == -1:
-                            raise
+                if waitForData(self._socket, self._timeout):
+                    ret = self._socket.recv(10000)
             except socket.error as e:
                 print("Socket:Receive(): Caught socket.error [{}]".format(e))
-            self._socket.setblocking(1)
             return ret
@@ -1,6 +1,7 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import errno
 import socket
 import time
 import sys
@@ -10,6 +11,8 @@ from Peach.Engine.common import PeachException
 from Peach.publisher import Publisher
 from Peach.publisher import Timeout
 from Peach.publisher import PublisherSoftException
+from Peach.publisher import waitForData
+from Peach.publisher import AdaptiveTimeout
 from Peach.Utilities.common import *
 import Peach
 
@@ -31,7 +34,7 @@ class Tcp(Publisher):
     """
 
 
-    def __init__(self, host, port, timeout=0.25, throttle=0):
+    def __init__(self, host, port, timeout=0.25, throttle=0, adaptive="false", keepAlive="false", retryDelay=10):
         """
         @type	host: string
         @param	host: Remote host
@@ -41,6 +44,13 @@ class Tcp(Publisher):
         @param	timeout: How long to wait for reponse
         @type	throttle: number
         @param	throttle: How long to wait between connections
+        @type	adaptive: string
+        @param	adaptive: "true" to learn shorter timeouts from response times
+        @type	keepAlive: string
+        @param	keepAlive: "true" to keep the connection open across iterations
+        @type	retryDelay: number
+        @param	retryDelay: Milliseconds to wait before retrying to connect,
+                            doubled on every retry up to a second
         """
         Publisher.__init__(self)
         self._host = host
@@ -60,6 +70,17 @@ class Tcp(Publisher):
         except:
             raise PeachException("The Tcp publisher parameter for throttle was not a valid number.")
 
+        try:
+            self._retryDelay = float(retryDelay)
+        except:
+            raise PeachException("The Tcp publisher parameter for retryDelay was not a valid number.")
+
+        if str(adaptive).lower() == "true":
+            self.adaptiveTimeout = AdaptiveTimeout(self._timeout)
+
+        self._keepAlive = str(keepAlive).lower() == "true"
+        #: Did sending or receiving fail on the kept alive connection
+        self._failed = False
         self._socket = None
 
     def start(self):
@@ -68,17 +89,27 @@ class Tcp(Publisher):
     def stop(self):
         self.close()
 
+    def finalize(self):
+        self._close()
+
     def connect(self):
         """
-        Create connection.
+        Create connection.  In keep-alive mode the open connection is
+        reused unless it failed or the peer closed it.
         """
-        self.close()
+        if self._keepAlive and self._socket is not None and not self._failed and self._drain():
+            self.buff = ""
+            self.pos = 0
+            return
+
+        self._close()
 
         if self._throttle > 0:
             time.sleep(self._throttle)
 
         # Try connecting many times
         # before we crash.
+        delay = self._retryDelay
         for i in range(30):
             try:
                 self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -90,8 +121,9 @@ class Tcp(Publisher):
                 self._socket = None
                 exception = sys.exc_info()
 
-            # Wait half sec and try again
-            time.sleep(1)
+            # Back off and try again
+            time.sleep(delay / 1000.0)
+            delay = min(delay * 2, 1000)
 
         if self._socket is None:
             value = ""
@@ -107,17 +139,42 @@ class Tcp(Publisher):
 
     def close(self):
         """
-        Close connection if open.
+        Close connection if open.  In keep-alive mode the connection
+        stays open for the next iteration until L{finalize}.
         """
+        if not self._keepAlive:
+            self._close()
+
+        self.buff = ""
+        self.pos = 0
+
+    def _close(self):
         try:
             if self._socket is not None:
                 self._socket.close()
         finally:
             self._socket = None
+            self._failed = False
 
         self.buff = ""
         self.pos = 0
 
+    def _drain(self):
+        """
+        Throw away data left over from the last iteration.
+
+        @rtype: bool
+        @return: False if the peer closed the connection
+        """
+        try:
+            while waitForData(self._socket, 0):
+                if not self._socket.recv(4096):
+                    return False
+        except socket.error:
+            return False
+
+        return True
+
     def send(self, data):
         """
         Send data via sendall.
@@ -133,7 +190,9 @@ class Tcp(Publisher):
 
         try:
             self._socket.sendall(data)
+            self.markSent()
         except:
+            self._failed = True
             if Peach.Engine.engine.Engine.debug:
                 print("Tcp: Sendall failed: " + str(sys.exc_info()[1]))
             raise PublisherSoftException("sendall failed: " + str(sys.exc_info()[1]))
@@ -155,20 +214,31 @@ class Tcp(Publisher):
         # Only ask for the diff of what we don't already have
         diffSize = (self.pos + size) - len(self.buff)
 
+        # A timeout of 0 would make the socket non-blocking, so a learned
+        # timeout which already ran out is a timeout right away.
+        timeout = self.getReceiveTimeout(self._timeout)
+        if timeout is not None and timeout <= 0:
+            self.recordResponse(False)
+            raise Timeout(
+                "Timed out waiting for data [%d:%d:%d:%d]" % (len(self.buff), (size + self.pos), size, diffSize))
+
         try:
             if Peach.Engine.engine.Engine.debug:
                 print("Asking for %d, need %d, have %d" % (size, diffSize, len(self.buff) - self.pos))
 
-            self._socket.settimeout(self._timeout)
+            self._socket.settimeout(timeout)
             ret = self._socket.recv(diffSize)
 
             if not ret:
                 # Socket was closed
+                self._failed = True
                 if Peach.Engine.engine.Engine.debug:
                     print("Socket is closed")
 
                 raise PublisherSoftException("Socket is closed")
 
+            self.recordResponse()
+
             if Peach.Engine.engine.Engine.debug:
                 print("<<<<<<<<<<<<<<<<<")
                 print("tcp.Tcp.receive():")
@@ -177,6 +247,7 @@ class Tcp(Publisher):
             self.buff += ret
 
         except socket.error as e:
+            self.recordResponse(False)
             if str(e).find('The socket operation could not complete without blocking') != -1:
                 if Peach.Engine.engine.Engine.debug:
                     print("timed out waiting for data")
@@ -185,12 +256,15 @@ class Tcp(Publisher):
                     "Timed out waiting for data [%d:%d:%d:%d]" % (len(self.buff), (size + self.pos), size, diffSize))
 
             elif str(e).find('An existing connection was forcibly') != -1:
+                self._failed = True
                 if Peach.Engine.engine.Engine.debug:
                     print("Socket was closed!")
 
                 raise PublisherSoftException("Socket is closed")
 
             else:
+                if not isinstance(e, socket.timeout) and e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self._failed = True
                 if Peach.Engine.engine.Engine.debug:
                     print("recv failed: " + str(sys.exc_info()[1]))
 
@@ -210,30 +284,33 @@ class Tcp(Publisher):
         @rtype: string
         @return: received data.
         """
-        self._socket.settimeout(self._timeout)
-
         try:
-            ret = self._socket.recv(4096)
+            if waitForData(self._socket, self.getReceiveTimeout(self._timeout)):
+                ret = self._socket.recv(4096)
 
-            if not ret:
-                raise PublisherSoftException("Socket is closed")
+                if not ret:
+                    self._failed = True
+                    raise PublisherSoftException("Socket is closed")
 
-            if Peach.Engine.engine.Engine.debug:
-                print("<<<<<<<<<<<<<<<<<")
-                print("tcp.Tcp.receive():")
-                printHex(ret)
+                self.recordResponse()
 
-            self.buff += ret
+                if Peach.Engine.engine.Engine.debug:
+                    print("<<<<<<<<<<<<<<<<<")
+                    print("tcp.Tcp.receive():")
+                    printHex(ret)
+
+                self.buff += ret
+            else:
+                self.recordResponse(False)
 
         except socket.error as e:
             if str(e).find('The socket operation could not complete without blocking') == -1:
                 pass
 
             else:
+                self._failed = True
                 raise PublisherSoftException("recv failed: " + str(sys.exc_info()[1]))
 
-        self._socket.settimeout(None)
-
         ret = self.buff[self.pos:]
         self.pos = len(self.buff)
         return ret
@@ -257,8 +334,8 @@ class TcpListener(Tcp):
      * close - Close a client connection
     """
 
-    def __init__(self, host, port, timeout=0.25):
-        Tcp.__init__(self, host, port, timeout)
+    def __init__(self, host, port, timeout=0.25, adaptive="false"):
+        Tcp.__init__(self, host, port, timeout, 0, adaptive)
 
         self._listen = None
         self._clientAddr = None
@@ -16,12 +16,14 @@ class Udp(Publisher):
     A simple UDP publisher.
     """
 
-    def __init__(self, host, port, timeout=2):
+    def __init__(self, host, port, timeout=2, adaptive="false"):
         """
         @type	host: string
         @param	host: Remote hostname
         @type	port: number
         @param	port: Remote port
+        @type	adaptive: string
+        @param	adaptive: "true" to learn shorter timeouts from response times
         """
         Publisher.__init__(self)
         self._host = host
@@ -31,6 +33,9 @@ class Udp(Publisher):
         if self._timeout is None:
             self._timeout = 2
 
+        if str(adaptive).lower() == "true":
+            self.adaptiveTimeout = AdaptiveTimeout(self._timeout)
+
         self._socket = None
         self.buff = ""
         self.pos = 0
@@ -64,14 +69,18 @@ class Udp(Publisher):
         """
         try:
             self._socket.sendall(data)
+            self.markSent()
             Debug(data)
         except socket.error:
             pass
 
     def receive(self, size=None):
         try:
-            self._socket.settimeout(self._timeout)
+            if not waitForData(self._socket, self.getReceiveTimeout(self._timeout)):
+                self.recordResponse(False)
+                raise Timeout("")
             data, addr = self._socket.recvfrom(65565)
+            self.recordResponse()
             Debug(data)
             if hasattr(self, "publisherBuffer"):
                 self.publisherBuffer.haveAllData = True
@@ -85,12 +94,14 @@ class Udp6(Publisher):
     A simple UDP publisher.
     """
 
-    def __init__(self, host, port, timeout=2):
+    def __init__(self, host, port, timeout=2, adaptive="false"):
         """
         @type	host: string
         @param	host: Remote hostname
         @type	port: number
         @param	port: Remote port
+        @type	adaptive: string
+        @param	adaptive: "true" to learn shorter timeouts from response times
         """
         Publisher.__init__(self)
         self._host = host
@@ -100,6 +111,9 @@ class Udp6(Publisher):
         if self._timeout is None:
             self._timeout = 2
 
+        if str(adaptive).lower() == "true":
+            self.adaptiveTimeout = AdaptiveTimeout(self._timeout)
+
         self._socket = None
         self.buff = ""
         self.pos = 0
@@ -134,14 +148,18 @@ class Udp6(Publisher):
         """
         try:
             self._socket.sendall(data)
+            self.markSent()
         except socket.error:
             pass
 
     def receive(self, size=None):
         data = None
         try:
-            self._socket.settimeout(self._timeout)
+            if not waitForData(self._socket, self.getReceiveTimeout(self._timeout)):
+                self.recordResponse(False)
+                raise Timeout("")
             data, addr = self._socket.recvfrom(65565)
+            self.recordResponse()
 
             if hasattr(self, "publisherBuffer"):
                 self.publisherBuffer.haveAllData = True
@@ -17,6 +17,7 @@ import email.message
 import email.parser
 
 from Peach.publisher import Publisher
+from Peach.Engine.engine import Engine
 from Peach.Engine.common import PeachException
 from Peach.Utilities.network import getUnboundPort
 
@@ -36,7 +37,7 @@ class WebSocketFilePublisher(Publisher):
     }
 
     # TODO: Make it possible to support **kwargs for Publishers
-    def __init__(self, host, port, template, publish, storage=None):
+    def __init__(self, host, port, template, publish, storage=None, batch=1):
         Publisher.__init__(self)
 
         self._host = host
@@ -49,6 +50,8 @@ class WebSocketFilePublisher(Publisher):
         self._client = None
         self._clientAddr = None
         self._contentTemplate = None
+        #: Test cases not sent yet, as (iteration, data)
+        self._pending = []
 
         try:
             socket.gethostbyaddr(self._host)
@@ -64,6 +67,14 @@ class WebSocketFilePublisher(Publisher):
             raise PeachException(
                 "Publisher's storage parameter needs to be set if not using Base64.")
 
+        try:
+            self._batch = int(batch)
+        except ValueError:
+            raise PeachException("WebSocket publisher batch is not a valid number: %s" % batch)
+
+        if self._batch > 1 and self._publish != "base64":
+            raise PeachException("WebSocket publisher can only batch test cases when using Base64.")
+
     def initialize(self):
         if not self._port:
             self._port = getUnboundPort()
@@ -103,13 +114,8 @@ class WebSocketFilePublisher(Publisher):
             self._initialStart = False
             self._possiblePeerCrash = False
 
-            self._client.settimeout(0.01)
-            while True:
-                try:
-                    _, headers = _str_t(self._client.recv(1024), 'ascii').split('\r\n', 1)
-                    break
-                except socket.timeout:
-                    continue
+            # The client socket blocks, recv sleeps until the request arrives
+            _, headers = _str_t(self._client.recv(1024), 'ascii').split('\r\n', 1)
             headers = email.parser.HeaderParser().parsestr(headers)
             #logger.debug(headers)
             # TODO(jschwartzentruber): validate request/headers
@@ -161,22 +167,93 @@ class WebSocketFilePublisher(Publisher):
         self._client.sendall(out)
 
     def send(self, data):
-        if self._storagePath:
-            self._storeTestcase(data)
+        iteration = Engine.context.testCount if Engine.context is not None else None
+
+        if self._batch > 1:
+            # Send once we have a full batch, see _evaluate()
+            self._pending.append((iteration, data))
+            if len(self._pending) < self._batch:
+                return
+            cases, self._pending = self._pending, []
+        else:
+            if self._storagePath:
+                self._storeTestcase(data)
+            cases = [(iteration, data)]
+
+        self._evaluate(cases)
 
-        templateData = self._prepareBrowserTemplate(data)
+    def _evaluate(self, cases):
+        """
+        Send test cases and have the browser run them in order.  The
+        browser reports every completed test case, so if it crashes
+        we know which test case it was on.
 
-        logger.debug("Sending packet to %s:%d" % (self._clientAddr[0], self._clientAddr[1]))
+        @type	cases: list
+        @param	cases: (iteration, data) of each test case
+        """
+
+        self.faultTestCase = None
+        logger.debug("Sending {} test case(s) to {}:{}".format(len(cases), self._clientAddr[0], self._clientAddr[1]))
         try:
-            self._send(1, ('{"type":"template", "content": "%s"}\n' % templateData).encode('utf8'))
+            for _, data in cases:
+                templateData = self._prepareBrowserTemplate(data)
+                self._send(1, ('{"type":"template", "content": "%s"}\n' % templateData).encode('utf8'))
             self._send(1, '{"type":"msg", "content": "evaluate"}\n'.encode('utf8'))
         except socket.error as msg:
             logger.debug("Send failed! Reason: %s" % msg)
             self._setPossiblePeerCrash()
+            self._reportCrash(cases)
+            return
+        logger.debug("Sent successfully!")
+
+        completed = 0
+        while True:
+            response = self.receive()
+            if self._possiblePeerCrash:
+                self._reportCrash(cases[completed:])
+                return
+            try:
+                msg = json.loads(response).get("msg", None)
+            except (ValueError, AttributeError):
+                msg = None
+            if msg == "Case complete":
+                completed += 1
+            elif msg not in ("Client ready", "pong"):
+                # "Evaluation complete"
+                return
+
+    def _reportCrash(self, cases):
+        """
+        Blame the crash on the first test case which did not complete,
+        the engine files the fault under its iteration and data.  The
+        test cases after it run with the next batch.
+        """
+
+        if len(cases) == 0 or self._batch == 1:
             return
-        logger.debug("Sent successfully! ({} bytes)".format(len(templateData)))
 
-        self.receive()
+        iteration, data = cases[0]
+        logger.warning("Peer crashed on the test case of iteration {}, {} later test case(s) "
+                       "will run again.".format(iteration, len(cases) - 1))
+        self.faultTestCase = (iteration, data)
+        self._pending = cases[1:] + self._pending
+        if self._storagePath:
+            self._storeTestcase(data)
+
+    def _recv(self, size):
+        """
+        Receive exactly size bytes, fewer only if the peer closed the
+        connection.
+        """
+
+        data = []
+        while size > 0:
+            chunk = self._client.recv(size)
+            if not chunk:
+                break
+            data.append(chunk)
+            size -= len(chunk)
+        return "".join(data)
 
     def receive(self):
         buf = []
@@ -185,10 +262,7 @@ class WebSocketFilePublisher(Publisher):
         try:
             while True:
                 try:
-                    data = struct.unpack('BB', self._client.recv(2))
-                except socket.timeout:
-                    # no data
-                    continue
+                    data = struct.unpack('BB', self._recv(2))
                 except struct.error:
                     break  # chrome doesn't send a close-frame
                 fin, mask = bool(data[0] & 0x80), bool(data[1] & 0x80)
@@ -199,11 +273,11 @@ class WebSocketFilePublisher(Publisher):
                     continue
                 length = data[1] & 0x7F
                 if length == 126:
-                    length = struct.unpack('!H', self._client.recv(2))[0]
+                    length = struct.unpack('!H', self._recv(2))[0]
                 elif length == 127:
-                    length = struct.unpack('!Q', self._client.recv(8))[0]
-                mask = bytearray(self._client.recv(4)) if mask else None
-                data = bytearray(self._client.recv(length))
+                    length = struct.unpack('!Q', self._recv(8))[0]
+                mask = bytearray(self._recv(4)) if mask else None
+                data = bytearray(self._recv(length))
                 if mask is not None:
                     data = bytearray((b ^ mask[i % 4]) for (i, b) in enumerate(data))
                 if opcode == 'continue':
@@ -246,7 +320,7 @@ class WebSocketFilePublisher(Publisher):
             logger.debug("WARNING: JSON object is corrupted: {!r}".format(response))
             return response
 
-        if parsedResponse.get("msg", None) == "Evaluation complete":
+        if parsedResponse.get("msg", None) in ("Evaluation complete", "Case complete", "Client ready"):
             logger.debug("Response: {}".format(parsedResponse.get("msg")))
         else:
             logger.debug("WARNING: Unexpected response: {!r}".format(response))
@@ -267,6 +341,12 @@ class WebSocketFilePublisher(Publisher):
         pass
 
     def finalize(self):
+        if self._pending and self._client and not self._possiblePeerCrash:
+            cases, self._pending = self._pending, []
+            self._evaluate(cases)
+        if self._pending:
+            logger.warning("{} test case(s) were not run, the peer crashed on the last batch.".format(
+                len(self._pending)))
         logger.debug("Destroying WebSocket Publisher.")
         if self._client:
             self._client.close()
@@ -0,0 +1,159 @@
+/* This Source Code Form is subject to the terms of the Mozilla Public
+ * License, v. 2.0. If a copy of the MPL was not distributed with this
+ * file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+
+/*
+ * Fork server for the ForkServer monitor in Peach/Agent/process.py.
+ *
+ * Loaded with LD_PRELOAD, it takes over right before main() runs, so
+ * after exec, dynamic linking and all constructors.  For every request
+ * on CONTROL_FD it forks a child which runs main() and reports the
+ * child's pid and then its wait status on STATUS_FD.
+ *
+ * Request:  uint32 length, then length bytes of NUL separated arguments
+ *           replacing argv[1:], or length 0 to keep the original ones.
+ * Replies:  uint32 HELLO once, then uint32 pid and uint32 wait status
+ *           per request.  All integers in host byte order.
+ *
+ * Build:    cc -shared -fPIC -O2 -o forkserver.so forkserver.c -ldl
+ */
+
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+
+#define CONTROL_FD 198
+#define STATUS_FD 199
+#define HELLO 0x50454143 /* "PEAC" */
+
+typedef int (*main_t)(int, char **, char **);
+typedef int (*libc_start_main_t)(main_t, int, char **, void (*)(void), void (*)(void), void (*)(void), void *);
+
+static main_t real_main;
+
+static int read_all(int fd, void *buf, size_t len)
+{
+    char *pos = buf;
+    while (len > 0) {
+        ssize_t n = read(fd, pos, len);
+        if (n < 0 && errno == EINTR)
+            continue;
+        if (n <= 0)
+            return -1;
+        pos += n;
+        len -= n;
+    }
+    return 0;
+}
+
+static int write_all(int fd, const void *buf, size_t len)
+{
+    const char *pos = buf;
+    while (len > 0) {
+        ssize_t n = write(fd, pos, len);
+        if (n < 0 && errno == EINTR)
+            continue;
+        if (n <= 0)
+            return -1;
+        pos += n;
+        len -= n;
+    }
+    return 0;
+}
+
+static int run_child(int argc, char **argv, char **envp, char *args, uint32_t length)
+{
+    char **child_argv;
+    int child_argc = 1;
+    uint32_t i;
+
+    close(CONTROL_FD);
+    close(STATUS_FD);
+
+    if (args == NULL)
+        return real_main(argc, argv, envp);
+
+    for (i = 0; i < length; i++)
+        if (args[i] == '\0')
+            child_argc++;
+
+    child_argv = calloc(child_argc + 1, sizeof(char *));
+    if (child_argv == NULL)
+        _exit(1);
+    child_argv[0] = argv[0];
+    child_argc = 1;
+    child_argv[child_argc++] = args;
+    for (i = 0; i + 1 < length; i++)
+        if (args[i] == '\0')
+            child_argv[child_argc++] = &args[i + 1];
+    child_argv[child_argc] = NULL;
+
+    return real_main(child_argc, child_argv, envp);
+}
+
+static int serve(int argc, char **argv, char **envp)
+{
+    uint32_t word = HELLO;
+
+    if (write_all(STATUS_FD, &word, sizeof(word)) < 0)
+        /* Not started by Peach after all */
+        return real_main(argc, argv, envp);
+
+    for (;;) {
+        uint32_t length;
+        char *args = NULL;
+        pid_t pid;
+        int status;
+
+        if (read_all(CONTROL_FD, &length, sizeof(length)) < 0)
+            _exit(0);
+
+        if (length > 0) {
+            /* One more NUL terminates the last argument */
+            args = calloc(length + 1, 1);
+            if (args == NULL || read_all(CONTROL_FD, args, length) < 0)
+                _exit(1);
+        }
+
+        pid = fork();
+        if (pid < 0)
+            _exit(1);
+        if (pid == 0)
+            return run_child(argc, argv, envp, args, length);
+
+        free(args);
+        word = (uint32_t)pid;
+        if (write_all(STATUS_FD, &word, sizeof(word)) < 0)
+            _exit(1);
+
+        while (waitpid(pid, &status, 0) < 0)
+            if (errno != EINTR)
+                _exit(1);
+
+        word = (uint32_t)status;
+        if (write_all(STATUS_FD, &word, sizeof(word)) < 0)
+            _exit(1);
+    }
+}
+
+int __libc_start_main(main_t main, int argc, char **argv, void (*init)(void), void (*fini)(void),
+                      void (*rtld_fini)(void), void *stack_end)
+{
+    libc_start_main_t real_start = (libc_start_main_t)dlsym(RTLD_NEXT, "__libc_start_main");
+
+    if (getenv("PEACH_FORKSERVER") != NULL) {
+        /* Processes started by the target are not fork servers */
+        unsetenv("PEACH_FORKSERVER");
+        unsetenv("LD_PRELOAD");
+        real_main = main;
+        main = serve;
+    }
+
+    return real_start(main, argc, argv, init, fini, rtld_fini, stack_end);
+}
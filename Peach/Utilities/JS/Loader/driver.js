@@ -16,6 +16,8 @@ var buffer = "";
 var testQueue = new Array();
 // Ready variable
 var ready = false;
+// If we are running the tests of an evaluate command
+var evaluating = false;
 // If log() should also dump()
 var logDump = true;
 
@@ -173,6 +175,7 @@ function processJSONLine(data) {
 	    // If we don't have any tests at this point (which does not make sense
 	    // but is perfectly valid), we directly respond to the server again.
         if (testQueue.length > 0) {
+          evaluating = true;
 	      processTest(testQueue.shift());
         } else {
           ws.send('{"msg": "Evaluation complete"}\n');
@@ -297,19 +300,23 @@ function addChildImageJPEG(data) {
 }
 
 function completedChild() {
+  if (evaluating) {
+    // Report every test, so the server can tell which one
+    // we were running if we crash.
+    ws.send('{"msg": "Case complete"}\n');
+  }
   if (testQueue.length > 0) {
     // Process the next test. This call will cause this
     // function to be called again once that test is complete.
     processTest(testQueue.shift());
-  } else {
-    if (!ready) {
-      // request the first testcase
-      //ws.send('{"msg": "Client ready"}\n');
-      ws.send('{"msg": "Evaluation complete"}\n');
-      ready = true;
-    } else {
-      ws.send('{"msg": "Evaluation complete"}\n');
-    }
+  } else if (evaluating) {
+    evaluating = false;
+    ready = true;
+    ws.send('{"msg": "Evaluation complete"}\n');
+  } else if (!ready) {
+    // request the first testcase
+    ws.send('{"msg": "Client ready"}\n');
+    ready = true;
   }
 }
 
@@ -0,0 +1,601 @@
+#!/usr/bin/env python
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Micro benchmarks for the hot paths of a fuzzing iteration.
+
+Usage:
+
+    python -m Peach.Utilities.benchmark clone -synthetic 5000
+    python -m Peach.Utilities.benchmark render -synthetic 5000
+    python -m Peach.Utilities.benchmark scaling -sizes 1000 10000 100000
+    python -m Peach.Utilities.benchmark scaling -sizes 1000 2000 4000 8000 -valueSize 10000
+    python -m Peach.Utilities.benchmark clone -pit Pits/Files/blob.xml -model File -sample file.bin
+    python -m Peach.Utilities.benchmark crack -cues 20 40 60
+    python -m Peach.Utilities.benchmark crack -pit Pits/Files/blob.xml -model File -sample a.bin b.bin
+    python -m Peach.Utilities.benchmark setattr -cues 40
+    python -m Peach.Utilities.benchmark agent -monitors 3
+    python -m Peach.Utilities.benchmark agent -agents 3 -latency 2
+    python -m Peach.Utilities.benchmark transport -size 4194304
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+
+from Peach.Engine.dom import *
+from Peach.Engine.common import *
+from Peach.Engine.parser import ParseTemplate
+from Peach.Engine.incoming import DataCracker
+from Peach.publisher import PublisherBuffer
+from Peach.agent import AgentClient, AgentPlexer, AgentXmlRpc, AgentFactory, Monitor
+
+
+def timeIt(func, iterations):
+    """
+    Run func iterations times, returns iterations per second.
+    """
+
+    start = time.time()
+    for _ in xrange(iterations):
+        func()
+    elapsed = time.time() - start
+
+    if elapsed == 0:
+        return float('inf')
+
+    return iterations / elapsed
+
+
+def syntheticModel(nodes, blockSize=50, valueSize=None):
+    """
+    Build a data model with roughly nodes elements.  Children are grouped
+    into blocks of blockSize, each block has a size relation.  Strings
+    are padded out to valueSize bytes if given.
+    """
+
+    template = Template("Synthetic")
+    count = 0
+    while count < nodes:
+        block = Block("Block%d" % count, template)
+        template.append(block)
+
+        length = Number("Length", block)
+        length.size = 32
+        relation = Relation(None, length)
+        relation.type = 'size'
+        relation.of = "Data"
+        length.relations.append(relation)
+        block.append(length)
+
+        data = Block("Data", block)
+        block.append(data)
+
+        for i in range(blockSize):
+            if i % 2:
+                child = Number("Field%d" % i, data)
+                child.size = 16
+                child.defaultValue = str(i)
+            else:
+                child = String("Field%d" % i, data)
+                child.defaultValue = "value %d" % i
+                if valueSize is not None:
+                    child.defaultValue = child.defaultValue.ljust(valueSize, "A")
+            data.append(child)
+
+        count += blockSize + 3
+
+    template.BuildRelationCache()
+    return template
+
+
+def loadModel(pit, modelName, sample=None):
+    """
+    Load a data model from a pit, optionally cracking sample into it.
+    """
+
+    if not pit.startswith("file:"):
+        pit = "file:" + pit
+
+    peach = ParseTemplate({}).parse(pit)
+    model = peach.templates[modelName].copy(peach)
+
+    if sample is not None:
+        with open(sample, "rb") as fd:
+            data = fd.read()
+
+        cracker = DataCracker(peach)
+        cracker.optmizeModelForCracking(model, True)
+        cracker.crackData(model, PublisherBuffer(None, data, True))
+
+    model.BuildRelationCache()
+    return model
+
+
+def benchClone(model, iterations, mutatedFields=5):
+    """
+    Compare the old pickle copy against a precomputed clone plan and a
+    copy-on-write overlay.
+    """
+
+    model.getValue()
+    nodeCount = len(model.getAllChildDataElements()) + 1
+    print("Model '%s' has %d data elements." % (model.name, nodeCount))
+
+    pickled = timeIt(lambda: model.pickleCopy(None), iterations)
+    oneShot = timeIt(lambda: model.copy(None), iterations)
+
+    plan = ClonePlan(model)
+    planned = timeIt(lambda: plan.clone(None), iterations)
+
+    # Overlay instances are reused, so mutate a few fields each time
+    # to give checkout something to put back.
+    overlay = TemplateOverlay(model)
+    fields = [node for node in overlay.checkout(None).getAllChildDataElements()
+              if not isinstance(node, ElementWithChildren) or len(node) == 0]
+    fields = fields[::max(1, len(fields) / mutatedFields)][:mutatedFields]
+
+    def checkout():
+        overlay.checkout(None)
+        for node in fields:
+            node.currentValue = "A"
+
+    overlaid = timeIt(checkout, iterations)
+
+    print("  pickle copy:    %10.1f copies/sec" % pickled)
+    print("  copy():         %10.1f copies/sec (%.1fx)" % (oneShot, oneShot / pickled))
+    print("  ClonePlan:      %10.1f copies/sec (%.1fx)" % (planned, planned / pickled))
+    print("  TemplateOverlay:%10.1f copies/sec (%.1fx, %d fields mutated)" % (
+        overlaid, overlaid / pickled, len(fields)))
+
+
+def benchRender(model, iterations):
+    """
+    Compare a full render of model against a render after changing a
+    single field.
+    """
+
+    model.getValue()
+    nodeCount = len(model.getAllChildDataElements()) + 1
+    print("Model '%s' has %d data elements." % (model.name, nodeCount))
+
+    fields = [node for node in model.getAllChildDataElements()
+              if not isinstance(node, ElementWithChildren) or len(node) == 0]
+    field = fields[len(fields) / 2]
+
+    def full():
+        model.resetDataModel()
+        model.getValue()
+
+    def oneField():
+        field.currentValue = "A"
+        model.getValue()
+
+    fullRate = timeIt(full, iterations)
+    oneFieldRate = timeIt(oneField, iterations)
+
+    print("  full render:    %10.1f renders/sec" % fullRate)
+    print("  one field:      %10.1f renders/sec (%.1fx)" % (oneFieldRate, oneFieldRate / fullRate))
+
+
+def benchScaling(sizes, iterations, valueSize=None):
+    """
+    Full render of growing synthetic models, plain and into a
+    StreamBuffer.  Linear rendering keeps the time per element flat
+    as the model grows.
+    """
+
+    print("%10s %12s %14s %14s" % ("elements", "bytes", "usec/element", "stream usec/el"))
+
+    for size in sizes:
+        # One flat block, the worst case for adding strings together
+        model = syntheticModel(size, size, valueSize)
+        nodeCount = len(model.getAllChildDataElements()) + 1
+
+        def render():
+            model.resetDataModel()
+            return model.getValue()
+
+        def renderStream():
+            model.resetDataModel()
+            stream = StreamBuffer()
+            model.getValue(stream)
+            return stream.getValue()
+
+        length = len(render())
+        rate = timeIt(render, iterations)
+        streamRate = timeIt(renderStream, iterations)
+
+        print("%10d %12d %14.2f %14.2f" % (nodeCount, length,
+                                           1000000.0 / (rate * nodeCount),
+                                           1000000.0 / (streamRate * nodeCount)))
+
+
+def vttSample(cues):
+    """
+    Build a WebVTT file for the File data model of
+    Pits/Files/WebVTT/vtt.xml.  Every other cue has settings, which
+    the pit cracks with a choice and an array.
+    """
+
+    lines = ["WEBVTT", "", ""]
+    for i in xrange(cues):
+        timestamp = "%02d:%02d.000 --> %02d:%02d.500" % (i / 60, i % 60, i / 60, i % 60)
+        if i % 2:
+            timestamp += " line:%d position:%d%%" % (i, i % 100)
+        lines.extend([timestamp, "Cue %d" % i, ""])
+
+    return "\n".join(lines)
+
+
+def benchCrack(pit, modelName, samples, iterations):
+    """
+    Crack each sample into a fresh copy of a data model.
+
+    @type	samples: list
+    @param	samples: List of (name, data) tuples
+    """
+
+    if not pit.startswith("file:"):
+        pit = "file:" + pit
+
+    peach = ParseTemplate({}).parse(pit)
+    template = peach.templates[modelName]
+
+    print("%-30s %10s %12s %12s" % ("sample", "bytes", "sec/crack", "KB/sec"))
+
+    for name, data in samples:
+        def crack():
+            model = template.copy(peach)
+            cracker = DataCracker(peach)
+            cracker.optmizeModelForCracking(model, True)
+            cracker.crackData(model, PublisherBuffer(None, data, True))
+
+        rate = timeIt(crack, iterations)
+        print("%-30s %10d %12.3f %12.1f" % (name[-30:], len(data), 1 / rate, rate * len(data) / 1024.0))
+
+
+class _Plain(object):
+    pass
+
+
+def benchSetattr(iterations, cues):
+    """
+    Cost of the Element.__setattr__ hook (overlay and snapshot journals,
+    value cache) against a plain attribute write, and its share of
+    cracking a WebVTT file with cues cues.
+    """
+
+    model = syntheticModel(1000)
+    model.getValue()
+    overlay = TemplateOverlay(model)
+    instance = overlay.checkout(None)
+    fields = [node for node in model.getAllChildDataElements() if len(node) == 0]
+    field = fields[len(fields) / 2]
+    instanceField = [node for node in instance.getAllChildDataElements()
+                     if node.getFullname() == field.getFullname()][0]
+    plain = _Plain()
+
+    def write(obj):
+        return lambda: setattr(obj, "currentValue", "A")
+
+    plainRate = timeIt(write(plain), iterations)
+    elementRate = timeIt(write(field), iterations)
+    overlayRate = timeIt(write(instanceField), iterations)
+    snapshot = Snapshot().start()
+    try:
+        snapshotRate = timeIt(write(field), iterations)
+    finally:
+        snapshot.stop()
+
+    # Count the writes a crack makes
+    hook = Element.__setattr__
+    writes = [0]
+
+    def counting(self, name, value):
+        writes[0] += 1
+        hook(self, name, value)
+
+    peach = ParseTemplate({}).parse("file:Pits/Files/WebVTT/vtt.xml")
+    template = peach.templates["File"]
+    data = vttSample(cues)
+
+    def crack():
+        crackModel = template.copy(peach)
+        cracker = DataCracker(peach)
+        cracker.optmizeModelForCracking(crackModel, True)
+        cracker.crackData(crackModel, PublisherBuffer(None, data, True))
+
+    crackRate = timeIt(crack, 1)
+    Element.__setattr__ = counting
+    try:
+        crack()
+    finally:
+        Element.__setattr__ = hook
+
+    overhead = writes[0] * (1.0 / elementRate - 1.0 / plainRate)
+    print("  plain object:   %10.1f writes/sec" % plainRate)
+    print("  element:        %10.1f writes/sec (%.1fx slower)" % (elementRate, plainRate / elementRate))
+    print("  overlay:        %10.1f writes/sec (%.1fx slower)" % (overlayRate, plainRate / overlayRate))
+    print("  snapshot:       %10.1f writes/sec (%.1fx slower)" % (snapshotRate, plainRate / snapshotRate))
+    print("  crack of %d cues: %d element writes, hook adds %.3f of %.3f sec (%.1f%%)" % (
+        cues, writes[0], overhead, 1 / crackRate, overhead * crackRate * 100))
+
+
+class _DelayedProxy(object):
+    """
+    Forwards calls to a ServerProxy after sleeping latency seconds,
+    standing in for the network between Peach and a remote agent.
+    """
+
+    def __init__(self, proxy, latency):
+        self._proxy = proxy
+        self._latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self._proxy, name)
+
+        def call(*args):
+            time.sleep(self._latency)
+            return method(*args)
+
+        return call
+
+
+class _LoopbackAgentClient(AgentClient):
+    """
+    AgentClient for an agent already running in this process.
+    """
+
+    def __init__(self, agentUri, latency=0, imports=None):
+        self._latency = latency
+        AgentClient.__init__(self, agentUri, None, imports=imports)
+
+    def _launchLocalAgent(self, agentPort, password, configs):
+        pass
+
+    def Connect(self):
+        AgentClient.Connect(self)
+        if self._latency:
+            self._agent = _DelayedProxy(self._agent, self._latency)
+
+
+def startLoopbackAgents(count=1):
+    """
+    Run count agents on free local ports in a background thread,
+    returns the ports and the thread.  Stop them with
+    L{stopLoopbackAgents}.
+    """
+
+    from twisted.internet import reactor
+
+    ports = []
+    for _ in range(count):
+        agent = AgentXmlRpc()
+        agent._password = None
+        agent._monitors = []
+        agent._publishers = {}
+        agent._id = None
+        port = reactor.listenTCP(0, AgentFactory(agent), interface="127.0.0.1")
+        ports.append(port.getHost().port)
+
+    thread = threading.Thread(target=reactor.run, kwargs={"installSignalHandlers": False})
+    thread.daemon = True
+    thread.start()
+
+    return ports, thread
+
+
+def stopLoopbackAgents(thread):
+    from twisted.internet import reactor
+
+    reactor.callFromThread(reactor.stop)
+    thread.join()
+
+
+def benchAgent(iterations, monitors=1, agents=1, latency=0):
+    """
+    Agent traffic of a test case against local agents: one call per
+    event against a single iterationEnd, and with several agents the
+    plexer calling them one after the other against all at once.
+    latency is added to every call in milliseconds.
+    """
+
+    ports, thread = startLoopbackAgents(agents)
+    plexer = AgentPlexer()
+    for i, port in enumerate(ports):
+        client = plexer["Loopback%d" % i] = \
+            _LoopbackAgentClient("http://127.0.0.1:%d/" % port, latency / 1000.0)
+        for j in range(monitors):
+            client.StartMonitor("Monitor%d" % j, "Monitor", {})
+
+    def separate():
+        plexer.OnTestStarting()
+        plexer.OnTestFinished()
+        plexer.RedoTest()
+        plexer.DetectedFault()
+        plexer.StopRun()
+
+    def batched():
+        plexer.OnTestStarting()
+        plexer.IterationEnd()
+        plexer.RedoTest()
+        plexer.DetectedFault()
+        plexer.StopRun()
+
+    # The agents print every call they get
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        separateRate = timeIt(separate, iterations)
+        batchedRate = timeIt(batched, iterations)
+        plexer.concurrent = False
+        serialRate = timeIt(batched, iterations)
+        plexer.OnShutdown()
+    finally:
+        stopLoopbackAgents(thread)
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("%d loopback agents with %d monitors, %.1f ms latency." % (agents, monitors, latency))
+    print("  separate calls: %10.1f iterations/sec" % separateRate)
+    print("  iterationEnd:   %10.1f iterations/sec (%.1fx)" % (batchedRate, batchedRate / separateRate))
+    if agents > 1:
+        print("  one at a time:  %10.1f iterations/sec (%.1fx)" % (serialRate, serialRate / separateRate))
+
+
+class PayloadMonitor(Monitor):
+    """
+    Monitor handing back Size bytes of monitor data, like a crash dump.
+    """
+
+    def __init__(self, args):
+        Monitor.__init__(self, args)
+        self._data = os.urandom(int(args["Size"]))
+
+    def GetMonitorData(self):
+        return {"payload.bin": self._data}
+
+
+def benchTransport(iterations, size):
+    """
+    XML-RPC against the framed transport to a local agent, for a small
+    hook call and for GetMonitorData returning size bytes.
+    """
+
+    ports, thread = startLoopbackAgents(2)
+    imports = [{"from": "Peach.Utilities.benchmark", "import": "PayloadMonitor"}]
+    clients = [("XML-RPC", _LoopbackAgentClient("http://127.0.0.1:%d/" % ports[0], imports=imports)),
+               ("framed", _LoopbackAgentClient("tcp://127.0.0.1:%d/" % ports[1], imports=imports))]
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        rates = []
+        for name, client in clients:
+            client.StartMonitor("Payload", "PayloadMonitor", {"Size": str(size)})
+            hookRate = timeIt(client.OnTestStarting, iterations)
+            dataRate = timeIt(client.GetMonitorData, max(1, iterations / 20))
+            rates.append((name, hookRate, dataRate))
+            client.OnShutdown()
+    finally:
+        stopLoopbackAgents(thread)
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("Loopback agent transports, %d byte monitor data." % size)
+    for name, hookRate, dataRate in rates:
+        print("  %-8s %10.1f hook calls/sec %10.1f MB/sec monitor data" % (
+            name, hookRate, dataRate * size / (1024.0 * 1024.0)))
+
+
+def _addModelArguments(parser, iterations):
+    parser.add_argument('-pit', metavar='path', help='pit file with the data model.')
+    parser.add_argument('-model', metavar='name', help='data model name.')
+    parser.add_argument('-sample', metavar='path', help='sample file to crack into the model.')
+    parser.add_argument('-synthetic', metavar='#', type=int, default=5000,
+                        help='size of generated model when no pit is given. (default: %(default)s)')
+    parser.add_argument('-iterations', metavar='#', type=int, default=iterations,
+                        help='iterations to time. (default: %(default)s)')
+
+
+def _modelFromArgs(args):
+    if args.pit is not None:
+        if args.model is None:
+            raise PeachException("Option -model is required with -pit.")
+        return loadModel(args.pit, args.model, args.sample)
+
+    return syntheticModel(args.synthetic)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Peach Benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    clone = subparsers.add_parser('clone', help='template copy per iteration.')
+    _addModelArguments(clone, 50)
+
+    render = subparsers.add_parser('render', help='data model getValue after a mutation.')
+    _addModelArguments(render, 200)
+
+    scaling = subparsers.add_parser('scaling', help='full render time as the model grows.')
+    scaling.add_argument('-sizes', metavar='#', type=int, nargs='+',
+                         default=[1000, 4000, 16000, 64000],
+                         help='synthetic model sizes. (default: %(default)s)')
+    scaling.add_argument('-valueSize', metavar='#', type=int, default=None,
+                         help='pad string fields to this many bytes.')
+    scaling.add_argument('-iterations', metavar='#', type=int, default=3,
+                         help='renders to time per size. (default: %(default)s)')
+
+    crack = subparsers.add_parser('crack', help='data cracking of sample files.')
+    crack.add_argument('-pit', metavar='path', default='Pits/Files/WebVTT/vtt.xml',
+                       help='pit file with the data model. (default: %(default)s)')
+    crack.add_argument('-model', metavar='name', default='File',
+                       help='data model name. (default: %(default)s)')
+    crack.add_argument('-sample', metavar='path', nargs='+',
+                       help='sample files to crack, WebVTT files are generated when not given.')
+    crack.add_argument('-cues', metavar='#', type=int, nargs='+', default=[10, 20, 40],
+                       help='cues in each generated WebVTT file. (default: %(default)s)')
+    crack.add_argument('-iterations', metavar='#', type=int, default=3,
+                       help='cracks to time per sample. (default: %(default)s)')
+
+    setattrs = subparsers.add_parser('setattr', help='element attribute write hook overhead.')
+    setattrs.add_argument('-cues', metavar='#', type=int, default=40,
+                          help='cues in the generated WebVTT file to crack. (default: %(default)s)')
+    setattrs.add_argument('-iterations', metavar='#', type=int, default=200000,
+                          help='writes to time. (default: %(default)s)')
+
+    agent = subparsers.add_parser('agent', help='agent calls per iteration over loopback.')
+    agent.add_argument('-monitors', metavar='#', type=int, default=1,
+                       help='monitors to start on each agent. (default: %(default)s)')
+    agent.add_argument('-agents', metavar='#', type=int, default=1,
+                       help='agents to run. (default: %(default)s)')
+    agent.add_argument('-latency', metavar='ms', type=float, default=0,
+                       help='network latency to add to each call. (default: %(default)s)')
+    agent.add_argument('-iterations', metavar='#', type=int, default=200,
+                       help='iterations to time. (default: %(default)s)')
+
+    transport = subparsers.add_parser('transport', help='XML-RPC against framed agent transport.')
+    transport.add_argument('-size', metavar='#', type=int, default=4 * 1024 * 1024,
+                           help='bytes of monitor data. (default: %(default)s)')
+    transport.add_argument('-iterations', metavar='#', type=int, default=200,
+                           help='hook calls to time. (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='[Peach.%(name)s] %(message)s', level=logging.WARNING)
+
+    if args.benchmark == 'clone':
+        benchClone(_modelFromArgs(args), args.iterations)
+
+    elif args.benchmark == 'render':
+        benchRender(_modelFromArgs(args), args.iterations)
+
+    elif args.benchmark == 'scaling':
+        benchScaling(args.sizes, args.iterations, args.valueSize)
+
+    elif args.benchmark == 'crack':
+        if args.sample is not None:
+            samples = []
+            for path in args.sample:
+                with open(path, "rb") as fd:
+                    samples.append((path, fd.read()))
+        else:
+            samples = [("%d cues" % cues, vttSample(cues)) for cues in args.cues]
+
+        benchCrack(args.pit, args.model, samples, args.iterations)
+
+    elif args.benchmark == 'setattr':
+        benchSetattr(args.iterations, args.cues)
+
+    elif args.benchmark == 'agent':
+        benchAgent(args.iterations, args.monitors, args.agents, args.latency)
+
+    elif args.benchmark == 'transport':
+        benchTransport(args.iterations, args.size)
+
+
+if __name__ == "__main__":
+    main()
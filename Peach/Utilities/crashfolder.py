@@ -0,0 +1,186 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import sys
+import time
+import errno
+import struct
+import logging
+import ctypes
+import ctypes.util
+
+from Peach.publisher import waitForData
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+except (OSError, AttributeError):
+    _libc = None
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+
+class CrashFolder(object):
+    """
+    Watches a folder crash reports or core dumps get written to.
+
+    On Linux inotify tells us about every file written into the folder,
+    so asking for new files costs one read() when there are none.
+    Elsewhere we compare listings of the folder, but only after its
+    mtime changed.  Either way only files which appeared after the
+    watcher was created are reported, each of them once.
+    """
+
+    def __init__(self, folder, writeTimeout=5.0, pollInterval=0.1):
+        """
+        @type	folder: str
+        @param	folder: Folder to watch
+        @type	writeTimeout: float
+        @param	writeTimeout: Seconds to wait for a file being written to be closed
+        @type	pollInterval: float
+        @param	pollInterval: Seconds between listings without inotify
+        """
+        self.folder = folder
+        self.writeTimeout = writeTimeout
+        self.pollInterval = pollInterval
+        #: Names of complete files not reported yet
+        self._ready = []
+        #: K is name of a file being written (inotify only), V is when it was created
+        self._writing = {}
+        #: Names in the folder at the last listing (polling only)
+        self._names = set()
+        self._mtime = None
+        self._fd = self._watch(folder)
+        if self._fd is None:
+            self._list(report=False)
+
+    @staticmethod
+    def _watch(folder):
+        if _libc is None:
+            return None
+
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logging.debug("inotify_init1 failed: %s" % os.strerror(ctypes.get_errno()))
+            return None
+
+        path = folder if isinstance(folder, bytes) else folder.encode(sys.getfilesystemencoding())
+        if _libc.inotify_add_watch(fd, path, IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            logging.debug("Can not watch '%s': %s" % (folder, os.strerror(ctypes.get_errno())))
+            os.close(fd)
+            return None
+
+        return fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._list(report=False)
+
+    def _addReady(self, name):
+        if name not in self._ready:
+            self._ready.append(name)
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.EAGAIN:
+                    return
+                raise
+
+            pos = 0
+            while pos + _EVENT.size <= len(data):
+                _, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+                if not isinstance(name, str):
+                    name = name.decode(sys.getfilesystemencoding())
+                pos += _EVENT.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    logging.warning("Too many files written to '%s', some were missed." % self.folder)
+                elif mask & IN_ISDIR:
+                    continue
+                elif mask & IN_CREATE:
+                    self._writing[name] = time.time()
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._writing.pop(name, None)
+                    self._addReady(name)
+
+    def _list(self, report=True):
+        try:
+            mtime = os.stat(self.folder).st_mtime
+        except OSError:
+            return
+
+        # mtime may have a resolution of seconds, look again if it is recent
+        if mtime == self._mtime and time.time() - mtime > 2:
+            return
+
+        self._mtime = mtime
+        try:
+            names = set(os.listdir(self.folder))
+        except OSError:
+            return
+
+        if report:
+            for name in sorted(names - self._names):
+                self._addReady(name)
+        self._names = names
+
+    def newFiles(self, timeout=0.0):
+        """
+        Get files written into the folder since the last call.  Files
+        still being written are waited for.
+
+        @type	timeout: float
+        @param	timeout: Seconds to wait for a file if there is none
+        @rtype: list
+        @return: names of the new files
+        """
+
+        deadline = time.time() + timeout
+        while True:
+            if self._fd is None:
+                self._list()
+            else:
+                self._read()
+
+            now = time.time()
+            for name, created in list(self._writing.items()):
+                if now - created > self.writeTimeout:
+                    # Writer went away without closing it
+                    del self._writing[name]
+                    self._addReady(name)
+
+            if self._writing:
+                deadline = max(deadline, max(self._writing.values()) + self.writeTimeout)
+            elif self._ready:
+                break
+
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+
+            if self._fd is None:
+                time.sleep(min(remaining, self.pollInterval))
+            else:
+                waitForData(self._fd, remaining)
+
+        ready, self._ready = self._ready, []
+        return ready
@@ -0,0 +1,125 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import re
+import hashlib
+
+# ASan, always indented:  "    #0 0x4c6d2a in Foo::bar(int) /src/foo.cpp:12:3"
+#                          "    #1 0x7f3a1c in __libc_start_main (/lib/libc.so.6+0x21b96)"
+_ASAN_FRAME = re.compile(r"^\s+#\d+\s+0x[0-9a-fA-F]+\s+in\s+(.+?)\s*$")
+_ASAN_MODULE = re.compile(r"^(.*?)\s*\(([^()]+?)\+0x[0-9a-fA-F]+\)$")
+_ASAN_SOURCE = re.compile(r"^(.*?)\s+(\S+?):(\d+)(?::\d+)?$")
+
+# gdb, never indented:  "#0  0x00007ffff7a42428 in __GI_raise (sig=6) at ../sysdeps/raise.c:54"
+#                       "#1  main () at t.c:5"
+#                       "#2  0x00007ffff7a0e830 in __libc_start_main () from /lib/libc.so.6"
+_GDB_FRAME = re.compile(r"^#\d+\s+(?:0x[0-9a-fA-F]+\s+in\s+)?(\S+)\s+\(.*?\)"
+                        r"(?:\s+at\s+(\S+?):(\d+))?(?:\s+from\s+(\S+))?\s*$")
+
+# CrashReporter:  "0   libsystem_kernel.dylib   0x00007fff8b3e6866 __pthread_kill + 10"
+_CRASHREPORTER_FRAME = re.compile(r"^\d+\s+(\S+)\s+0x[0-9a-fA-F]+\s+(.+?)(?:\s+\+\s+\d+)?"
+                                  r"(?:\s+\((\S+?):(\d+)\))?\s*$")
+
+_CRASH_TYPES = [
+    re.compile(r"ERROR: AddressSanitizer: ([\w-]+)"),
+    re.compile(r"Program terminated with signal (SIG\w+)"),
+    re.compile(r"Exception Type:\s+(\S+)"),
+]
+
+#: Frames of the sanitizer runtime and of abort(), the same for every crash
+_NOISE = re.compile(r"^(__asan_|__interceptor_|__sanitizer|__ubsan_|__GI_raise|__GI_abort|raise$|abort$|"
+                    r"__assert_fail|__pthread_kill|pthread_kill$)")
+
+
+def stackFrames(trace):
+    """
+    Get the frames of the first stack in an ASan report, gdb backtrace
+    or CrashReporter log, innermost first.  Addresses, offsets and
+    arguments are dropped so the same crash gives the same frames
+    every time.
+
+    @type	trace: str
+    @param	trace: Crash report
+    @rtype: list
+    @return: (function, location) of each frame, location may be None
+    """
+
+    frames = []
+    for line in trace.splitlines():
+        frame = _parseFrame(line)
+        if frame is None:
+            # The first stack ends at the first line which is no frame
+            if frames and not line.strip():
+                break
+            continue
+        if not _NOISE.match(frame[0]):
+            frames.append(frame)
+    return frames
+
+
+def _parseFrame(line):
+    match = _ASAN_FRAME.match(line)
+    if match is not None:
+        rest = match.group(1)
+        module = _ASAN_MODULE.match(rest)
+        if module is not None:
+            return module.group(1), os.path.basename(module.group(2))
+        source = _ASAN_SOURCE.match(rest)
+        if source is not None:
+            return source.group(1), "%s:%s" % (os.path.basename(source.group(2)), source.group(3))
+        return rest, None
+
+    match = _GDB_FRAME.match(line)
+    if match is not None:
+        function, path, lineNumber, module = match.groups()
+        if path is not None:
+            return function, "%s:%s" % (os.path.basename(path), lineNumber)
+        return function, os.path.basename(module) if module else None
+
+    match = _CRASHREPORTER_FRAME.match(line)
+    if match is not None:
+        module, function, path, lineNumber = match.groups()
+        if path is not None:
+            return function, "%s:%s" % (os.path.basename(path), lineNumber)
+        return function, module
+
+    return None
+
+
+def crashType(trace):
+    """
+    @rtype: str
+    @return: kind of crash named in the report, e.g. heap-use-after-free, or None
+    """
+
+    for regex in _CRASH_TYPES:
+        match = regex.search(trace)
+        if match is not None:
+            return match.group(1)
+    return None
+
+
+def stackBucket(trace, frames=5):
+    """
+    Bucket a crash by the top frames of its stack.
+
+    The major hash covers the function names of the top frames, the
+    minor hash also their source lines, so a major bucket holds the
+    same crash reached through slightly different code.
+
+    @type	trace: str
+    @param	trace: Crash report
+    @type	frames: int
+    @param	frames: Number of frames to hash
+    @rtype: str
+    @return: "<crash type>_<major>/<minor>" or None if there is no stack
+    """
+
+    top = stackFrames(trace)[:frames]
+    if not top:
+        return None
+
+    major = hashlib.sha1("\n".join(function for function, _ in top)).hexdigest()[:8]
+    minor = hashlib.sha1("\n".join("%s %s" % frame for frame in top)).hexdigest()[:8]
+    return os.path.join("%s_%s" % (crashType(trace) or "crash", major), minor)
@@ -6,10 +6,13 @@ import re
 import sys
 import time
 import uuid
+import struct
 import socket
 import atexit
 import logging
 import subprocess
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 try:
     from urlparse import urlparse
 except ImportError as e:
@@ -26,12 +29,16 @@ except ImportError as e:
 try:
     from xmlrpclib import ServerProxy
     from xmlrpclib import Error
+    from xmlrpclib import Fault
 except ImportError as e:
     from xmlrpc.client import ServerProxy
     from xmlrpc.client import Error
+    from xmlrpc.client import Fault
 
 from Peach import xmlrpc
 from twisted.web import server
+from twisted.internet import protocol
+from twisted.protocols import basic
 
 from Peach.Publishers import *
 from Peach.Engine.common import *
@@ -41,6 +48,14 @@ from Peach.Utilities.common import *
 agentProcesses = []
 
 
+if sys.version_info[0] < 3:
+    exec("def reraise(tp, value, tb):\n    raise tp, value, tb\n")
+else:
+    def reraise(tp, value, tb):
+        """Raise value again with its original traceback."""
+        raise value.with_traceback(tb)
+
+
 @atexit.register
 def cleanup_agent():
     if agentProcesses and len(agentProcesses) > 0:
@@ -154,6 +169,7 @@ class _MsgType(object):
     OnTestFinished = 14  #: On Test Case Finished
     StopRun = 20
     RedoTest = 30  #: Should we re-perform the current test?
+    IterationEnd = 31  #: OnTestFinished and RedoTest in one, with msg.complete also DetectFault and StopRun
     StartMonitor = 15  #: Startup a monitor
     # Expect a msg.monitorName: str, msg.monitorClass: str and msg.params: dictionary
     StopMonitor = 16  #: Stop a monitor
@@ -180,6 +196,8 @@ class _Msg(object):
         self.password = False
         self.pythonPaths = None
         self.imports = None
+        #: IterationEnd: also answer DetectFault and StopRun
+        self.complete = True
 
 
 class Agent(object):
@@ -202,7 +220,7 @@ class Agent(object):
         agent._monitors = []
         agent._publishers = {}
         agent._id = None
-        reactor.listenTCP(port, server.Site(agent))
+        reactor.listenTCP(port, AgentFactory(agent))
         if agent._password is not None:
             print("\n[Agent] Listening on [%s] with password [%s]\n" % (port, agent._password))
         else:
@@ -210,14 +228,95 @@ class Agent(object):
         reactor.run()
 
 
+#: First bytes a client sends to use the framed transport instead of XML-RPC
+FRAMED_MAGIC = "PEACH-FRAMED/1\r\n"
+
+
+class AgentFramedProtocol(basic.Int32StringReceiver):
+    """
+    Framed transport to an agent. Each call is a length prefixed pickle of
+    (method, args), answered by a length prefixed pickle of (True, result)
+    or (False, (faultCode, faultString)). The connection stays open for
+    the whole session.
+    """
+
+    MAX_LENGTH = 0x7FFFFFFF
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def stringReceived(self, data):
+        method, args = pickle.loads(data)
+        agent = self.agent
+        try:
+            function = agent.lookupProcedure(method)
+            agent._pickleProtocol = pickle.HIGHEST_PROTOCOL
+            try:
+                reply = (True, function(*args))
+            finally:
+                agent._pickleProtocol = AgentXmlRpc._pickleProtocol
+        except Fault as e:
+            reply = (False, (e.faultCode, e.faultString))
+        except Exception as e:
+            print("Agent: %s failed: %s" % (method, e))
+            reply = (False, (xmlrpc.XMLRPC.FAILURE, str(e)))
+        self.sendString(pickle.dumps(reply, pickle.HIGHEST_PROTOCOL))
+
+
+class _AgentPortProtocol(protocol.Protocol):
+    """
+    Looks at the first bytes of a connection and hands it to the framed
+    transport or the XML-RPC site, so both are served on the agent port.
+    """
+
+    def __init__(self, factory, addr):
+        self.factory = factory
+        self.addr = addr
+        self._buffer = ""
+
+    def dataReceived(self, data):
+        self._buffer += data
+        if len(self._buffer) < len(FRAMED_MAGIC) and FRAMED_MAGIC.startswith(self._buffer):
+            return
+        if self._buffer.startswith(FRAMED_MAGIC):
+            proto = AgentFramedProtocol(self.factory.agent)
+            data = self._buffer[len(FRAMED_MAGIC):]
+        else:
+            proto = self.factory.site.buildProtocol(self.addr)
+            data = self._buffer
+        self._buffer = None
+        self.transport.protocol = proto
+        proto.makeConnection(self.transport)
+        if data:
+            proto.dataReceived(data)
+
+
+class AgentFactory(protocol.Factory):
+    """Serves an AgentXmlRpc over XML-RPC and the framed transport."""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.site = server.Site(agent)
+
+    def buildProtocol(self, addr):
+        return _AgentPortProtocol(self, addr)
+
+
 class AgentXmlRpc(xmlrpc.XMLRPC):
+    #: Pickle protocol for replies. XML-RPC strings need the text protocol,
+    #: the framed transport switches to binary while it makes a call.
+    _pickleProtocol = 0
+
+    def _dumps(self, msg):
+        return pickle.dumps(msg, self._pickleProtocol)
+
     def xmlrpc_clientHello(self, msg):
         msg = pickle.loads(msg)
         if msg.password != self._password:
             print("Agent: Incorrect password on clientHello [%s]" % msg.password)
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.ClientHello:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: clientHello()")
         if self._id is not None:
             self._stopAllMonitors()
@@ -231,7 +330,7 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
             for i in msg.imports:
                 self._handleImport(i)
         print("Agent: clientHello() all done")
-        return pickle.dumps(_Msg(self._id, _MsgType.AgentHello))
+        return self._dumps(_Msg(self._id, _MsgType.AgentHello))
 
     def GetClassesInModule(self, module):
         """Return array of class names in module."""
@@ -267,124 +366,169 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
     def xmlrpc_clientDisconnect(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.ClientDisconnect:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: clientDisconnect()")
         self._stopAllMonitors()
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
 
     def xmlrpc_stopRun(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.StopRun:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: stopRun()")
         msg = _Msg(None, _MsgType.Ack)
-        msg.results = False
+        msg.results = self._stopRun()
+        return self._dumps(msg)
+
+    def _stopRun(self):
+        ret = False
         for m in self._monitors:
             if m.StopRun():
                 print("Agent: Stop run request!")
-                msg.results = True
-        return pickle.dumps(msg)
+                ret = True
+        return ret
 
     def xmlrpc_detectFault(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.DetectFault:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: detectFault()")
         msg = _Msg(None, _MsgType.Ack)
-        msg.results = False
+        msg.results = self._detectFault()
+        print("Agent: Sending detectFault result [%s]" % repr(msg.results))
+        return self._dumps(msg)
+
+    def _detectFault(self):
+        ret = False
         for m in self._monitors:
             if m.DetectedFault():
                 print("Agent: Detected fault!")
-                msg.results = True
-        print("Agent: Sending detectFault result [%s]" % repr(msg.results))
-        return pickle.dumps(msg)
+                ret = True
+        return ret
 
     def xmlrpc_redoTest(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.RedoTest:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: redoTest()")
         msg = _Msg(None, _MsgType.Ack)
-        msg.results = False
+        msg.results = self._redoTest()
+        print("Agent: Sending redoTest result [%s]" % repr(msg.results))
+        return self._dumps(msg)
+
+    def _redoTest(self):
+        ret = False
         for m in self._monitors:
             if m.RedoTest():
-                msg.results = True
-        print("Agent: Sending redoTest result [%s]" % repr(msg.results))
-        return pickle.dumps(msg)
+                ret = True
+        return ret
 
     def xmlrpc_getMonitorData(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.GetMonitorData:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: getMonitorData()")
         msg = _Msg(None, _MsgType.Ack)
-        msg.results = []
+        msg.results = self._getMonitorData()
+        return self._dumps(msg)
+
+    def _getMonitorData(self):
+        ret = []
         for m in self._monitors:
             try:
                 data = m.GetMonitorData()
                 if data is not None:
-                    msg.results.append(data)
+                    ret.append(data)
             except Exception as e:
                 print("Agent: getMonitorData: Failrue getting data from:", m.monitorName)
                 raise
-        return pickle.dumps(msg)
+        return ret
 
     def xmlrpc_onFault(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.OnFault:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: onFault()")
         for m in self._monitors:
             m.OnFault()
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
 
     def xmlrpc_onTestFinished(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.OnTestFinished:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: onTestFinished()")
         for m in self._monitors:
             m.OnTestFinished()
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
+
+    def xmlrpc_iterationEnd(self, msg):
+        """
+        Finish a test case and answer RedoTest in one reply.
+
+        With msg.complete DetectedFault and StopRun are answered as well.
+        Stops at the same points the separate calls would: nothing after a
+        redo request, and on a fault the monitor data is sent instead of
+        the StopRun answer, which has to wait for OnFault. The fuzzer only
+        sets complete for a single agent, with more the redo answers of
+        all agents have to be in before any of them looks for faults.
+        """
+        msg = pickle.loads(msg)
+        if self._id is None or msg.id != self._id:
+            return self._dumps(_Msg(None, _MsgType.Nack))
+        if msg.type != _MsgType.IterationEnd:
+            return self._dumps(_Msg(None, _MsgType.Nack))
+        print("Agent: iterationEnd()")
+        for m in self._monitors:
+            m.OnTestFinished()
+        results = {'redo': self._redoTest()}
+        if not results['redo'] and getattr(msg, 'complete', True):
+            results['fault'] = self._detectFault()
+            if results['fault']:
+                results['monitorData'] = self._getMonitorData()
+            else:
+                results['stopRun'] = self._stopRun()
+        print("Agent: Sending iterationEnd result [%s]" % repr(results))
+        return self._dumps(_Msg(None, _MsgType.Ack, results))
 
     def xmlrpc_onTestStarting(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.OnTestStarting:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: onTestStarting()")
         for m in self._monitors:
             m.OnTestStarting()
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
 
     def xmlrpc_onPublisherCall(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.PublisherCall:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: onPublisherCall():", msg.method)
         outRet = None
         for m in self._monitors:
             ret = m.PublisherCall(msg.method)
             if ret is not None:
                 outRet = ret
-        return pickle.dumps(_Msg(None, _MsgType.Ack, outRet))
+        return self._dumps(_Msg(None, _MsgType.Ack, outRet))
 
     def _stopAllMonitors(self):
         """Stop all monitors. Part of resetting our connection."""
@@ -395,19 +539,19 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
     def xmlrpc_onShutdown(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.OnShutdown:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: onShutdown()")
         self._stopAllMonitors()
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
 
     def xmlrpc_stopMonitor(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.StopMonitor:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: stopMonitor(%s)" % msg.monitorName)
         for i in range(len(self._monitors)):
             m = self._monitors[i]
@@ -418,14 +562,14 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
                     pass
                 self._monitors.remove(m)
                 break
-        return pickle.dumps(_Msg(None, _MsgType.Ack))
+        return self._dumps(_Msg(None, _MsgType.Ack))
 
     def xmlrpc_startMonitor(self, msg):
         msg = pickle.loads(msg)
         if self._id is None or msg.id != self._id:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         if msg.type != _MsgType.StartMonitor:
-            return pickle.dumps(_Msg(None, _MsgType.Nack))
+            return self._dumps(_Msg(None, _MsgType.Nack))
         print("Agent: startMonitor(%s)" % msg.monitorName)
         try:
             code = msg.monitorClass + "(msg.params)"
@@ -433,11 +577,11 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
             monitor = eval(code)
             if monitor is None:
                 print("Agent: Unable to create Monitor [%s]" % msg.monitorClass)
-                return pickle.dumps(_Msg(self._id, _MsgType.Nack, "Unable to create Monitor [%s]" % msg.monitorClass))
+                return self._dumps(_Msg(self._id, _MsgType.Nack, "Unable to create Monitor [%s]" % msg.monitorClass))
             monitor.monitorName = msg.monitorName
             self._monitors.append(monitor)
             print("Agent: Sending Ack")
-            return pickle.dumps(_Msg(None, _MsgType.Ack))
+            return self._dumps(_Msg(None, _MsgType.Ack))
         except Exception as e:
             print("Agent: Unable to create Monitor [%s], exception occured." % msg.monitorClass)
             raise
@@ -558,6 +702,55 @@ class AgentXmlRpc(xmlrpc.XMLRPC):
         return self._publishers[name].receive(size)
 
 
+class FramedAgentProxy(object):
+    """
+    Stand-in for ServerProxy that talks the framed transport over one
+    persistent TCP connection. Used for "tcp://host:port" agent locations.
+    """
+
+    def __init__(self, host, port):
+        self._socket = socket.create_connection((host, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.sendall(FRAMED_MAGIC)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args):
+            return self._call(name, args)
+
+        return call
+
+    def _call(self, method, args):
+        data = pickle.dumps((method, args), pickle.HIGHEST_PROTOCOL)
+        header = struct.pack("!I", len(data))
+        if len(data) < 0x10000:
+            self._socket.sendall(header + data)
+        else:
+            self._socket.sendall(header)
+            self._socket.sendall(data)
+        size = struct.unpack("!I", self._recv(4))[0]
+        ok, result = pickle.loads(self._recv(size))
+        if not ok:
+            raise Fault(*result)
+        return result
+
+    def _recv(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        while size:
+            received = self._socket.recv_into(view, size)
+            if not received:
+                raise socket.error("Agent closed the connection.")
+            view = view[received:]
+            size -= received
+        return str(data)
+
+    def close(self):
+        self._socket.close()
+
+
 class AgentClient(object):
     """An Agent client. Clients connect and send/recieve messages with a single remote Agent."""
 
@@ -567,7 +760,7 @@ class AgentClient(object):
         If connection works the Client Hello message is sent.
 
         @type	agentUri: string
-        @param	agentUri: Url of agent
+        @param	agentUri: Url of agent, http://host:port for XML-RPC or tcp://host:port for the framed transport
         @type	password: string
         @param	password: [optional] Password to authenticate to agent.  Warning: CLEAR-TEXT!!
         @type	pythonPaths: list
@@ -583,6 +776,10 @@ class AgentClient(object):
         self._id = None
         self._agent = None
         self._agentUri = agentUri
+        #: Does the agent understand iterationEnd? None until we know.
+        self._batched = None
+        #: iterationEnd results for the current test case
+        self._iteration = None
 
         agentUrl = urlparse(agentUri)
         agentPort = agentUrl.port
@@ -591,55 +788,7 @@ class AgentClient(object):
         # This is nicer, but does not work on darwin:
         #if socket.getfqdn(agentHostname) in ('localhost', socket.gethostname()):
         if agentHostname in ("127.0.0.1", "0.0.0.0", "localhost", socket.gethostname()):
-            peachPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            macros = []
-            if configs:
-                macros.append("-macros")
-                for kv in configs.iteritems():
-                    macros.append("=".join(kv))
-            if sys.platform == "win32":
-                agentProcess = subprocess.call(['start',
-                                                "Peach Agent",
-                                                sys.executable,
-                                                "%s\peach.py" % peachPath,
-                                                "-agent", str(agentPort), password] + macros)
-                agentProcesses.append(agentProcess)
-            elif sys.platform == "darwin":
-                if not self.isPeachRunning(agentPort):
-                    peachAgentCommand = [sys.executable, 'peach.py', '-agent', str(agentPort), password] + macros
-                    if configs and getBooleanAttribute(configs, "HideAgentWindow"):
-                        logging.warning("Agent window will not be visible!")
-                        agentProcess = subprocess.Popen(peachAgentCommand,
-                                                        cwd=peachPath,
-                                                        stdout=open('/dev/null', 'w'))
-                        agentProcesses.append(agentProcess)
-                    else:
-                        logging.info("Opening agent in new terminal.")
-                        osxTerminalCommand = \
-                            """osascript -e 'tell application "Terminal" to do script "cd %s; %s; exit"'""" % \
-                            (peachPath, re.sub(r"""(['"])""", r"\\\1", subprocess.list2cmdline(peachAgentCommand)))
-                        agentProcess = subprocess.Popen(osxTerminalCommand,
-                                                        stdout=subprocess.PIPE,
-                                                        shell=True)
-                        agentProcesses.append(agentProcess)
-            elif sys.platform == "linux2":
-                if not self.isPeachRunning(agentPort):
-                    logging.info("Opening agent in new terminal.")
-                    peachAgentCommand = [sys.executable, "peach.py", "-agent", str(agentPort), password] + macros
-                    if "COLORTERM" in os.environ and 'gnome-terminal' in os.environ["COLORTERM"]:
-                        linuxTerminalCommands = ['gnome-terminal', '-x'] + peachAgentCommand
-                    else:
-                        linuxTerminalCommands = ['xterm', '-hold']
-                        if configs and getBooleanAttribute(configs, "AgentTerminalLogging"):
-                            linuxTerminalCommands += ["-l"]
-                        linuxTerminalCommands += ['-e'] + peachAgentCommand
-                    agentProcess = subprocess.Popen(linuxTerminalCommands,
-                                                    cwd=peachPath,
-                                                    stdout=subprocess.PIPE)
-                    agentProcesses.append(agentProcess)
-            else:
-                raise PeachException("We only support auto starting agents on Windows, OSX and Linux. "
-                                     "Please configure all agents with location URIs and launch any Agent manually.")
+            self._launchLocalAgent(agentPort, password, configs)
 
         # Connect to remote agent
         try:
@@ -649,6 +798,58 @@ class AgentClient(object):
             raise PeachException("Please make sure your agent location string is a valid http URL.")
         self.Connect()
 
+    def _launchLocalAgent(self, agentPort, password, configs):
+        """Start an agent process for an agent location on this machine."""
+        peachPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        macros = []
+        if configs:
+            macros.append("-macros")
+            for kv in configs.iteritems():
+                macros.append("=".join(kv))
+        if sys.platform == "win32":
+            agentProcess = subprocess.call(['start',
+                                            "Peach Agent",
+                                            sys.executable,
+                                            "%s\peach.py" % peachPath,
+                                            "-agent", str(agentPort), password] + macros)
+            agentProcesses.append(agentProcess)
+        elif sys.platform == "darwin":
+            if not self.isPeachRunning(agentPort):
+                peachAgentCommand = [sys.executable, 'peach.py', '-agent', str(agentPort), password] + macros
+                if configs and getBooleanAttribute(configs, "HideAgentWindow"):
+                    logging.warning("Agent window will not be visible!")
+                    agentProcess = subprocess.Popen(peachAgentCommand,
+                                                    cwd=peachPath,
+                                                    stdout=open('/dev/null', 'w'))
+                    agentProcesses.append(agentProcess)
+                else:
+                    logging.info("Opening agent in new terminal.")
+                    osxTerminalCommand = \
+                        """osascript -e 'tell application "Terminal" to do script "cd %s; %s; exit"'""" % \
+                        (peachPath, re.sub(r"""(['"])""", r"\\\1", subprocess.list2cmdline(peachAgentCommand)))
+                    agentProcess = subprocess.Popen(osxTerminalCommand,
+                                                    stdout=subprocess.PIPE,
+                                                    shell=True)
+                    agentProcesses.append(agentProcess)
+        elif sys.platform == "linux2":
+            if not self.isPeachRunning(agentPort):
+                logging.info("Opening agent in new terminal.")
+                peachAgentCommand = [sys.executable, "peach.py", "-agent", str(agentPort), password] + macros
+                if "COLORTERM" in os.environ and 'gnome-terminal' in os.environ["COLORTERM"]:
+                    linuxTerminalCommands = ['gnome-terminal', '-x'] + peachAgentCommand
+                else:
+                    linuxTerminalCommands = ['xterm', '-hold']
+                    if configs and getBooleanAttribute(configs, "AgentTerminalLogging"):
+                        linuxTerminalCommands += ["-l"]
+                    linuxTerminalCommands += ['-e'] + peachAgentCommand
+                agentProcess = subprocess.Popen(linuxTerminalCommands,
+                                                cwd=peachPath,
+                                                stdout=subprocess.PIPE)
+                agentProcesses.append(agentProcess)
+        else:
+            raise PeachException("We only support auto starting agents on Windows, OSX and Linux. "
+                                 "Please configure all agents with location URIs and launch any Agent manually.")
+
     def isPeachRunning(self, agentPort):
         running = False
         if sys.platform == "darwin" or sys.platform == "linux2":
@@ -688,7 +889,8 @@ class AgentClient(object):
         """Connect to agent. Will retry the connection 10 times before giving up."""
         for i in range(20):
             try:
-                self._agent = ServerProxy(self._agentUri)
+                self._closeTransport()
+                self._agent = self._openTransport()
                 msg = _Msg(None, _MsgType.ClientHello, self._name)
                 msg.password = self._password
                 msg.pythonPaths = self._pythonPaths
@@ -697,6 +899,7 @@ class AgentClient(object):
                 if msg.type != _MsgType.AgentHello:
                     raise PeachException("Error connecting to remote agent %s, invalid response." % self._name)
                 self._id = msg.id
+                self._batched = None
                 return
             except Exception as e:
                 if i == 19:
@@ -704,6 +907,17 @@ class AgentClient(object):
             time.sleep(1)
             logging.warning("Agent connection failed, retrying.")
 
+    def _openTransport(self):
+        agentUrl = urlparse(self._agentUri)
+        if agentUrl.scheme == "tcp":
+            return FramedAgentProxy(agentUrl.hostname, agentUrl.port)
+        return ServerProxy(self._agentUri)
+
+    def _closeTransport(self):
+        if isinstance(self._agent, FramedAgentProxy):
+            self._agent.close()
+        self._agent = None
+
     def Reconnect(self):
         """Reconnect to remote agent"""
         try:
@@ -741,6 +955,7 @@ class AgentClient(object):
     def OnTestStarting(self):
         """Called right before start of test."""
         Debug("> OnTestStarting")
+        self._iteration = None
         msg = _Msg(self._id, _MsgType.OnTestStarting)
         try:
             msg = pickle.loads(self._agent.onTestStarting(pickle.dumps(msg)))
@@ -778,9 +993,56 @@ class AgentClient(object):
             raise PeachException("Lost connection to Agent %s during OnTestFinished call." % self._name)
         Debug("< OnTestFinished")
 
+    def IterationEnd(self, complete=True):
+        """
+        Called right after a test instead of OnTestFinished. The agent also
+        answers RedoTest in the same round trip, and with complete also
+        DetectedFault and StopRun (or GetMonitorData on a fault). The
+        answers are handed out by those calls for the rest of this test.
+        Falls back to OnTestFinished for agents that do not know
+        iterationEnd.
+
+        @type	complete: bool
+        @param	complete: Also look for faults, only safe if this is the only agent
+        """
+        Debug("> IterationEnd")
+        self._iteration = None
+        if self._batched is False:
+            self.OnTestFinished()
+            return
+        msg = _Msg(self._id, _MsgType.IterationEnd)
+        msg.complete = complete
+        try:
+            msg = pickle.loads(self._agent.iterationEnd(pickle.dumps(msg)))
+        except Fault as e:
+            if e.faultCode != xmlrpc.XMLRPC.NOT_FOUND:
+                self.Reconnect()
+                raise RedoTestException("Communication error with Agent %s" % self._name)
+            logging.info("Agent %s does not support iterationEnd, using separate calls." % self._name)
+            self._batched = False
+            self.OnTestFinished()
+            return
+        except Exception as e:
+            self.Reconnect()
+            raise RedoTestException("Communication error with Agent %s" % self._name)
+        if msg.type != _MsgType.Ack:
+            raise PeachException("Lost connection to Agent %s during IterationEnd call." % self._name)
+        self._batched = True
+        self._iteration = msg.results
+        Debug("< IterationEnd")
+
+    def _iterationResult(self, key):
+        """Answer from the last IterationEnd, or None if we have to ask."""
+        if self._iteration is None:
+            return None
+        return self._iteration.get(key)
+
     def GetMonitorData(self):
         """Get any monitored data."""
         Debug("> GetMonitorData")
+        results = self._iterationResult('monitorData')
+        if results is not None:
+            return results
         msg = _Msg(self._id, _MsgType.GetMonitorData)
         try:
             msg = pickle.loads(self._agent.getMonitorData(pickle.dumps(msg)))
@@ -795,6 +1057,9 @@ class AgentClient(object):
     def RedoTest(self):
         """Should we repeat current test."""
         Debug("> RedoTest")
+        results = self._iterationResult('redo')
+        if results is not None:
+            return results
         try:
             msg = _Msg(self._id, _MsgType.RedoTest)
             msg = pickle.loads(self._agent.redoTest(pickle.dumps(msg)))
@@ -810,6 +1075,9 @@ class AgentClient(object):
     def DetectedFault(self):
         """Check if a fault was detected."""
         Debug("> DetectedFault")
+        results = self._iterationResult('fault')
+        if results is not None:
+            return results
         try:
             msg = _Msg(self._id, _MsgType.DetectFault)
             msg = pickle.loads(self._agent.detectFault(pickle.dumps(msg)))
@@ -839,11 +1107,15 @@ class AgentClient(object):
         Debug("> OnShutdown")
         msg = _Msg(self._id, _MsgType.OnShutdown)
         self._agent.onShutdown(pickle.dumps(msg))
+        self._closeTransport()
         Debug("< OnShutdown")
 
     def StopRun(self):
         """Return True to force test run to fail. This should return True if an unrecoverable error occurs."""
         Debug("> StopRun")
+        results = self._iterationResult('stopRun')
+        if results is not None:
+            return results
         try:
             msg = _Msg(self._id, _MsgType.StopRun)
             msg = pickle.loads(self._agent.stopRun(pickle.dumps(msg)))
@@ -916,6 +1188,12 @@ class AgentPlexer(object):
 
     def __init__(self):
         self._agents = {}
+        #: Call agents concurrently when there is more than one
+        self.concurrent = True
+        #: Seconds to wait for concurrent calls, without a timeout Ctrl-C is not delivered while waiting
+        self.callTimeout = 24 * 60 * 60
+        self._pool = None
+        self._poolSize = 0
 
     def __getitem__(self, key):
         return self._agents[key]
@@ -930,29 +1208,83 @@ class AgentPlexer(object):
         self._agents[name] = agent
         return agent
 
+    def _callAgents(self, method, *args):
+        """
+        Call method on every agent, returns a list of (name, result).
+
+        With more than one agent the calls run at the same time, so each
+        hook waits for the slowest agent instead of all of them in turn.
+        Every hook still finishes on all agents before the next one
+        starts. If any agents fail, the exception of the first of them
+        is raised once all calls have returned.
+        """
+        names = list(self._agents.keys())
+        if not self.concurrent or len(names) < 2:
+            return [(name, getattr(self._agents[name], method)(*args)) for name in names]
+        if self._poolSize < len(names) - 1:
+            self._stopPool()
+            self._pool = ThreadPool(len(names) - 1)
+            self._poolSize = len(names) - 1
+
+        def call(name):
+            try:
+                return getattr(self._agents[name], method)(*args), None
+            except Exception:
+                return None, sys.exc_info()
+
+        # The first agent is called from this thread, which leaves less to
+        # wait for.  Waiting with a timeout polls, but only for the agents
+        # still busy once the first one answered.
+        others = self._pool.map_async(call, names[1:])
+        results = [call(names[0])]
+        try:
+            results += others.get(self.callTimeout)
+        except TimeoutError:
+            raise PeachException("Agents did not answer %s within %d seconds." % (method, self.callTimeout))
+        for ret, excInfo in results:
+            if excInfo is not None:
+                reraise(*excInfo)
+        return [(name, ret) for name, (ret, excInfo) in zip(names, results)]
+
+    def _stopPool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+        self._poolSize = 0
+
     def OnTestStarting(self):
         """Called right before start of test."""
-        for name in self._agents.keys():
-            self._agents[name].OnTestStarting()
+        self._callAgents("OnTestStarting")
 
     def OnPublisherCall(self, method):
         ourRet = None
-        for name in self._agents.keys():
-            ret = self._agents[name].OnPublisherCall(method)
+        for name, ret in self._callAgents("OnPublisherCall", method):
             if ret is not None:
                 ourRet = ret
         return ourRet
 
     def OnTestFinished(self):
         """Called right after a test."""
-        for name in self._agents.keys():
-            self._agents[name].OnTestFinished()
+        self._callAgents("OnTestFinished")
+
+    def IterationEnd(self):
+        """
+        Called right after a test. Finishes the test on each agent and
+        collects its RedoTest answer in a single round trip.
+
+        A single agent also answers DetectedFault and StopRun in that
+        trip. With more agents those wait for the separate calls, as a
+        redo asked for by one agent has to stop all of them from looking
+        for faults, and a fault of one has to reach OnFault before any
+        of them is asked to StopRun.
+        """
+        self._callAgents("IterationEnd", len(self._agents) < 2)
 
     def GetMonitorData(self):
         """Get any monitored data."""
         ret = {}
-        for name in self._agents.keys():
-            arrayOfMonitorData = self._agents[name].GetMonitorData()
+        for name, arrayOfMonitorData in self._callAgents("GetMonitorData"):
             for hashOfData in arrayOfMonitorData:
                 for key in hashOfData.keys():
                     ret["%s_%s" % (name, key)] = hashOfData[key]
@@ -961,35 +1293,36 @@ class AgentPlexer(object):
     def RedoTest(self):
         """Check if a fault was detected."""
         ret = False
-        for name in self._agents.keys():
-            if self._agents[name].RedoTest():
+        for name, redo in self._callAgents("RedoTest"):
+            if redo:
                 ret = True
         return ret
 
     def DetectedFault(self):
         """Check if a fault was detected."""
         ret = False
-        for name in self._agents.keys():
-            if self._agents[name].DetectedFault():
+        for name, fault in self._callAgents("DetectedFault"):
+            if fault:
                 ret = True
         return ret
 
     def OnFault(self):
         """Called when a fault was detected."""
-        for name in self._agents.keys():
-            self._agents[name].OnFault()
+        self._callAgents("OnFault")
 
     def OnShutdown(self):
         """Called when Agent is shutting down."""
-        for name in self._agents.keys():
-            self._agents[name].OnShutdown()
+        try:
+            self._callAgents("OnShutdown")
+        finally:
+            self._stopPool()
         self._agents = {}
 
     def StopRun(self):
         """Return True to force test run to fail. This should return True if an unrecoverable error occurs."""
         ret = False
-        for name in self._agents.keys():
-            if self._agents[name].StopRun():
+        for name, stop in self._callAgents("StopRun"):
+            if stop:
                 ret = True
         return ret
 
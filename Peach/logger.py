@@ -90,6 +90,10 @@ class Logger(EngineWatcher):
 class Filesystem(Logger):
     """
     A file system logger.
+
+    Faults are stored in a folder per bucket.  With MaxFaultsPerBucket
+    set only that many faults of a bucket are stored, further ones are
+    only counted in Faults/index.txt.
     """
 
     def __init__(self, params):
@@ -100,6 +104,10 @@ class Filesystem(Logger):
         self.file = None
         self.lastTestCount = 0
         self.firstIter = True
+        #: Faults stored per bucket, 0 stores all of them
+        self.maxFaultsPerBucket = int(getStringAttribute(params, "MaxFaultsPerBucket", "0"))
+        #: K is bucket, V is [faults, first test with fault]
+        self.buckets = {}
 
     def _writeMsg(self, line):
         self.file.write(asctime() + ": " + line + "\n")
@@ -151,6 +159,7 @@ class Filesystem(Logger):
 
         self.lastTestCount = 0
         self.firstIter = True
+        self.buckets = {}
 
 
     def OnRunFinished(self, run):
@@ -190,6 +199,11 @@ class Filesystem(Logger):
         except:
             pass
 
+        hits = self._countFault(bucketInfo or "Unknown", variationCount)
+        if bucketInfo is not None and 0 < self.maxFaultsPerBucket < hits:
+            self._writeMsg("Fault %d of bucket %s, not storing it" % (hits, bucketInfo))
+            return
+
         if bucketInfo is not None:
             logging.debug("BucketInfo:", bucketInfo)
 
@@ -252,6 +266,25 @@ class Filesystem(Logger):
                 fout.write(monitorData[key])
                 fout.close()
 
+    def _countFault(self, bucket, variationCount):
+        """
+        Count a fault of bucket and rewrite Faults/index.txt.
+
+        @rtype: int
+        @return: number of faults of bucket so far
+        """
+
+        if bucket not in self.buckets:
+            self.buckets[bucket] = [0, variationCount]
+        self.buckets[bucket][0] += 1
+
+        with open(os.path.join(self.faultPath, "index.txt"), "w") as fout:
+            fout.write("Faults  First test  Bucket\n")
+            for name, (faults, first) in sorted(self.buckets.items(), key=lambda item: -item[1][0]):
+                fout.write("%6d  %10d  %s\n" % (faults, first, name))
+
+        return self.buckets[bucket][0]
+
     def OnStopRun(self, run, test, variationCount, monitorData, value):
         self._writeMsg("")
         self._writeMsg("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
@@ -38,6 +38,14 @@ class MutationStrategy(object):
         """
         raise MutatorCompleted()
 
+    def skip(self, count):
+        """
+        Skip ahead count test sequences, the same as calling next() count
+        times. Throws MutatorCompleted if we run out first.
+        """
+        for _ in xrange(count):
+            self.next()
+
     def currentMutator(self):
         """
         Return the current Mutator in use.
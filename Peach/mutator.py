@@ -1,6 +1,8 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import random
+
 from Peach.Engine.dom import *
 
 
@@ -56,6 +58,40 @@ class Mutator(object):
         """
         pass
 
+    def skip(self, count):
+        """
+        Skip ahead count mutations, the same as calling next() count times.
+        Returns the number of mutations skipped, which is less than count
+        when the mutator completed first.
+
+        Mutators that step an index through their values override this to
+        jump straight to the new position.
+        """
+        skipped = 0
+        try:
+            while skipped < count:
+                self.next()
+                skipped += 1
+        except MutatorCompleted:
+            pass
+        return skipped
+
+    def _skipIndex(self, count, attribute, last):
+        """
+        skip() for mutators whose next() increments attribute and completes
+        once it goes past last.
+        """
+        index = getattr(self, attribute)
+        skipped = max(0, min(count, last - index))
+        setattr(self, attribute, index + skipped)
+        if skipped < count:
+            # Let next() leave us in the same completed state as it would
+            try:
+                self.next()
+            except MutatorCompleted:
+                pass
+        return skipped
+
     def getCount(self):
         """
         If mutator is finite than the total test count can be calculated.
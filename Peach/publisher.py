@@ -1,6 +1,13 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import mmap
+import time
+import errno
+import select
+import collections
+
 from Peach.Engine.common import SoftException, PeachException
 
 
@@ -34,21 +41,251 @@ class Timeout(SoftException):
         return self.msg
 
 
+def waitForData(sock, timeout):
+    """
+    Sleep until sock has data to read or timeout seconds passed,
+    instead of spinning on a non-blocking socket.
+
+    @type	sock: socket
+    @param	sock: Socket, or anything else with a fileno()
+    @type	timeout: float
+    @param	timeout: Seconds to wait, None waits forever
+    @rtype: bool
+    @return: True if sock is readable
+    """
+
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        remaining = None if deadline is None else max(deadline - time.time(), 0)
+        try:
+            if hasattr(select, "poll"):
+                poller = select.poll()
+                poller.register(sock, select.POLLIN | select.POLLPRI)
+                return len(poller.poll(None if remaining is None else remaining * 1000)) > 0
+            return len(select.select([sock], [], [], remaining)[0]) > 0
+        except (select.error, IOError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+
+class AdaptiveTimeout(object):
+    """
+    Learns how long to wait for the target to respond.
+
+    Two kinds of waits are learned per action: for the first data of a
+    response after a send, and for the gap between the data received
+    last and the next chunk of the same response.  Once a kind has
+    enough of them, its timeout is a high percentile of them times a
+    margin, bounded by the configured timeout.  Gap waits which timed
+    out count towards enough, a response which always ends after its
+    first chunk learns the minimum.  Every probeInterval waits use the
+    configured timeout again so slower responses are still seen.
+    """
+
+    def __init__(self, maximum, minimum=0.005, percentile=0.99, margin=1.5, window=256, warmup=16,
+                 probeInterval=32):
+        """
+        @type	maximum: float
+        @param	maximum: Configured timeout, never wait longer
+        @type	minimum: float
+        @param	minimum: Never wait shorter
+        @type	percentile: float
+        @param	percentile: Percentile of response times to wait for
+        @type	margin: float
+        @param	margin: Factor applied to the percentile
+        @type	window: int
+        @param	window: Number of recent response times kept per action
+        @type	warmup: int
+        @param	warmup: Waits needed before the timeout shrinks
+        @type	probeInterval: int
+        @param	probeInterval: Use the configured timeout every so many waits
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.percentile = percentile
+        self.margin = margin
+        self.window = window
+        self.warmup = warmup
+        self.probeInterval = probeInterval
+        #: K is (action name, gap), V is recent response times
+        self._samples = {}
+        #: K is action name, V is recent gap waits, True for those which timed out
+        self._gapWaits = {}
+        #: K is (action name, gap), V is learned timeout
+        self._timeouts = {}
+        self._waits = 0
+
+    def get(self, action, gap=False):
+        """
+        @type	action: str
+        @param	action: Name of the action waiting
+        @type	gap: bool
+        @param	gap: True if waiting for more of a response which started
+        @rtype: float
+        @return: seconds to wait for a response
+        """
+
+        self._waits += 1
+        timeout = self._timeouts.get((action, gap))
+        if timeout is None or self._waits % self.probeInterval == 0:
+            return self.maximum
+        return timeout
+
+    def record(self, action, elapsed, gap=False):
+        """
+        Record that action got data elapsed seconds after the send, or
+        after the data before it if gap is True.
+        """
+
+        key = (action, gap)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = collections.deque(maxlen=self.window)
+        samples.append(elapsed)
+        if gap:
+            self._gapWait(action, False)
+        self._learn(key)
+
+    def miss(self, action):
+        """
+        Record that action waited for more of a response in vain.
+        """
+
+        self._gapWait(action, True)
+        self._learn((action, True))
+
+    def _gapWait(self, action, missed):
+        waits = self._gapWaits.get(action)
+        if waits is None:
+            waits = self._gapWaits[action] = collections.deque(maxlen=self.window)
+        waits.append(missed)
+
+    def _learn(self, key):
+        samples = self._samples.get(key, ())
+        waits = len(self._gapWaits.get(key[0], ())) if key[1] else len(samples)
+        if waits < self.warmup:
+            return
+
+        if samples:
+            ordered = sorted(samples)
+            value = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)] * self.margin
+        else:
+            value = self.minimum
+        self._timeouts[key] = min(max(value, self.minimum), self.maximum)
+
+    def _describe(self, key):
+        return "%.3fs" % self._timeouts[key] if key in self._timeouts else "learning"
+
+    def __str__(self):
+        actions = sorted(set(action for action, gap in self._samples) | set(self._gapWaits), key=str)
+        return ", ".join("%s=%s (gap %s)" % (action, self._describe((action, False)), self._describe((action, True)))
+                         for action in actions)
+
+
 class PublisherBuffer(object):
     """
     An I/O buffer.
+
+    Data given up front is kept as is, data loaded with L{fromFile} is
+    a read-only mmap of the file and data received from the publisher
+    goes into a bytearray which grows in amortized constant time.
+    Use len(), slicing and L{find} on the buffer itself, these only
+    copy the part asked for.
     """
 
     def __init__(self, publisher, data=None, haveAllData=False):
         self.publisher = publisher
         if self.publisher is not None:
             self.publisher.publisherBuffer = self
-        self.data = ""
+        self._data = bytearray()
+        #: str of a bytearray or mmap _data, None if out of date
+        self._str = None
         self.haveAllData = haveAllData
         if data is not None:
-            self.data = data
+            self._data = data
             self.haveAllData = True
 
+    @classmethod
+    def fromFile(cls, fileName):
+        """
+        Map a file into a new buffer without reading it into memory.
+
+        @type	fileName: str
+        @param	fileName: File to map
+        @rtype: PublisherBuffer
+        @return: buffer holding all of the file
+        """
+
+        with open(fileName, "rb") as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                # Empty files can not be mapped
+                return cls(None, "")
+            return cls(None, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        """
+        Release the file of a buffer made by L{fromFile}.  Values sliced
+        out of the buffer stay valid.
+        """
+
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+            self._data = ""
+
+    @property
+    def data(self):
+        """
+        All data in the buffer as a str, for when expressions and custom
+        elements.  Buffers made by L{fromFile} read the whole file for
+        this once, use L{view} where any buffer will do.
+        """
+
+        if isinstance(self._data, (bytearray, mmap.mmap)):
+            if self._str is None:
+                self._str = self._data[:] if isinstance(self._data, mmap.mmap) else str(self._data)
+            return self._str
+        return self._data
+
+    @property
+    def view(self):
+        """
+        All data in the buffer without copying it: a str, bytearray or
+        mmap, all of which support the buffer interface.
+        """
+
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._str = None
+
+    def __len__(self):
+        return len(self._data)
+
+    def __nonzero__(self):
+        # An empty buffer is still a buffer
+        return True
+
+    def __getitem__(self, index):
+        if not isinstance(self._data, bytearray):
+            return self._data[index]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._data))
+            if step == 1:
+                return str(buffer(self._data, start, max(stop - start, 0)))
+            return str(self._data[index])
+        return chr(self._data[index])
+
+    def find(self, sub, start=0, end=None):
+        """
+        Same as str.find without copying the data.
+        """
+
+        if end is None:
+            end = len(self._data)
+        return self._data.find(sub, start, end)
+
     def read(self, size=1):
         """
         Read additional data into I/O buffer.
@@ -77,7 +314,12 @@ class PublisherBuffer(object):
                 except Timeout:
                     pass
         finally:
-            self.data = "".join([self.data] + ret)
+            if ret:
+                if not isinstance(self._data, bytearray):
+                    self._data = bytearray(self._data)
+                for chunk in ret:
+                    self._data.extend(chunk)
+                self._str = None
 
     def readAll(self):
         if self.haveAllData:
@@ -102,6 +344,17 @@ class Publisher(object):
         #: Indicates which method should be called.
         self.withNode = False
         self.publisherBuffer = None
+        #: Name of the input action receiving, set by the state engine
+        self.currentAction = None
+        #: AdaptiveTimeout used by getReceiveTimeout, None to disable
+        self.adaptiveTimeout = None
+        #: When the last send whose response has not arrived yet was made
+        self._sentAt = None
+        #: When data of the response being received arrived last
+        self._receivedAt = None
+        #: (iteration, data) of the test case a fault belongs to if not the
+        #: current one, for publishers running test cases later
+        self.faultTestCase = None
 
     def initialize(self):
         """
@@ -162,6 +415,60 @@ class Publisher(object):
         """
         raise PeachException("Action 'receive' not supported by publisher.")
 
+    def markSent(self):
+        """
+        Note that data was sent, response times are measured from here.
+        """
+        self._sentAt = time.time()
+        self._receivedAt = None
+
+    def getReceiveTimeout(self, timeout):
+        """
+        Get how long the next receive should wait for data.
+
+        The first data of a response waits for the learned timeout,
+        counted from the last send.  Reads continuing a response which
+        already started wait for the learned gap, counted from the data
+        received last.  Reads after a wait timed out wait for the
+        configured timeout.
+
+        @type	timeout: float
+        @param	timeout: Configured timeout in seconds
+        @rtype: float
+        @return: what is left of the learned timeout if adaptiveTimeout
+                 is set, else timeout
+        """
+        if self.adaptiveTimeout is None:
+            return timeout
+        if self._sentAt is not None:
+            return max(self.adaptiveTimeout.get(self.currentAction) - (time.time() - self._sentAt), 0)
+        if self._receivedAt is not None:
+            return max(self.adaptiveTimeout.get(self.currentAction, True) - (time.time() - self._receivedAt), 0)
+        return timeout
+
+    def recordResponse(self, received=True):
+        """
+        Tell adaptiveTimeout how long after the last send the response
+        started to arrive, or how long after the data before it more of
+        the response arrived.
+
+        @type	received: bool
+        @param	received: False if waiting timed out, later reads wait for
+                          the configured timeout then
+        """
+        now = time.time()
+        if self.adaptiveTimeout is not None:
+            if self._sentAt is not None:
+                if received:
+                    self.adaptiveTimeout.record(self.currentAction, now - self._sentAt)
+            elif self._receivedAt is not None:
+                if received:
+                    self.adaptiveTimeout.record(self.currentAction, now - self._receivedAt, True)
+                else:
+                    self.adaptiveTimeout.miss(self.currentAction)
+        self._sentAt = None
+        self._receivedAt = now if received else None
+
     def call(self, method, args):
         """
         Call a method using arguments.
@@ -6,6 +6,7 @@ import os
 import re
 import sys
 import time
+import glob
 import random
 import atexit
 import logging
@@ -21,6 +22,7 @@ from Peach.Engine.common import *
 from Peach.analyzer import Analyzer
 from Peach.Analyzers import *
 from Peach.agent import Agent
+from Peach.Engine.modelcache import ModelCache
 
 p = os.path.dirname(os.path.abspath(sys.executable))
 sys.path.append(p)
@@ -70,6 +72,10 @@ if __name__ == '__main__':
     parser.add_argument('-range', nargs=2, type=int, metavar='#', help='run range of test cases.')
     parser.add_argument('-test', action='store_true', help='validate pit file.')
     parser.add_argument('-count', action='store_true', help='count test cases for deterministic strategies.')
+    parser.add_argument('-cache', metavar='path', nargs='?', const=ModelCache.defaultDirectory(),
+                        help='cache cracked data models. (default: %(const)s)')
+    parser.add_argument('-cachesize', metavar='MB', default=512, type=int,
+                        help='maximum size of the data model cache. (default: %(default)s)')
     parser.add_argument('-skipto', metavar='#', type=int, help='skip to a test case number.')
     parser.add_argument('-parallel', nargs=2, metavar=('#', '#'), help='use parallelism.')
     parser.add_argument('-agent', nargs=2, metavar=('#', '#'), help='start agent.')
@@ -179,6 +185,12 @@ if __name__ == '__main__':
         logging.info("Done.")
         sys.exit(0)
 
+    if args.cache:
+        if args.cachesize < 1:
+            fatal("Cache size must be 1 MB or larger.")
+        logging.info("Caching cracked data models in '{}'".format(args.cache))
+        Engine.modelCache = ModelCache(args.cache, args.cachesize * 1024 * 1024)
+
     if args.single:
         logging.info("Performing a single iteration.")
         Engine.justOne = True